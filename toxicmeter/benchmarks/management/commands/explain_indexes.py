@@ -0,0 +1,107 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from benchmarks.seed import seed_dataset
+from comments.pagination import _seek
+from comments.models import DeletedComment
+from facebook.models import FacebookComment, FacebookPost
+from ml_integration.models import ToxicityParameters
+
+# Models whose Meta.indexes are dropped for the "before" run
+INDEXED_MODELS = [FacebookPost, FacebookComment, ToxicityParameters, DeletedComment]
+
+
+def hot_queries(admin):
+    """
+    The query shapes of the post, comment and dashboard views, for the posts fetched by `admin`.
+    """
+    posts = FacebookPost.objects.filter(fetched_by=admin)
+    analyzed = FacebookComment.objects.filter(toxicity_parameters__isnull=False, post__in=posts).select_related(
+        'toxicity_parameters', 'post'
+    ).order_by('-toxicity_parameters__predicted_at', '-id')
+    # The cursor of the second page: the last row of the first one
+    cursor = analyzed.values_list('toxicity_parameters__predicted_at', 'id')[9:10].first()
+    return [
+        ("Posts list (facebook.views)", posts.order_by('-created_at')[:10]),
+        ("Unanalyzed comments (comments.views)", FacebookComment.objects.filter(
+            toxicity_parameters__isnull=True, post__in=posts
+        ).select_related('post').order_by('-id')[:10]),
+        ("Analyzed comments (comments.views)", analyzed[:10]),
+        ("Analyzed comments, next page (comments.views)", analyzed.filter(
+            _seek(['-toxicity_parameters__predicted_at', '-id'], cursor, forward=True)
+        )[:10] if cursor else analyzed[10:20]),
+        ("Comments flagged as threat (comments.views bulk moderation)", FacebookComment.objects.filter(
+            post__in=posts, toxicity_parameters__threat=True
+        )),
+        ("Deleted comments (comments.views)", DeletedComment.objects.filter(
+            post__in=posts
+        ).order_by('-deleted_at', '-id')[:10]),
+        ("Unanalyzed count (users.views.dashboard)", FacebookComment.objects.filter(
+            post__in=posts, toxicity_parameters__isnull=True
+        ).values('id')),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway test database and prints the plans and timings of the hot "
+        "queries without and with the indexes declared on the models."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=50, help="Posts to seed.")
+        parser.add_argument('--comments-per-post', type=int, default=400, help="Comments to seed per post.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per query; the fastest is reported.")
+
+    def handle(self, *args, **options):
+        # Never touches the configured database: everything runs in a test database
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(
+                f"Seeding {options['posts']} posts x {options['comments_per_post']} comments on {connection.vendor}..."
+            )
+            admin = seed_dataset(options['posts'], options['comments_per_post'])
+
+            self.set_indexes(create=False)
+            before = self.measure(hot_queries(admin), options['repeat'])
+            self.set_indexes(create=True)
+            after = self.measure(hot_queries(admin), options['repeat'])
+
+            for (name, (plan_before, ms_before)), (_, (plan_after, ms_after)) in zip(before, after):
+                self.stdout.write(self.style.MIGRATE_HEADING(f"\n{name}"))
+                self.stdout.write(f"  without indexes: {ms_before:.2f} ms")
+                self.stdout.write(self.indent(plan_before))
+                self.stdout.write(f"  with indexes:    {ms_after:.2f} ms")
+                self.stdout.write(self.indent(plan_after))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def set_indexes(self, create):
+        with connection.schema_editor() as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    if create:
+                        editor.add_index(model, index)
+                    else:
+                        editor.remove_index(model, index)
+        # Refresh planner statistics so both runs see the same data distribution
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+    def measure(self, queries, repeat):
+        results = []
+        for name, queryset in queries:
+            plan = queryset.explain()
+            timings = []
+            for _ in range(max(repeat, 1)):
+                started = time.perf_counter()
+                list(queryset.all())  # .all() skips the result cache of the previous run
+                timings.append((time.perf_counter() - started) * 1000)
+            results.append((name, (plan, min(timings))))
+        return results
+
+    def indent(self, plan):
+        return "\n".join(f"      {line}" for line in plan.splitlines())
@@ -0,0 +1,153 @@
+import json
+import platform
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from benchmarks.scenarios import SCENARIOS, summarize
+from benchmarks.seed import seed_dataset
+from benchmarks.stub_server import StubMLServer
+from ml_integration.backends import INFERENCE_BACKENDS, reset_inference_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway test database, starts a stub ML server and measures bulk analysis, "
+        "the dashboard, the comment lists, search and CSV export. Results can be saved as JSON "
+        "and compared with an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=20, help="Posts to seed.")
+        parser.add_argument('--comments-per-post', type=int, default=500, help="Comments to seed per post.")
+        parser.add_argument('--analyzed', type=float, default=0.5, help="Share of seeded comments already analyzed.")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per scenario.")
+        parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), default=[],
+                            help="Scenario to run. Repeatable; defaults to all of them.")
+        parser.add_argument('--analyze-rows', type=int, default=500, help="Comments analyzed per bulk_analyze run.")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Comments per bulk prediction request. Defaults to ML_BULK_BATCH_SIZE.")
+        parser.add_argument('--backend', choices=list(INFERENCE_BACKENDS), default='http',
+                            help="Inference backend; 'http' uses the stub server.")
+        parser.add_argument('--model-path', default=None, help="Model file for the linear and onnx backends.")
+        parser.add_argument('--latency-ms', type=float, default=5, help="Stub latency per request.")
+        parser.add_argument('--per-item-ms', type=float, default=0.2, help="Stub latency per scored comment.")
+        parser.add_argument('--jitter-ms', type=float, default=2, help="Random extra stub latency per request.")
+        parser.add_argument('--max-batch', type=int, default=None, help="Largest bulk request the stub accepts.")
+        parser.add_argument('--error-rate', type=float, default=0, help="Share of stub predictions that fail.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="Print the change from the results in this JSON file.")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['compare']}: {e}")
+        names = options['scenario'] or list(SCENARIOS)
+        names = [name for name in SCENARIOS if name in names]
+
+        stub = StubMLServer(
+            latency_ms=options['latency_ms'],
+            per_item_ms=options['per_item_ms'],
+            jitter_ms=options['jitter_ms'],
+            max_batch=options['max_batch'],
+            error_rate=options['error_rate'],
+        )
+        # Never touches the configured database: everything runs in a test database
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with stub, override_settings(
+                ML_BACKEND=options['backend'],
+                ML_MODEL_PATH=options['model_path'] or settings.ML_MODEL_PATH,
+                ML_SERVICE_URL=stub.url,
+            ):
+                reset_inference_backend()
+                results = self.run_scenarios(names, stub, options)
+        finally:
+            reset_inference_backend()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.report(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"\nResults written to {options['output']}")
+
+    def run_scenarios(self, names, stub, options):
+        self.stdout.write(
+            f"Seeding {options['posts']} posts x {options['comments_per_post']} comments on {connection.vendor}..."
+        )
+        started = time.perf_counter()
+        admin = seed_dataset(options['posts'], options['comments_per_post'], analyzed=options['analyzed'])
+        seed_seconds = time.perf_counter() - started
+
+        client = Client()
+        client.force_login(admin)
+        context = {
+            'admin': admin,
+            'client': client,
+            'analyze_rows': options['analyze_rows'],
+            'batch_size': options['batch_size'] or settings.ML_BULK_BATCH_SIZE,
+            'errors': [],
+        }
+        scenarios = {}
+        for name in names:
+            self.stdout.write(f"Running {name}...")
+            scenarios[name] = summarize(SCENARIOS[name](context, options['repeat']))
+
+        return {
+            'started_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'backend': options['backend'],
+            },
+            'dataset': {
+                'posts': options['posts'],
+                'comments_per_post': options['comments_per_post'],
+                'analyzed': options['analyzed'],
+                'seed_seconds': round(seed_seconds, 2),
+            },
+            'options': {
+                'repeat': options['repeat'],
+                'analyze_rows': context['analyze_rows'],
+                'batch_size': context['batch_size'],
+            },
+            'stub': {**stub.settings(), **stub.stats()},
+            'errors': context['errors'],
+            'scenarios': scenarios,
+        }
+
+    def report(self, results, baseline):
+        previous = (baseline or {}).get('scenarios', {})
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\n{'scenario':<18}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'rows/s':>12}{'queries':>9}"
+            + (f"{'p50 vs base':>13}" if baseline else "")
+        ))
+        for name, summary in results['scenarios'].items():
+            if not summary['runs']:
+                self.stdout.write(f"{name:<18}{0:>6}  (nothing to run)")
+                continue
+            rows_per_s = f"{summary['rows_per_s']:,.0f}" if summary['rows_per_s'] is not None else "-"
+            line = (
+                f"{name:<18}{summary['runs']:>6}{summary['p50_ms']:>10.2f}{summary['p95_ms']:>10.2f}"
+                f"{rows_per_s:>12}{summary['queries_p50']:>9}"
+            )
+            before = previous.get(name, {}).get('p50_ms')
+            if baseline and before:
+                line += f"{(summary['p50_ms'] - before) / before:>+13.1%}"
+            self.stdout.write(line)
+        for error in results['errors']:
+            self.stdout.write(self.style.WARNING(error))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from benchmarks.stub_server import StubMLServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Serves a stand-in for the Flask ML service with configurable latency, so the app can "
+        "be run and load tested without the real model."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=5000)
+        parser.add_argument('--latency-ms', type=float, default=5, help="Latency per request.")
+        parser.add_argument('--per-item-ms', type=float, default=0.2, help="Latency per scored comment.")
+        parser.add_argument('--jitter-ms', type=float, default=2, help="Random extra latency per request.")
+        parser.add_argument('--max-batch', type=int, default=None, help="Largest bulk request accepted.")
+        parser.add_argument('--error-rate', type=float, default=0, help="Share of predictions that fail with a 503.")
+
+    def handle(self, *args, **options):
+        stub = StubMLServer(
+            host=options['host'],
+            port=options['port'],
+            latency_ms=options['latency_ms'],
+            per_item_ms=options['per_item_ms'],
+            jitter_ms=options['jitter_ms'],
+            max_batch=options['max_batch'],
+            error_rate=options['error_rate'],
+        ).start()
+        self.stdout.write(f"Stub ML service listening on {stub.url} (Ctrl+C to stop)")
+        try:
+            stub.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.stop()
+            self.stdout.write(f"Served {stub.stats()['requests']} requests")
@@ -0,0 +1,183 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from comments.rollups import rebuild_rollups
+from facebook.models import FacebookComment
+from ml_integration.models import ToxicityParameters
+from ml_integration.services import store_bulk_predictions
+
+# functions = measure, summarize, bulk_analyze, dashboard, list_analyzed, list_unanalyzed, list_deleted, search, export_csv
+
+# Search terms cycled by the search scenario; all but the last appear in the seeded comments
+SEARCH_TERMS = ["idiot", "fake news", "thanks", "agree never", "zebra"]
+
+
+def measure(run):
+    """
+    Times one run and counts its database queries.
+
+    Args:
+        run (callable): Does the work and returns the number of rows it handled, or None.
+
+    Returns:
+        dict: {'seconds': float, 'rows': int | None, 'queries': int}
+    """
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        rows = run()
+        seconds = time.perf_counter() - started
+    return {'seconds': seconds, 'rows': rows, 'queries': len(queries)}
+
+
+def summarize(runs):
+    """
+    Reduces the runs of a scenario to latency percentiles, throughput and query counts.
+    """
+    if not runs:
+        return {'runs': 0}
+    ms = np.array([run['seconds'] * 1000 for run in runs])
+    queries = np.array([run['queries'] for run in runs])
+    summary = {
+        'runs': len(runs),
+        'p50_ms': round(float(np.percentile(ms, 50)), 2),
+        'p95_ms': round(float(np.percentile(ms, 95)), 2),
+        'mean_ms': round(float(ms.mean()), 2),
+        'max_ms': round(float(ms.max()), 2),
+        'rows': None,
+        'rows_per_s': None,
+        'queries_p50': int(np.percentile(queries, 50)),
+        'queries_max': int(queries.max()),
+    }
+    if all(run['rows'] is not None for run in runs):
+        summary['rows'] = sum(run['rows'] for run in runs)
+        summary['rows_per_s'] = round(summary['rows'] / (ms.sum() / 1000), 1) if ms.sum() else None
+    return summary
+
+
+def bulk_analyze(context, repeat):
+    """
+    Analyzes the same slice of unanalyzed comments on every run through
+    store_bulk_predictions, with an empty prediction cache, so every comment goes to the
+    inference backend. The predictions are removed again after each run, including those
+    fanned out to near-duplicates outside the slice.
+    """
+    ids = list(
+        FacebookComment.objects.filter(post__fetched_by=context['admin'], toxicity_parameters__isnull=True)
+        .order_by('id').values_list('id', flat=True)[:context['analyze_rows']]
+    )
+    if not ids:
+        return []
+    runs = []
+    failed = 0
+    for _ in range(repeat):
+        caches[settings.ML_PREDICTION_CACHE].clear()
+        summary = {}
+        started = timezone.now()
+
+        def run():
+            summary.update(store_bulk_predictions(ids, batch_size=context['batch_size'], progress=lambda batch: None))
+            return summary['stored']
+
+        runs.append(measure(run))
+        failed += summary['failed']
+        ToxicityParameters.objects.filter(predicted_at__gte=started).delete()
+    if failed:
+        context['errors'].append(f"bulk_analyze: {failed} of {len(ids) * repeat} predictions failed")
+    # Deleting predictions does not move the rollups, so recount them once for the later scenarios
+    rebuild_rollups()
+    return runs
+
+
+def dashboard(context, repeat):
+    """
+    Renders the admin dashboard.
+    """
+    url = reverse('dashboard')
+
+    def run():
+        _get(context, url)
+
+    return [measure(run) for _ in range(repeat)]
+
+
+def _walk_list(context, repeat, url_name):
+    """
+    Requests pages of a comment list, following the Next cursor and starting over at the end.
+    """
+    url = reverse(url_name)
+    state = {'params': {}}
+
+    def run():
+        page = _get(context, url, state['params']).context['page_obj']
+        state['params'] = {'after': page.next_cursor} if page.has_next else {}
+        return len(page)
+
+    return [measure(run) for _ in range(repeat)]
+
+
+def list_analyzed(context, repeat):
+    return _walk_list(context, repeat, 'analyzed_comments')
+
+
+def list_unanalyzed(context, repeat):
+    return _walk_list(context, repeat, 'unanalyzed_comments')
+
+
+def list_deleted(context, repeat):
+    return _walk_list(context, repeat, 'deleted_comments')
+
+
+def search(context, repeat):
+    """
+    Searches the analyzed and unanalyzed comment lists, cycling through SEARCH_TERMS.
+    """
+    urls = [reverse('analyzed_comments'), reverse('unanalyzed_comments')]
+    runs = []
+    for number in range(repeat):
+        url = urls[number % len(urls)]
+        params = {'q': SEARCH_TERMS[number % len(SEARCH_TERMS)]}
+
+        def run():
+            return len(_get(context, url, params).context['page_obj'])
+
+        runs.append(measure(run))
+    return runs
+
+
+def export_csv(context, repeat):
+    """
+    Downloads the full analyzed comments CSV, reading the whole streamed response.
+    """
+    url = reverse('analyzed_comments')
+
+    def run():
+        response = _get(context, url, {'export': 'csv'})
+        return b"".join(response.streaming_content).count(b"\n") - 1  # Minus the header
+
+    return [measure(run) for _ in range(repeat)]
+
+
+def _get(context, url, params=None):
+    response = context['client'].get(url, params or {})
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {url} returned {response.status_code}")
+    return response
+
+
+# Scenarios in the order they run
+SCENARIOS = {
+    'bulk_analyze': bulk_analyze,
+    'dashboard': dashboard,
+    'list_analyzed': list_analyzed,
+    'list_unanalyzed': list_unanalyzed,
+    'list_deleted': list_deleted,
+    'search': search,
+    'export_csv': export_csv,
+}
@@ -0,0 +1,88 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from comments.dedup import assign_clusters
+from comments.models import DeletedComment
+from comments.rollups import rebuild_rollups
+from facebook.models import FacebookComment, FacebookPost
+from ml_integration.models import TOXICITY_LABELS, ToxicityParameters
+
+# functions = seed_dataset
+
+# Share of analyzed comments flagged with each label
+LABEL_RATES = {
+    'toxic': 0.12,
+    'severe_toxic': 0.01,
+    'obscene': 0.06,
+    'threat': 0.005,
+    'insult': 0.07,
+    'identity_hate': 0.01,
+}
+
+WORDS = ["great", "post", "idiot", "news", "thanks", "fake", "love", "stupid", "agree", "never", "page", "nice"]
+
+
+def seed_dataset(posts=50, comments_per_post=400, analyzed=0.8, deleted=0.03, seed=0, chunk_size=2000):
+    """
+    Fills the current database with a synthetic page: one admin, their posts, comments,
+    predictions for a share of the comments and a few deleted comments.
+
+    Args:
+        posts (int): Number of posts.
+        comments_per_post (int): Comments per post.
+        analyzed (float): Share of comments with a ToxicityParameters row.
+        deleted (float): Share of extra comments stored as DeletedComment rows.
+        seed (int): Random seed, so runs are reproducible.
+        chunk_size (int): Rows per bulk insert.
+
+    Returns:
+        User: The admin who fetched the posts.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    admin = User.objects.create_user(f"bench-admin-{seed}", password="bench")
+    admin.userprofile.role = 'admin'
+    admin.userprofile.save()
+
+    post_objs = FacebookPost.objects.bulk_create([
+        FacebookPost(post_id=f"{seed}_{i}", message=f"Post {i}", created_at=now - timedelta(days=posts - i),
+                     fetched_by=admin)
+        for i in range(posts)
+    ], batch_size=chunk_size)
+
+    comments = []
+    for post in post_objs:
+        for j in range(comments_per_post):
+            comments.append(FacebookComment(
+                post=post,
+                comment_id=f"{post.post_id}_{j}",
+                user_name=f"user{rng.randrange(5000)}",
+                content=" ".join(rng.choices(WORDS, k=rng.randint(3, 12))),
+                created_at=post.created_at + timedelta(minutes=j),
+            ))
+    comments = FacebookComment.objects.bulk_create(comments, batch_size=chunk_size)
+    # Synced comments are clustered as they are stored
+    assign_clusters(post.id for post in post_objs)
+
+    ToxicityParameters.objects.bulk_create([
+        ToxicityParameters(comment=comment, **{label: rng.random() < LABEL_RATES[label] for label in TOXICITY_LABELS})
+        for comment in comments if rng.random() < analyzed
+    ], batch_size=chunk_size)
+
+    DeletedComment.objects.bulk_create([
+        DeletedComment(
+            post=rng.choice(post_objs),
+            comment_id=f"{seed}_deleted_{k}",
+            content=" ".join(rng.choices(WORDS, k=6)),
+            user_name=f"user{rng.randrange(5000)}",
+            toxic=True,
+            reason_for_deletion="benchmark",
+        )
+        for k in range(int(len(comments) * deleted))
+    ], batch_size=chunk_size)
+    # Bulk inserts skip the incremental rollup updates, so the dashboard's counts are built here
+    rebuild_rollups(FacebookPost.objects.filter(fetched_by=admin))
+    return admin
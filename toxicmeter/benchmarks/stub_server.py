@@ -0,0 +1,167 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ml_integration.models import TOXICITY_LABELS
+
+# Words that make the stub flag a label, so seeded comments get a realistic mix of labels
+LABEL_WORDS = {
+    'toxic': {'idiot', 'stupid', 'hate', 'kill'},
+    'severe_toxic': {'kill'},
+    'obscene': {'stupid'},
+    'threat': {'kill'},
+    'insult': {'idiot', 'stupid'},
+    'identity_hate': {'hate'},
+}
+
+
+def stub_prediction(text, model_version):
+    """
+    A deterministic fake prediction in the ML service's response shape.
+    """
+    words = set((text or '').lower().split())
+    probabilities = {}
+    for label in TOXICITY_LABELS:
+        hits = len(words & LABEL_WORDS[label])
+        probabilities[label] = round(min(0.05 + 0.45 * hits, 0.99), 2)
+    prediction = {label: score >= 0.5 for label, score in probabilities.items()}
+    prediction['probabilities'] = probabilities
+    prediction['model_version'] = model_version
+    return prediction
+
+
+class StubMLServer:
+    """
+    Stand-in for the Flask ML service, with the same /predict, /predict_bulk and /health
+    endpoints and a configurable cost per request.
+
+    Each request sleeps latency_ms plus per_item_ms for every comment it scores, with up
+    to jitter_ms of random extra delay. Bulk requests larger than max_batch are rejected
+    with a 413, and error_rate of the prediction requests fail with a 503. Requests are
+    served on threads, like a multi-worker deployment.
+
+    Usable as a context manager:
+
+        with StubMLServer(latency_ms=20, per_item_ms=0.5) as stub:
+            ...  # point settings.ML_SERVICE_URL at stub.url
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0, per_item_ms=0, jitter_ms=0,
+                 max_batch=None, error_rate=0, model_version='stub-1', seed=0):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.per_item_ms = per_item_ms
+        self.jitter_ms = jitter_ms
+        self.max_batch = max_batch
+        self.error_rate = error_rate
+        self.model_version = model_version
+        self.requests = 0
+        self.items = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self._server.server_port}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def wait(self):
+        """
+        Blocks until the server is stopped.
+        """
+        self._thread.join()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'items': self.items}
+
+    def settings(self):
+        return {
+            'latency_ms': self.latency_ms,
+            'per_item_ms': self.per_item_ms,
+            'jitter_ms': self.jitter_ms,
+            'max_batch': self.max_batch,
+            'error_rate': self.error_rate,
+        }
+
+    def _cost(self, items):
+        """
+        Counts the request and returns whether it should fail, then waits out its latency.
+        """
+        with self._lock:
+            self.requests += 1
+            self.items += items
+            fail = self._random.random() < self.error_rate
+            jitter = self._random.uniform(0, self.jitter_ms)
+        time.sleep((self.latency_ms + self.per_item_ms * items + jitter) / 1000)
+        return fail
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the Flask service behind a WSGI server
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != '/health':
+                    return self.send_json(404, {'error': 'not found'})
+                self.send_json(200, {'status': 'ok', 'model_version': stub.model_version})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    return self.send_json(400, {'error': 'invalid JSON'})
+
+                if self.path == '/predict':
+                    if stub._cost(1):
+                        return self.send_json(503, {'error': 'stub failure'})
+                    return self.send_json(200, stub_prediction(body.get('text'), stub.model_version))
+                if self.path == '/predict_bulk':
+                    comments = body.get('comments') or []
+                    if stub.max_batch and len(comments) > stub.max_batch:
+                        return self.send_json(413, {'error': f"at most {stub.max_batch} comments per request"})
+                    if stub._cost(len(comments)):
+                        return self.send_json(503, {'error': 'stub failure'})
+                    return self.send_json(200, [
+                        {'comment': text, 'prediction': stub_prediction(text, stub.model_version)}
+                        for text in comments
+                    ])
+                self.send_json(404, {'error': 'not found'})
+
+            def send_json(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
@@ -0,0 +1,172 @@
+import hashlib
+import re
+import unicodedata
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+
+from facebook.models import FacebookComment
+from ml_integration.cache import normalize_text
+
+# functions = canonicalize, simhash, comment_fingerprint, assign_clusters, annotate_cluster_sizes
+
+_URL = re.compile(r'https?://\S+|www\.\S+')
+_TAG = re.compile(r'[@#]\w+')
+_REPEATED = re.compile(r'(.)\1{2,}')
+_WHITESPACE = re.compile(r'\s+')
+# Emoji variation selectors are combining marks (Mn), unlike the emoji themselves (So)
+_VARIATION_SELECTORS = {chr(code) for code in range(0xFE00, 0xFE10)}
+
+# Characters per shingle of the SimHash features
+SHINGLE_SIZE = 4
+
+
+def canonicalize(text):
+    """
+    Reduces a comment to the text that matters for near-duplicate detection: normalized
+    like the prediction cache key, without links, @mentions, #tags, emoji, punctuation and
+    symbols, and with character runs ("sooooo") shortened to two.
+
+    Letters, digits and combining marks are kept, so Devanagari text is unchanged.
+    """
+    text = normalize_text(text)
+    text = _TAG.sub(' ', _URL.sub(' ', text))
+    text = ''.join(
+        ' ' if char in _VARIATION_SELECTORS or unicodedata.category(char)[0] in 'PSZC' else char
+        for char in text
+    )
+    text = _REPEATED.sub(r'\1\1', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def simhash(text):
+    """
+    64-bit SimHash of the character shingles of a text: near-identical texts get
+    fingerprints that differ in only a few bits.
+    """
+    if len(text) <= SHINGLE_SIZE:
+        shingles = Counter([text])
+    else:
+        shingles = Counter(text[start:start + SHINGLE_SIZE] for start in range(len(text) - SHINGLE_SIZE + 1))
+    digests = b''.join(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest() for shingle in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(shingles), 64).astype(np.int64)
+    weights = np.fromiter(shingles.values(), dtype=np.int64, count=len(shingles))
+    votes = weights @ (bits * 2 - 1)  # Each shingle votes +weight for its 1 bits and -weight for its 0 bits
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), 'big')
+
+
+def comment_fingerprint(text):
+    """
+    Returns:
+        tuple: (SimHash of the canonical text, True if the text is long enough to match near-duplicates).
+        Comments with no canonical text, e.g. emoji only, are fingerprinted on their normalized text.
+    """
+    canonical = canonicalize(text) or normalize_text(text)
+    return simhash(canonical), len(canonical) >= settings.COMMENT_DEDUP_MIN_LENGTH
+
+
+class ClusterIndex:
+    """
+    The representative fingerprints of one post's clusters.
+
+    Fingerprints are split into max_distance + 1 bands; two fingerprints within
+    max_distance bits agree on at least one band, so a lookup only compares the
+    fingerprints sharing a band with it.
+    """
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self.buckets = {}
+
+    def _bands(self, fingerprint):
+        mask = (1 << self.band_bits) - 1
+        return [(band, (fingerprint >> (band * self.band_bits)) & mask) for band in range(self.bands)]
+
+    def add(self, fingerprint):
+        for band in self._bands(fingerprint):
+            self.buckets.setdefault(band, []).append(fingerprint)
+
+    def find(self, fingerprint, max_distance=None):
+        """
+        Returns the closest representative within max_distance bits, or None.
+        """
+        max_distance = self.max_distance if max_distance is None else max_distance
+        best, best_distance = None, max_distance + 1
+        for band in self._bands(fingerprint):
+            for candidate in self.buckets.get(band, ()):
+                distance = (candidate ^ fingerprint).bit_count()
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+        return best
+
+
+def assign_clusters(post_ids, rebuild=False, chunk_size=2000):
+    """
+    Gives the comments of the posts that have none a near-duplicate cluster key.
+
+    A comment joins the cluster of its post whose representative fingerprint is within
+    settings.COMMENT_DEDUP_MAX_DISTANCE bits of its own (an exact match for texts shorter
+    than COMMENT_DEDUP_MIN_LENGTH); otherwise it starts a new cluster as its representative.
+    The cluster key is the representative's fingerprint in hex.
+
+    Args:
+        post_ids (iterable): Database IDs of the posts.
+        rebuild (bool): Recluster every comment of the posts, e.g. after changing the settings.
+        chunk_size (int): Comments read and updated per query.
+
+    Returns:
+        int: Number of comments given a key.
+    """
+    assigned = 0
+    for post_id in set(post_ids):
+        comments = FacebookComment.objects.filter(post_id=post_id)
+        if rebuild:
+            comments.update(cluster_key='')
+        index = ClusterIndex(settings.COMMENT_DEDUP_MAX_DISTANCE)
+        for key in comments.exclude(cluster_key='').values_list('cluster_key', flat=True).distinct():
+            index.add(int(key, 16))
+
+        pending = comments.filter(cluster_key='').order_by('id').only('id', 'content').iterator(chunk_size=chunk_size)
+        changed = []
+        for comment in pending:
+            fingerprint, fuzzy = comment_fingerprint(comment.content)
+            representative = index.find(fingerprint, None if fuzzy else 0)
+            if representative is None:
+                index.add(fingerprint)
+                representative = fingerprint
+            comment.cluster_key = f"{representative:016x}"
+            changed.append(comment)
+            if len(changed) == chunk_size:
+                FacebookComment.objects.bulk_update(changed, ['cluster_key'])
+                assigned += len(changed)
+                changed = []
+        FacebookComment.objects.bulk_update(changed, ['cluster_key'])
+        assigned += len(changed)
+    return assigned
+
+
+def annotate_cluster_sizes(comments):
+    """
+    Sets `cluster_size` on each comment of a page: the number of comments of its post in
+    its cluster, itself included. One query for the whole page.
+    """
+    comments = list(comments)
+    keys = {(comment.post_id, comment.cluster_key) for comment in comments if comment.cluster_key}
+    sizes = {}
+    if keys:
+        rows = (
+            FacebookComment.objects.filter(
+                post_id__in={post_id for post_id, key in keys},
+                cluster_key__in={key for post_id, key in keys},
+            )
+            .values('post_id', 'cluster_key')
+            .annotate(size=Count('id'))
+        )
+        sizes = {(row['post_id'], row['cluster_key']): row['size'] for row in rows}
+    for comment in comments:
+        comment.cluster_size = sizes.get((comment.post_id, comment.cluster_key), 1)
+    return comments
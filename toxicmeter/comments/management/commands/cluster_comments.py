@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from comments.dedup import assign_clusters
+from facebook.models import FacebookComment, FacebookPost
+
+
+class Command(BaseCommand):
+    help = "Groups the comments of each post into near-duplicate clusters (comments.dedup)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--post', help="Only cluster the comments of this Facebook post ID.")
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Recluster every comment instead of only those without a cluster, "
+                                 "e.g. after changing COMMENT_DEDUP_MAX_DISTANCE.")
+
+    def handle(self, *args, **options):
+        posts = FacebookPost.objects.all()
+        if options['post']:
+            posts = posts.filter(post_id=options['post'])
+            if not posts.exists():
+                raise CommandError(f"Post {options['post']} does not exist.")
+        if not options['rebuild']:
+            posts = posts.filter(comments__cluster_key='').distinct()
+
+        post_ids = list(posts.values_list('id', flat=True))
+        assigned = assign_clusters(post_ids, rebuild=options['rebuild'])
+
+        clusters = list(
+            FacebookComment.objects.filter(post_id__in=post_ids).exclude(cluster_key='')
+            .values('post_id', 'cluster_key').annotate(size=Count('id')).filter(size__gt=1)
+        )
+        grouped = sum(cluster['size'] for cluster in clusters)
+        self.stdout.write(self.style.SUCCESS(
+            f"Clustered {assigned} comments of {len(post_ids)} posts; "
+            f"{grouped} comments of these posts are in {len(clusters)} clusters of near-duplicates."
+        ))
@@ -0,0 +1,37 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from comments.rollups import rebuild_rollups
+from comments.services import scan_toxicity_label_counts, toxicity_label_counts
+from facebook.models import FacebookPost
+
+
+class Command(BaseCommand):
+    help = "Recomputes the ToxicityRollup table from the comment tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--admin', help="Only rebuild rollups for posts fetched by this admin username.")
+        parser.add_argument('--check', action='store_true',
+                            help="Compare the rollups with a full scan instead of rebuilding them.")
+
+    def handle(self, *args, **options):
+        posts = FacebookPost.objects.all()
+        if options['admin']:
+            try:
+                posts = posts.filter(fetched_by=User.objects.get(username=options['admin']))
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['admin']} does not exist.")
+
+        if options['check']:
+            rollup = toxicity_label_counts(posts)
+            scan = scan_toxicity_label_counts(posts)
+            drift = {key: (rollup[key], scan[key]) for key in scan if rollup[key] != scan[key]}
+            if drift:
+                for key, (from_rollup, from_scan) in drift.items():
+                    self.stdout.write(f"  {key}: rollup {from_rollup}, scan {from_scan}")
+                raise CommandError("Rollups are out of date; run rebuild_rollups.")
+            self.stdout.write(self.style.SUCCESS("Rollups match the comment tables."))
+            return
+
+        rows = rebuild_rollups(posts if options['admin'] else None)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup rows."))
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comments", "0005_moderation_rules"),
+        ("facebook", "0006_facebookpost_comments_synced_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ToxicityRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("total", models.IntegerField(default=0)),
+                ("deleted", models.IntegerField(default=0)),
+                ("toxic", models.IntegerField(default=0)),
+                ("severe_toxic", models.IntegerField(default=0)),
+                ("obscene", models.IntegerField(default=0)),
+                ("threat", models.IntegerField(default=0)),
+                ("insult", models.IntegerField(default=0)),
+                ("identity_hate", models.IntegerField(default=0)),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="toxicity_rollups",
+                        to="facebook.facebookpost",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("post", "day"), name="unique_rollup_post_day"
+                    )
+                ],
+            },
+        ),
+    ]
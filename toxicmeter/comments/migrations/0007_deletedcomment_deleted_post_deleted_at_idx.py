@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comments", "0006_toxicityrollup"),
+        ("facebook", "0007_facebookcomment_fbcomment_post_id_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="deletedcomment",
+            index=models.Index(
+                fields=["post", "-deleted_at"], name="deleted_post_deleted_at_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+from comments.search import install_search_indexes, uninstall_search_indexes
+
+
+def install(apps, schema_editor):
+    install_search_indexes(apps, schema_editor, rebuild=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comments", "0007_deletedcomment_deleted_post_deleted_at_idx"),
+        ("facebook", "0007_facebookcomment_fbcomment_post_id_idx_and_more"),
+    ]
+
+    operations = [
+        # FTS5 tables and triggers on SQLite, GIN indexes on PostgreSQL, nothing elsewhere
+        migrations.RunPython(install, uninstall_search_indexes),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comments", "0008_search_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deletedcomment",
+            name="identity_hate_score",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="deletedcomment",
+            name="insult_score",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="deletedcomment",
+            name="model_version",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="deletedcomment",
+            name="obscene_score",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="deletedcomment",
+            name="severe_toxic_score",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="deletedcomment",
+            name="threat_score",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="deletedcomment",
+            name="toxic_score",
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+from comments.rollups import rebuild_rollups
+
+
+def rebuild(apps, schema_editor):
+    rebuild_rollups(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comments", "0009_deletedcomment_identity_hate_score_and_more"),
+        ("ml_integration", "0005_toxicityparameters_manually_tagged"),
+    ]
+
+    operations = [
+        # Fills the rollups of comments stored before 0006 created the table
+        migrations.RunPython(rebuild, migrations.RunPython.noop),
+    ]
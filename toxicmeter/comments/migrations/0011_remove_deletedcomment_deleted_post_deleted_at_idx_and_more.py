@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comments", "0010_rebuild_toxicity_rollups"),
+        ("facebook", "0009_remove_facebookcomment_fbcomment_post_id_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="deletedcomment",
+            name="deleted_post_deleted_at_idx",
+        ),
+        migrations.AddIndex(
+            model_name="deletedcomment",
+            index=models.Index(
+                fields=["-deleted_at", "-id"], name="deleted_deleted_at_idx"
+            ),
+        ),
+    ]
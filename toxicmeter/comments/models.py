@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
-from facebook.models import FacebookPost
+from django.core.exceptions import ValidationError
+from facebook.models import FacebookComment, FacebookPost
+from ml_integration.models import TOXICITY_LABELS
 # Create your models here.
 class DeletedComment(models.Model):
     post = models.ForeignKey(FacebookPost, on_delete=models.CASCADE, related_name='deleted_comments', null=True, blank=True)
@@ -13,9 +15,24 @@ class DeletedComment(models.Model):
     threat = models.BooleanField(default=False)
     insult = models.BooleanField(default=False)
     identity_hate = models.BooleanField(default=False)
+    # Label probabilities and model version copied from the comment's prediction
+    toxic_score = models.FloatField(null=True, blank=True)
+    severe_toxic_score = models.FloatField(null=True, blank=True)
+    obscene_score = models.FloatField(null=True, blank=True)
+    threat_score = models.FloatField(null=True, blank=True)
+    insult_score = models.FloatField(null=True, blank=True)
+    identity_hate_score = models.FloatField(null=True, blank=True)
+    model_version = models.CharField(max_length=64, blank=True, default='')
     deleted_at = models.DateTimeField(auto_now_add=True)  # Date and time when the comment was deleted
     reason_for_deletion = models.TextField(blank=True, null=True)  # Reason for deletion (optional)
 
+    class Meta:
+        indexes = [
+            # Deleted comments list: walked most recent first and filtered by post, so a page
+            # needs no sort; a (post, deleted_at) index cannot order rows across several posts
+            models.Index(fields=['-deleted_at', '-id'], name='deleted_deleted_at_idx'),
+        ]
+
     def __str__(self):
         return f"Deleted Comment ID: {self.comment_id} - Toxicity: {self.toxic}"
 
@@ -37,4 +54,92 @@ class CommentStats(models.Model):
     last_updated = models.DateTimeField(auto_now=True)  # Automatically track the last update
 
     def __str__(self):
-        return f"Moderator Stats for {self.moderator.username}"
\ No newline at end of file
+        return f"Moderator Stats for {self.moderator.username}"
+
+# Actions an auto-moderation rule can take
+RULE_ACTIONS = [
+    ('hide', 'Hide'),
+    ('delete', 'Delete'),
+]
+
+RULE_MATCHES = [
+    ('any', 'Any label (OR)'),
+    ('all', 'All labels (AND)'),
+]
+
+class ModerationRule(models.Model):
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="moderation_rules")  # Admin whose posts the rule applies to
+    name = models.CharField(max_length=255)
+    labels = models.JSONField(default=list)  # Toxicity labels the rule looks at, e.g. ["threat", "severe_toxic"]
+    match = models.CharField(max_length=3, choices=RULE_MATCHES, default='any')
+    action = models.CharField(max_length=10, choices=RULE_ACTIONS, default='hide')
+    reason = models.TextField(blank=True, null=True)  # Reason for deletion stored with deleted comments
+    priority = models.PositiveIntegerField(default=0)  # Lower runs first; the first matching rule wins
+    enabled = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['priority', 'id']
+
+    def clean(self):
+        unknown = [label for label in self.labels if label not in TOXICITY_LABELS]
+        if not self.labels or unknown:
+            raise ValidationError({'labels': f"Choose one or more of: {', '.join(TOXICITY_LABELS)}"})
+
+    def __str__(self):
+        joiner = " OR " if self.match == 'any' else " AND "
+        return f"{self.name}: {joiner.join(self.labels)} → {self.action}"
+
+# Moderation actions queued by rules, executed in Graph API batches by the analysis worker
+MODERATION_STATUSES = [
+    ('queued', 'Queued'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+]
+
+class PendingModeration(models.Model):
+    comment = models.ForeignKey(FacebookComment, on_delete=models.CASCADE, related_name="pending_moderation")
+    rule = models.ForeignKey(ModerationRule, on_delete=models.SET_NULL, null=True, blank=True)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="pending_moderation")  # Admin whose token is used
+    action = models.CharField(max_length=10, choices=RULE_ACTIONS)
+    reason = models.TextField(blank=True, null=True)
+    status = models.CharField(max_length=10, choices=MODERATION_STATUSES, default='queued')
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # A comment is only queued for one automatic action at a time
+            models.UniqueConstraint(
+                fields=['comment'],
+                condition=models.Q(status='queued'),
+                name='unique_queued_moderation',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.action} Comment ID: {self.comment_id} ({self.status})"
+
+# Pre-aggregated comment and label counts per post and day, maintained by comments.rollups.
+# Live analyzed comments are counted on the day they were predicted, deleted comments on the
+# day they were deleted. Rebuild from scratch with manage.py rebuild_rollups.
+class ToxicityRollup(models.Model):
+    post = models.ForeignKey(FacebookPost, on_delete=models.CASCADE, related_name='toxicity_rollups')
+    day = models.DateField()
+    total = models.IntegerField(default=0)  # Analyzed live comments plus deleted comments
+    deleted = models.IntegerField(default=0)  # Deleted comments
+    toxic = models.IntegerField(default=0)
+    severe_toxic = models.IntegerField(default=0)
+    obscene = models.IntegerField(default=0)
+    threat = models.IntegerField(default=0)
+    insult = models.IntegerField(default=0)
+    identity_hate = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'day'], name='unique_rollup_post_day'),
+        ]
+
+    def __str__(self):
+        return f"Rollup for Post {self.post_id} on {self.day}: {self.total} comments"
@@ -0,0 +1,164 @@
+import base64
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+# functions = paginate_by_cursor, approximate_count
+
+
+class CursorPage:
+    """
+    One page of keyset-paginated results, with opaque cursors for the neighbouring pages.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count  # Approximate total, or None when counting is disabled
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _encode_cursor(values):
+    # Full isoformat: DjangoJSONEncoder would drop the microseconds the seek depends on
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def _key_field(model, key):
+    """
+    Returns the model field an ordering key refers to, following relations such as
+    'toxicity_parameters__predicted_at'.
+    """
+    *relations, name = key.lstrip('-').split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def _decode_cursor(cursor, fields):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(fields):
+            return None
+        # A cursor is user input: values of the wrong type must not reach the query
+        values = [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValidationError, ValueError, TypeError):
+        return None
+    return None if None in values else values
+
+
+def _key_value(obj, field):
+    for name in field.split('__'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _seek(keys, values, forward):
+    """
+    Builds the filter for rows strictly after (or before) `values` in the `keys` ordering.
+    """
+    condition = Q()
+    for index, key in enumerate(keys):
+        field = key.lstrip('-')
+        descending = key.startswith('-')
+        lookup = 'lt' if descending == forward else 'gt'
+        prefix = {keys[i].lstrip('-'): values[i] for i in range(index)}
+        condition |= Q(**prefix, **{f"{field}__{lookup}": values[index]})
+    # Implied by the condition, but unlike an OR it gives the planner an index range on the first key
+    lookup = 'lte' if keys[0].startswith('-') == forward else 'gte'
+    return Q(**{f"{keys[0].lstrip('-')}__{lookup}": values[0]}) & condition
+
+
+def paginate_by_cursor(queryset, keys, params, per_page=10):
+    """
+    Paginates a queryset with a keyset (seek) cursor instead of OFFSET, so every page,
+    however deep, costs the same index range scan as the first one.
+
+    Args:
+        queryset (QuerySet): The rows to paginate; its own ordering is replaced by `keys`.
+        keys (list): Ordering fields ending in a unique one, e.g. ['-deleted_at', '-id'].
+        params (QueryDict): Request parameters carrying the `after` or `before` cursor.
+        per_page (int): Rows per page.
+
+    Returns:
+        CursorPage: The requested page. An invalid or tampered cursor returns the first page.
+    """
+    fields = [key.lstrip('-') for key in keys]
+    key_fields = [_key_field(queryset.model, key) for key in keys]
+    after = _decode_cursor(params.get('after', ''), key_fields)
+    before = None if after else _decode_cursor(params.get('before', ''), key_fields)
+    count = approximate_count(queryset)
+
+    if before:
+        # Walk backwards from the cursor, then restore the display order
+        reverse_keys = [key[1:] if key.startswith('-') else f"-{key}" for key in keys]
+        rows = list(queryset.filter(_seek(keys, before, forward=False)).order_by(*reverse_keys)[:per_page + 1])
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        if after:
+            queryset = queryset.filter(_seek(keys, after, forward=True))
+        rows = list(queryset.order_by(*keys)[:per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = after is not None
+
+    if not rows:
+        return CursorPage(rows, count=count)
+    first = [_key_value(rows[0], field) for field in fields]
+    last = [_key_value(rows[-1], field) for field in fields]
+    return CursorPage(
+        rows,
+        next_cursor=_encode_cursor(last) if has_next else None,
+        previous_cursor=_encode_cursor(first) if has_previous else None,
+        count=count,
+    )
+
+
+def approximate_count(queryset):
+    """
+    Returns an approximate row count for a queryset, or None if counting is disabled.
+
+    On PostgreSQL this is the planner's row estimate, which costs no scan at all. Other
+    databases run an exact COUNT(*) whose result is cached for COMMENTS_COUNT_CACHE_TTL
+    seconds, so paging through a list counts it at most once per TTL.
+    """
+    ttl = settings.COMMENTS_COUNT_CACHE_TTL
+    if not ttl:
+        return None
+    connection = connections[queryset.db]
+    sql, query_params = queryset.order_by().values('pk').query.sql_with_params()
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", query_params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']['Plan Rows']
+
+    key = "row_count:" + hashlib.sha256(f"{sql}|{query_params!r}".encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.order_by().count()
+        cache.set(key, count, timeout=ttl)
+    return count
@@ -0,0 +1,167 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from facebook.models import FacebookComment
+from ml_integration.models import TOXICITY_LABELS, ToxicityParameters
+from .models import DeletedComment, ToxicityRollup
+
+# functions = bump_rollups, prediction_deltas, label_change_deltas, deletion_deltas, rebuild_rollups, rollup_label_counts
+
+ROLLUP_FIELDS = ['total', 'deleted'] + TOXICITY_LABELS
+
+
+def _labels(source):
+    get = source.get if isinstance(source, dict) else lambda label: getattr(source, label)
+    return Counter({label: 1 for label in TOXICITY_LABELS if get(label)})
+
+
+def bump_rollups(deltas):
+    """
+    Applies count deltas to ToxicityRollup rows with F() increments, creating missing rows.
+
+    Args:
+        deltas (dict): (post_id, day) -> Counter of ROLLUP_FIELDS deltas.
+    """
+    for (post_id, day), delta in deltas.items():
+        changes = {field: F(field) + delta[field] for field in ROLLUP_FIELDS if delta.get(field)}
+        if not changes:
+            continue
+        rows = ToxicityRollup.objects.filter(post_id=post_id, day=day)
+        if rows.update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                ToxicityRollup.objects.create(
+                    post_id=post_id, day=day, **{field: delta[field] for field in ROLLUP_FIELDS if delta.get(field)}
+                )
+        except IntegrityError:
+            # Another writer created the row first
+            rows.update(**changes)
+
+
+def prediction_deltas(predictions, previous, post_ids):
+    """
+    Rollup deltas for a batch of stored predictions.
+
+    Args:
+        predictions (dict): comment_id -> new labels (dict or ToxicityParameters).
+        previous (dict): comment_id -> (predicted_at, old labels dict) for comments that already had a prediction.
+        post_ids (dict): comment_id -> post_id.
+    """
+    today = timezone.localdate()
+    deltas = {}
+    for comment_id, prediction in predictions.items():
+        post_id = post_ids.get(comment_id)
+        if post_id is None:
+            continue
+        new = _labels(prediction)
+        if comment_id in previous:
+            predicted_at, old = previous[comment_id]
+            key = (post_id, timezone.localdate(predicted_at))
+            delta = Counter(new)
+            delta.subtract(_labels(old))
+        else:
+            key = (post_id, today)
+            delta = new + Counter(total=1)
+        deltas.setdefault(key, Counter()).update(delta)
+    return deltas
+
+
+def label_change_deltas(toxicity_params, old_labels):
+    """
+    Rollup deltas for a manual label edit of one ToxicityParameters row.
+    """
+    delta = Counter(_labels(toxicity_params))
+    delta.subtract(_labels(old_labels))
+    key = (toxicity_params.comment.post_id, timezone.localdate(toxicity_params.predicted_at))
+    return {key: delta}
+
+
+def deletion_deltas(comments):
+    """
+    Rollup deltas for comments being archived and deleted: they move from their
+    prediction day to today's deleted counts.
+
+    Args:
+        comments (list): FacebookComment objects, with toxicity_parameters selected.
+    """
+    today = timezone.localdate()
+    deltas = {}
+    for comment in comments:
+        try:
+            params = comment.toxicity_parameters
+        except ToxicityParameters.DoesNotExist:
+            params = None
+        labels = _labels(params) if params else Counter()
+        if params:
+            removed = deltas.setdefault((comment.post_id, timezone.localdate(params.predicted_at)), Counter())
+            removed.subtract(labels + Counter(total=1))
+        deltas.setdefault((comment.post_id, today), Counter()).update(labels + Counter(total=1, deleted=1))
+    return deltas
+
+
+def rebuild_rollups(posts=None, apps=None):
+    """
+    Recomputes ToxicityRollup rows from ToxicityParameters and DeletedComment.
+
+    Args:
+        posts (QuerySet): Limit the rebuild to these posts; all posts by default.
+        apps (Apps): A migration's historical models to use instead of the current ones.
+
+    Returns:
+        int: Number of rollup rows written.
+    """
+    if apps is None:
+        rollup_model, params_model, deleted_model = ToxicityRollup, ToxicityParameters, DeletedComment
+    else:
+        rollup_model = apps.get_model('comments', 'ToxicityRollup')
+        params_model = apps.get_model('ml_integration', 'ToxicityParameters')
+        deleted_model = apps.get_model('comments', 'DeletedComment')
+    label_counts = {label: Count('id', filter=Q(**{label: True})) for label in TOXICITY_LABELS}
+    live = params_model.objects.annotate(day=TruncDate('predicted_at'), post_id=F('comment__post_id'))
+    deleted = deleted_model.objects.filter(post__isnull=False).annotate(day=TruncDate('deleted_at'))
+    rollups = rollup_model.objects.all()
+    if posts is not None:
+        live = live.filter(comment__post__in=posts)
+        deleted = deleted.filter(post__in=posts)
+        rollups = rollups.filter(post__in=posts)
+
+    rows = {}
+    for row in live.values('post_id', 'day').annotate(total=Count('id'), **label_counts).order_by():
+        rows[(row['post_id'], row['day'])] = Counter({field: row.get(field, 0) for field in ROLLUP_FIELDS})
+    for row in deleted.values('post_id', 'day').annotate(total=Count('id'), deleted=Count('id'), **label_counts).order_by():
+        rows.setdefault((row['post_id'], row['day']), Counter()).update(
+            {field: row[field] for field in ROLLUP_FIELDS}
+        )
+
+    with transaction.atomic():
+        rollups.delete()
+        rollup_model.objects.bulk_create(
+            [
+                rollup_model(post_id=post_id, day=day, **{field: counts[field] for field in ROLLUP_FIELDS})
+                for (post_id, day), counts in rows.items()
+            ],
+            batch_size=1000,
+        )
+    return len(rows)
+
+
+def rollup_label_counts(posts):
+    """
+    Reads comment and label counts for the given posts from the rollup table.
+
+    Unanalyzed live comments are not part of the rollups, so they are counted directly.
+
+    Returns:
+        dict: 'total', 'deleted' and one count per toxicity label.
+    """
+    sums = ToxicityRollup.objects.filter(post__in=posts).aggregate(
+        **{field: Sum(field) for field in ROLLUP_FIELDS}
+    )
+    counts = {field: sums[field] or 0 for field in ROLLUP_FIELDS}
+    counts['total'] += FacebookComment.objects.filter(post__in=posts, toxicity_parameters__isnull=True).count()
+    return counts
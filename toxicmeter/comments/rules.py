@@ -0,0 +1,155 @@
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from facebook.models import FacebookComment
+from ml_integration.models import TOXICITY_LABELS
+from users.models import UserProfile
+from .models import ModerationRule, PendingModeration
+from .services import moderate_comments
+from .stats import bump_stats
+
+# functions = label_mask, compile_rules, queue_rule_actions, process_pending_moderation
+
+# Bit of each label in a prediction's label mask
+LABEL_BITS = {label: 1 << index for index, label in enumerate(TOXICITY_LABELS)}
+
+# Stats counter credited for each action taken by a rule
+RULE_STATS_FIELDS = {
+    'hide': 'comments_hidden',
+    'delete': 'comments_deleted',
+}
+
+# owner_id -> (rules signature, compiled decision table)
+_compiled = {}
+
+
+def label_mask(prediction):
+    """
+    Packs the boolean labels of a prediction (dict or ToxicityParameters) into an int bitmask.
+    """
+    get = prediction.get if isinstance(prediction, dict) else lambda label: getattr(prediction, label)
+    return sum(bit for label, bit in LABEL_BITS.items() if get(label))
+
+
+def _build_table(rules):
+    """
+    Evaluates the rules against every possible label combination once, so matching a
+    prediction later is a single list lookup on its label mask.
+    """
+    table = [None] * (1 << len(TOXICITY_LABELS))
+    for mask in range(len(table)):
+        for rule in rules:
+            rule_mask = sum(LABEL_BITS[label] for label in rule['labels'] if label in LABEL_BITS)
+            if not rule_mask:
+                continue
+            matched = (mask & rule_mask) == rule_mask if rule['match'] == 'all' else mask & rule_mask
+            if matched:
+                table[mask] = rule
+                break
+    return table
+
+
+def compile_rules(owner_id):
+    """
+    Returns the decision table for an admin's enabled rules, rebuilding it only when the rules changed.
+
+    Returns:
+        list: Indexed by label mask; each entry is the first matching rule (as a dict) or None.
+    """
+    rules = ModerationRule.objects.filter(owner_id=owner_id, enabled=True)
+    signature = tuple(rules.aggregate(count=Count('id'), updated=Max('updated_at')).values())
+    cached = _compiled.get(owner_id)
+    if cached and cached[0] == signature:
+        return cached[1]
+    table = _build_table(list(rules.values('id', 'labels', 'match', 'action', 'reason')))
+    _compiled[owner_id] = (signature, table)
+    return table
+
+
+def queue_rule_actions(predictions):
+    """
+    Evaluates freshly stored predictions against their admin's rules and queues matching actions.
+
+    Args:
+        predictions (list): (comment_id, prediction) pairs, where prediction is a label dict
+            or a ToxicityParameters object.
+
+    Returns:
+        int: Number of actions queued.
+    """
+    masks = {comment_id: label_mask(prediction) for comment_id, prediction in predictions}
+    masks = {comment_id: mask for comment_id, mask in masks.items() if mask}
+    if not masks:
+        return 0
+
+    owners = dict(
+        FacebookComment.objects.filter(id__in=masks, post__fetched_by__isnull=False)
+        .values_list('id', 'post__fetched_by_id')
+    )
+    owners_with_rules = set(
+        ModerationRule.objects.filter(owner_id__in=set(owners.values()), enabled=True)
+        .values_list('owner_id', flat=True)
+    )
+    tables = {owner_id: compile_rules(owner_id) for owner_id in owners_with_rules}
+
+    queued = []
+    for comment_id, owner_id in owners.items():
+        rule = tables[owner_id][masks[comment_id]] if owner_id in tables else None
+        if rule:
+            queued.append(PendingModeration(
+                comment_id=comment_id,
+                rule_id=rule['id'],
+                owner_id=owner_id,
+                action=rule['action'],
+                reason=rule['reason'],
+            ))
+    PendingModeration.objects.bulk_create(queued, ignore_conflicts=True)
+    return len(queued)
+
+
+def process_pending_moderation(limit=500):
+    """
+    Executes queued rule actions, grouped by admin, action and reason so that each group
+    goes out as Graph API batch requests using the admin's access token.
+
+    Returns:
+        int: Number of actions processed.
+    """
+    pending = list(
+        PendingModeration.objects.filter(status='queued')
+        .select_related('comment', 'comment__toxicity_parameters')
+        .order_by('id')[:limit]
+    )
+    groups = {}
+    for item in pending:
+        groups.setdefault((item.owner_id, item.action, item.reason), []).append(item)
+
+    tokens = dict(
+        UserProfile.objects.filter(user_id__in={owner_id for owner_id, action, reason in groups})
+        .values_list('user_id', 'facebook_access_token')
+    )
+    for (owner_id, action, reason), items in groups.items():
+        now = timezone.now()
+        access_token = tokens.get(owner_id)
+        if not access_token:
+            PendingModeration.objects.filter(id__in=[item.id for item in items]).update(
+                status='failed', error="Admin has no Access Token.", processed_at=now
+            )
+            continue
+
+        # Comments that are already hidden need no Graph API call
+        skip = [item for item in items if action == 'hide' and item.comment.is_hidden]
+        todo = [item for item in items if item not in skip]
+        PendingModeration.objects.filter(id__in=[item.id for item in skip]).update(status='done', processed_at=now)
+
+        results = moderate_comments([item.comment for item in todo], action, access_token, reason)
+        done = [item.id for item, result in zip(todo, results) if result['success']]
+        # Deleted comments cascade to their queue entries, so only hides are marked done
+        PendingModeration.objects.filter(id__in=done).update(status='done', processed_at=now)
+        for item, result in zip(todo, results):
+            if not result['success']:
+                PendingModeration.objects.filter(id=item.id).update(
+                    status='failed', error=result['error'], processed_at=now
+                )
+        bump_stats(owner_id, **{RULE_STATS_FIELDS[action]: len(done)})
+    return len(pending)
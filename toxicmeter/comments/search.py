@@ -0,0 +1,184 @@
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# functions = search_queryset, get_search_backend, install_search_indexes, uninstall_search_indexes
+
+# Searchable text fields of each model
+SEARCH_FIELDS = {
+    'facebook.FacebookPost': ['post_id', 'message'],
+    'facebook.FacebookComment': ['content', 'user_name'],
+    'comments.DeletedComment': ['content', 'user_name'],
+}
+
+
+class LikeSearchBackend:
+    """
+    Substring search with icontains. Works on every database but scans the whole table.
+    """
+
+    def filter(self, queryset, fields, query):
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f"{field}__icontains": query})
+        return queryset.filter(condition)
+
+    def install(self, schema_editor, model, fields, rebuild=False):
+        pass
+
+    def uninstall(self, schema_editor, model, fields):
+        pass
+
+
+class SQLiteFTSBackend(LikeSearchBackend):
+    """
+    SQLite FTS5 index per model, using the trigram tokenizer so matches keep the
+    case-insensitive substring semantics of icontains.
+
+    The FTS table stores no text of its own (external content) and is kept in sync with
+    the model's table by insert, update and delete triggers, which also covers bulk
+    writes and queryset updates that never send signals.
+    """
+
+    # Trigram MATCH needs at least three characters; shorter queries fall back to LIKE
+    min_length = 3
+
+    def _names(self, model, fields):
+        table = model._meta.db_table
+        columns = [model._meta.get_field(field).column for field in fields]
+        return table, f"{table}_fts", model._meta.pk.column, columns
+
+    def filter(self, queryset, fields, query):
+        if len(query) < self.min_length:
+            return super().filter(queryset, fields, query)
+        table, fts, pk, columns = self._names(queryset.model, fields)
+        phrase = '"' + query.replace('"', '""') + '"'
+        return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH %s', [phrase]))
+
+    def install(self, schema_editor, model, fields, rebuild=False):
+        table, fts, pk, columns = self._names(model, fields)
+        names = ", ".join(f'"{column}"' for column in columns)
+        new = ", ".join(f'new."{column}"' for column in columns)
+        old = ", ".join(f'old."{column}"' for column in columns)
+        objects = {fts, f"{fts}_ai", f"{fts}_ad", f"{fts}_au"}
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE name IN (%s)" % ", ".join(["%s"] * len(objects)),
+                list(objects),
+            )
+            missing = cursor.fetchone()[0] < len(objects)
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS "{fts}" USING fts5({names}, '
+            f"content='{table}', content_rowid='{pk}', tokenize='trigram')"
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS "{fts}_ai" AFTER INSERT ON "{table}" BEGIN '
+            f'INSERT INTO "{fts}"(rowid, {names}) VALUES (new."{pk}", {new}); END'
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS "{fts}_ad" AFTER DELETE ON "{table}" BEGIN '
+            f'INSERT INTO "{fts}"("{fts}", rowid, {names}) VALUES (\'delete\', old."{pk}", {old}); END'
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS "{fts}_au" AFTER UPDATE OF {names} ON "{table}" BEGIN '
+            f'INSERT INTO "{fts}"("{fts}", rowid, {names}) VALUES (\'delete\', old."{pk}", {old}); '
+            f'INSERT INTO "{fts}"(rowid, {names}) VALUES (new."{pk}", {new}); END'
+        )
+        # Rows written while the triggers were missing are only picked up by a rebuild
+        if rebuild or missing:
+            schema_editor.execute(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')')
+
+    def uninstall(self, schema_editor, model, fields):
+        table, fts, pk, columns = self._names(model, fields)
+        for suffix in ('_ai', '_ad', '_au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS "{fts}{suffix}"')
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{fts}"')
+
+
+class PostgresSearchBackend(LikeSearchBackend):
+    """
+    PostgreSQL full-text search on a SearchVector with a GIN expression index.
+
+    The index and the query compile the same SearchVector expression, which is what lets
+    the planner use the index. Every word of the query is matched as a prefix.
+    """
+
+    def _vector(self, fields):
+        from django.contrib.postgres.search import SearchVector
+
+        return SearchVector(*fields, config='simple')
+
+    def _index(self, model, fields):
+        from django.contrib.postgres.indexes import GinIndex
+
+        return GinIndex(self._vector(fields), name=f"{model._meta.model_name}_search_idx")
+
+    def filter(self, queryset, fields, query):
+        from django.contrib.postgres.search import SearchQuery
+
+        words = re.findall(r'\w+', query)
+        if not words:
+            return super().filter(queryset, fields, query)
+        terms = " & ".join(f"{word}:*" for word in words)
+        return queryset.annotate(search_vector=self._vector(fields)).filter(
+            search_vector=SearchQuery(terms, config='simple', search_type='raw')
+        )
+
+    def install(self, schema_editor, model, fields, rebuild=False):
+        sql = str(self._index(model, fields).create_sql(model, schema_editor))
+        schema_editor.execute(sql.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1))
+
+    def uninstall(self, schema_editor, model, fields):
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{model._meta.model_name}_search_idx"')
+
+
+SEARCH_BACKENDS = {
+    'like': LikeSearchBackend,
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(vendor):
+    """
+    Returns the search backend for a database vendor, or the one forced by settings.SEARCH_BACKEND.
+    """
+    name = settings.SEARCH_BACKEND
+    if name == 'auto':
+        name = vendor if vendor in SEARCH_BACKENDS else 'like'
+    return SEARCH_BACKENDS[name]()
+
+
+def search_queryset(queryset, query):
+    """
+    Filters a FacebookPost, FacebookComment or DeletedComment queryset to rows matching a
+    search query, using the database's search index.
+
+    Args:
+        queryset (QuerySet): The rows to search.
+        query (str): The search text; blank returns the queryset unchanged.
+    """
+    query = (query or '').strip()
+    if not query:
+        return queryset
+    fields = SEARCH_FIELDS[queryset.model._meta.label]
+    backend = get_search_backend(connections[queryset.db].vendor)
+    return backend.filter(queryset, fields, query)
+
+
+def install_search_indexes(apps, schema_editor, rebuild=False):
+    """
+    Creates the search index of every searchable model. Safe to run repeatedly.
+    """
+    backend = SEARCH_BACKENDS.get(schema_editor.connection.vendor, LikeSearchBackend)()
+    for label, fields in SEARCH_FIELDS.items():
+        backend.install(schema_editor, apps.get_model(label), fields, rebuild=rebuild)
+
+
+def uninstall_search_indexes(apps, schema_editor):
+    backend = SEARCH_BACKENDS.get(schema_editor.connection.vendor, LikeSearchBackend)()
+    for label, fields in SEARCH_FIELDS.items():
+        backend.uninstall(schema_editor, apps.get_model(label), fields)
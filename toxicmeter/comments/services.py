@@ -1,5 +1,14 @@
-from facebook.models import FacebookPost
+from django.db import transaction
+from django.db.models import Count, Q
+from facebook.facebook_api import batch_moderate_facebook_comments
+from facebook.models import FacebookComment, FacebookPost
+from ml_integration.models import PREDICTION_FIELDS, TOXICITY_LABELS, ToxicityParameters
 from users.models import UserProfile
+from .models import DeletedComment
+from .rollups import bump_rollups, deletion_deltas, rollup_label_counts
+
+# Moderation actions supported by moderate_comments
+MODERATION_ACTIONS = ['hide', 'unhide', 'delete']
 
 
 def get_user_posts(user):
@@ -18,4 +27,122 @@ def get_user_posts(user):
         # Moderator sees only posts fetched by their assigned admin
         return FacebookPost.objects.filter(fetched_by=user_profile.assigned_by)
 
-    return FacebookPost.objects.none()  # Default: No posts
\ No newline at end of file
+    return FacebookPost.objects.none()  # Default: No posts
+
+
+def toxicity_label_counts(posts):
+    """
+    Counts comments and toxicity labels for the given posts, live and deleted comments together.
+
+    Reads the pre-aggregated ToxicityRollup rows, so the cost grows with the number of
+    posts and days rather than the number of comments.
+
+    Args:
+        posts (QuerySet): The FacebookPost objects to count.
+
+    Returns:
+        dict: 'total', 'non_toxic' and one count per toxicity label.
+    """
+    counts = rollup_label_counts(posts)
+    counts.pop('deleted')
+    counts['non_toxic'] = counts['total'] - counts['toxic']
+    return counts
+
+
+def scan_toxicity_label_counts(posts):
+    """
+    Same as toxicity_label_counts, but computed from the comment tables with one
+    conditional-aggregation query per table. Used to check the rollups.
+    """
+    live = FacebookComment.objects.filter(post__in=posts).aggregate(
+        total=Count('id'),
+        **{label: Count('id', filter=Q(**{f'toxicity_parameters__{label}': True})) for label in TOXICITY_LABELS},
+    )
+    deleted = DeletedComment.objects.filter(post__in=posts).aggregate(
+        total=Count('id'),
+        **{label: Count('id', filter=Q(**{label: True})) for label in TOXICITY_LABELS},
+    )
+    counts = {key: live[key] + deleted[key] for key in live}
+    counts['non_toxic'] = counts['total'] - counts['toxic']
+    return counts
+
+
+def build_chart_data(counts):
+    """
+    Builds the Chart.js payload used by the dashboard from toxicity_label_counts().
+    """
+    return {
+        "labels": ["Non-Toxic", "Toxic"],
+        "data": [counts['non_toxic'], counts['toxic']],
+        "toxicity_labels": ["Toxic", "Severe Toxic", "Obscene", "Threat", "Insult", "Identity Hate"],
+        "toxicity_data": [counts[label] for label in TOXICITY_LABELS],
+    }
+
+
+def archive_comments(comments, reason=None):
+    """
+    Copies comments and their toxicity labels into DeletedComment with one bulk insert
+    and moves them to the deleted counts of the toxicity rollups.
+
+    Args:
+        comments (list): FacebookComment objects, ideally with toxicity_parameters selected.
+        reason (str): Reason for deletion stored on every row.
+    """
+    already_archived = set(
+        DeletedComment.objects.filter(comment_id__in=[c.comment_id for c in comments]).values_list('comment_id', flat=True)
+    )
+    comments = [comment for comment in comments if comment.comment_id not in already_archived]
+    archived = []
+    for comment in comments:
+        try:
+            labels = {field: getattr(comment.toxicity_parameters, field) for field in PREDICTION_FIELDS}
+        except ToxicityParameters.DoesNotExist:
+            # Unanalyzed comments are still archived, without toxicity details
+            labels = {}
+        archived.append(DeletedComment(
+            post_id=comment.post_id,
+            comment_id=comment.comment_id,
+            content=comment.content,
+            user_name=comment.user_name,
+            reason_for_deletion=reason or "Not specified",
+            **labels,
+        ))
+    with transaction.atomic():
+        DeletedComment.objects.bulk_create(archived, ignore_conflicts=True)
+        bump_rollups(deletion_deltas(comments))
+
+
+def moderate_comments(comments, action, access_token, reason=None):
+    """
+    Applies a moderation action to many comments: one Graph API batch request per 50
+    comments, then all local changes (is_hidden, or archive and delete) in one transaction.
+
+    Args:
+        comments (QuerySet | list): The FacebookComment objects to moderate.
+        action (str): One of MODERATION_ACTIONS.
+        access_token (str): The access token of the moderator.
+        reason (str): Reason for deletion, only used by 'delete'.
+
+    Returns:
+        list: A result dict per comment with its id, comment_id, success and error.
+    """
+    if action not in MODERATION_ACTIONS:
+        raise ValueError(f"Unknown moderation action: {action}")
+    comments = list(comments)
+    outcomes = batch_moderate_facebook_comments([c.comment_id for c in comments], action, access_token)
+    succeeded = [comment for comment, (success, error) in zip(comments, outcomes) if success]
+
+    with transaction.atomic():
+        ids = [comment.id for comment in succeeded]
+        if action == 'hide':
+            FacebookComment.objects.filter(id__in=ids).update(is_hidden=True)
+        elif action == 'unhide':
+            FacebookComment.objects.filter(id__in=ids).update(is_hidden=False)
+        elif action == 'delete':
+            archive_comments(succeeded, reason)
+            FacebookComment.objects.filter(id__in=ids).delete()
+
+    return [
+        {'id': comment.id, 'comment_id': comment.comment_id, 'success': success, 'error': error}
+        for comment, (success, error) in zip(comments, outcomes)
+    ]
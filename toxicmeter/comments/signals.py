@@ -0,0 +1,18 @@
+from django.apps import apps
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+from .search import install_search_indexes
+
+# Restore search triggers after every migrate: SQLite rebuilds a table to alter it, which drops its triggers
+@receiver(post_migrate, dispatch_uid='restore_search_indexes')
+def restore_search_indexes(sender, using, **kwargs):
+    if sender.name != 'comments':
+        return
+    connection = connections[using]
+    if ('comments', '0008_search_indexes') not in MigrationRecorder(connection).applied_migrations():
+        return
+    with connection.schema_editor() as schema_editor:
+        install_search_indexes(apps, schema_editor)
@@ -0,0 +1,35 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CommentStats
+
+# functions = bump_stats
+
+
+def bump_stats(user, **increments):
+    """
+    Atomically adds to a moderator's CommentStats counters, creating the row if it is missing.
+
+    Each call is a single UPDATE with F() increments, so concurrent requests and worker
+    threads never overwrite each other's counts and no row is read first.
+
+    Args:
+        user (User | int): The moderator, or their user ID.
+        **increments: Counter name -> amount to add, e.g. comments_deleted=1.
+    """
+    user_id = getattr(user, 'pk', user)
+    increments = {field: amount for field, amount in increments.items() if amount}
+    if not increments:
+        return
+    # update() skips auto_now, so last_updated is set explicitly
+    changes = {field: F(field) + amount for field, amount in increments.items()}
+    rows = CommentStats.objects.filter(moderator_id=user_id)
+    if rows.update(last_updated=timezone.now(), **changes):
+        return
+    try:
+        with transaction.atomic():
+            CommentStats.objects.create(moderator_id=user_id, **increments)
+    except IntegrityError:
+        # Another writer created the row first
+        rows.update(last_updated=timezone.now(), **changes)
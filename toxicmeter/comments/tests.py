@@ -1,3 +1,336 @@
-from django.test import TestCase
+import base64
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from facebook.models import FacebookComment, FacebookPost
+from ml_integration.models import TOXICITY_LABELS
+from ml_integration.services import save_predictions
+from .models import DeletedComment, ModerationRule, PendingModeration, ToxicityRollup
+from .pagination import paginate_by_cursor
+from .rollups import rebuild_rollups
+from .rules import LABEL_BITS, _build_table, compile_rules, label_mask, process_pending_moderation, queue_rule_actions
+from .services import archive_comments, moderate_comments, scan_toxicity_label_counts, toxicity_label_counts
+
+
+def prediction(**labels):
+    return {label: labels.get(label, False) for label in TOXICITY_LABELS}
+
+
+class RollupTests(TestCase):
+    """
+    The dashboard counts read from ToxicityRollup must match a scan of the comment tables
+    after every kind of write that moves them.
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='x')
+        self.admin.userprofile.role = 'admin'
+        self.admin.userprofile.save()
+        self.post = FacebookPost.objects.create(post_id='1_1', message='post', created_at=timezone.now(), fetched_by=self.admin)
+        self.comments = [
+            FacebookComment.objects.create(
+                post=self.post, comment_id=f'1_{i}', user_name=f'user{i}', content=f'comment {i}', created_at=timezone.now(),
+            )
+            for i in range(6)
+        ]
+        self.posts = FacebookPost.objects.filter(fetched_by=self.admin)
+
+    def assertRollupsMatch(self):
+        self.assertEqual(toxicity_label_counts(self.posts), scan_toxicity_label_counts(self.posts))
+
+    def predict_all(self):
+        save_predictions(
+            (comment.id, prediction(toxic=i % 2 == 0, insult=i % 3 == 0)) for i, comment in enumerate(self.comments)
+        )
+
+    def test_predictions(self):
+        self.assertRollupsMatch()
+        self.predict_all()
+        self.assertRollupsMatch()
+        # Re-predicting moves the labels instead of counting the comments again
+        save_predictions((comment.id, prediction(threat=True)) for comment in self.comments[:3])
+        self.assertRollupsMatch()
+        self.assertEqual(toxicity_label_counts(self.posts)['threat'], 3)
+
+    def test_manual_labels(self):
+        self.predict_all()
+        moderator = User.objects.create_user('mod', password='x')
+        self.client.force_login(moderator)
+        self.client.post(reverse('edit_toxicity_labels', args=[self.comments[0].id]), {'obscene': 'on'})
+        self.assertRollupsMatch()
+
+    def test_archive(self):
+        self.predict_all()
+        archive_comments(list(FacebookComment.objects.select_related('toxicity_parameters')[:3]), 'spam')
+        FacebookComment.objects.filter(id__in=[comment.id for comment in self.comments[:3]]).delete()
+        self.assertRollupsMatch()
+        self.assertEqual(toxicity_label_counts(self.posts)['total'], 6)
+
+    @mock.patch('comments.services.batch_moderate_facebook_comments')
+    def test_delete(self, batch_moderate):
+        self.predict_all()
+        batch_moderate.return_value = [(True, None), (False, 'Graph API error'), (True, None)]
+        comments = FacebookComment.objects.select_related('toxicity_parameters').filter(
+            id__in=[comment.id for comment in self.comments[2:5]]
+        ).order_by('id')
+        moderate_comments(comments, 'delete', 'token', 'spam')
+        self.assertRollupsMatch()
+        self.assertEqual(FacebookComment.objects.count(), 4)
+
+    def test_rebuild(self):
+        self.predict_all()
+        archived = list(FacebookComment.objects.select_related('toxicity_parameters')[:2])
+        archive_comments(archived)
+        FacebookComment.objects.filter(id__in=[comment.id for comment in archived]).delete()
+        ToxicityRollup.objects.all().delete()
+        rebuild_rollups()
+        self.assertRollupsMatch()
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='x')
+        self.admin.userprofile.role = 'admin'
+        self.admin.userprofile.save()
+        post = FacebookPost.objects.create(post_id='1_1', message='post', created_at=timezone.now(), fetched_by=self.admin)
+        comments = FacebookComment.objects.bulk_create([
+            FacebookComment(post=post, comment_id=f'1_{i}', user_name=f'user{i}', content=f'comment {i}', created_at=timezone.now())
+            for i in range(25)
+        ])
+        save_predictions((comment.id, prediction(toxic=True)) for comment in comments)
+        # Deleted in the same instant, so the pages are told apart by id alone
+        DeletedComment.objects.bulk_create([
+            DeletedComment(post=post, comment_id=f'1_d{i}', content=f'deleted {i}', user_name=f'user{i}')
+            for i in range(25)
+        ])
+        DeletedComment.objects.update(deleted_at=timezone.now())
+        self.client.force_login(self.admin)
+
+    def test_pages_cover_every_row_once(self):
+        queryset = FacebookComment.objects.all()
+        keys = ['-toxicity_parameters__predicted_at', '-id']
+        seen = []
+        pages = []
+        params = {}
+        while True:
+            page = paginate_by_cursor(queryset, keys, params, per_page=10)
+            pages.append([comment.id for comment in page])
+            seen += pages[-1]
+            if not page.has_next:
+                break
+            params = {'after': page.next_cursor}
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(sorted(seen), sorted(queryset.values_list('id', flat=True)))
+        self.assertEqual(len(seen), len(set(seen)))
+
+        previous = paginate_by_cursor(queryset, keys, {'before': page.previous_cursor}, per_page=10)
+        self.assertEqual([comment.id for comment in previous], pages[1])
+
+    def test_ties_are_paged_by_id(self):
+        queryset = DeletedComment.objects.all()
+        first = paginate_by_cursor(queryset, ['-deleted_at', '-id'], {}, per_page=10)
+        second = paginate_by_cursor(queryset, ['-deleted_at', '-id'], {'after': first.next_cursor}, per_page=10)
+        self.assertEqual([c.id for c in first] + [c.id for c in second], list(queryset.order_by('-id').values_list('id', flat=True)[:20]))
+
+    def test_tampered_cursor_returns_first_page(self):
+        tampered = base64.urlsafe_b64encode(json.dumps(['x', 'y']).encode()).decode()
+        for name in ['analyzed_comments', 'deleted_comments']:
+            first = self.client.get(reverse(name))
+            for params in [{'after': tampered}, {'before': tampered}, {'after': 'not a cursor'}]:
+                response = self.client.get(reverse(name), params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.context['page_obj']), list(first.context['page_obj']))
+
+
+@mock.patch('comments.services.batch_moderate_facebook_comments')
+class BulkModerationTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_user('admin', password='x')
+        admin.userprofile.role = 'admin'
+        admin.userprofile.save()
+        self.moderator = User.objects.create_user('mod', password='x')
+        self.moderator.userprofile.role = 'moderator'
+        self.moderator.userprofile.assigned_by = admin
+        self.moderator.userprofile.facebook_access_token = 'token'
+        self.moderator.userprofile.save()
+        self.posts = [
+            FacebookPost.objects.create(post_id=f'1_{i}', message=f'post {i}', created_at=timezone.now(), fetched_by=admin)
+            for i in range(2)
+        ]
+        for post in self.posts:
+            comments = FacebookComment.objects.bulk_create([
+                FacebookComment(post=post, comment_id=f'{post.post_id}_{i}', user_name='user', content=f'comment {i}', created_at=timezone.now())
+                for i in range(4)
+            ])
+            save_predictions((comment.id, prediction(threat=i % 2 == 0)) for i, comment in enumerate(comments))
+        self.client.force_login(self.moderator)
+
+    def moderate(self, data):
+        return self.client.post(reverse('bulk_moderate_comments'), data)
+
+    def test_hides_flagged_comments_of_one_post(self, batch_moderate):
+        batch_moderate.side_effect = lambda ids, action, token: [(True, None)] * len(ids)
+        response = self.moderate({'action': 'hide', 'label': 'threat', 'post': self.posts[0].id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['succeeded'], 2)
+        hidden = FacebookComment.objects.filter(is_hidden=True)
+        self.assertEqual({comment.post_id for comment in hidden}, {self.posts[0].id})
+        self.assertEqual(hidden.count(), 2)
+
+    def test_form_requires_a_post(self, batch_moderate):
+        response = self.client.get(reverse('analyzed_comments'))
+        self.assertContains(response, '<select name="post" required')
+        self.assertContains(response, f'<option value="{self.posts[1].id}">post 1</option>', html=True)
+
+    def test_label_alone_is_refused(self, batch_moderate):
+        response = self.moderate({'action': 'delete', 'label': 'threat'})
+        self.assertEqual(response.status_code, 400)
+        batch_moderate.assert_not_called()
+        self.assertEqual(FacebookComment.objects.count(), 8)
+
+    def test_ids_must_be_numbers(self, batch_moderate):
+        for data in [{'post': 'abc'}, {'comment_ids[]': ['1', 'x']}, {'post': '1 OR 1=1'}]:
+            response = self.moderate({'action': 'hide', **data})
+            self.assertEqual(response.status_code, 400)
+        batch_moderate.assert_not_called()
+
+    @override_settings(FACEBOOK_BULK_MODERATION_LIMIT=3)
+    def test_size_is_capped(self, batch_moderate):
+        response = self.moderate({'action': 'hide', 'post': self.posts[0].id})
+        self.assertEqual(response.status_code, 400)
+        batch_moderate.assert_not_called()
+        batch_moderate.side_effect = lambda ids, action, token: [(True, None)] * len(ids)
+        response = self.moderate({'action': 'hide', 'post': self.posts[0].id, 'label': 'threat'})
+        self.assertEqual(response.json()['succeeded'], 2)
+
+
+class ModerationRuleTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='x')
+        self.admin.userprofile.role = 'admin'
+        self.admin.userprofile.facebook_access_token = 'token'
+        self.admin.userprofile.save()
+        self.post = FacebookPost.objects.create(post_id='1_1', message='post', created_at=timezone.now(), fetched_by=self.admin)
+        self.comments = FacebookComment.objects.bulk_create([
+            FacebookComment(post=self.post, comment_id=f'1_{i}', user_name='user', content=f'comment {i}', created_at=timezone.now())
+            for i in range(4)
+        ])
+
+    def rule(self, labels, action, match='any', priority=0, reason=None):
+        return ModerationRule.objects.create(
+            owner=self.admin, name=action, labels=labels, match=match, action=action, priority=priority, reason=reason,
+        )
+
+    def test_label_mask(self):
+        self.assertEqual(label_mask(prediction()), 0)
+        self.assertEqual(label_mask(prediction(toxic=True, threat=True)), LABEL_BITS['toxic'] | LABEL_BITS['threat'])
+
+    def test_decision_table(self):
+        rules = [
+            {'id': 1, 'labels': ['threat', 'identity_hate'], 'match': 'all', 'action': 'delete', 'reason': 'hate'},
+            {'id': 2, 'labels': ['threat', 'severe_toxic'], 'match': 'any', 'action': 'hide', 'reason': None},
+            {'id': 3, 'labels': ['insult'], 'match': 'any', 'action': 'delete', 'reason': None},
+            {'id': 4, 'labels': [], 'match': 'any', 'action': 'delete', 'reason': None},
+        ]
+        table = _build_table(rules)
+        self.assertEqual(len(table), 64)
+        for mask, entry in enumerate(table):
+            labels = {label for label, bit in LABEL_BITS.items() if mask & bit}
+            if {'threat', 'identity_hate'} <= labels:
+                expected = 1
+            elif labels & {'threat', 'severe_toxic'}:
+                expected = 2
+            elif 'insult' in labels:
+                expected = 3
+            else:
+                expected = None
+            self.assertEqual(entry and entry['id'], expected, sorted(labels))
+
+    def test_first_rule_by_priority_wins(self):
+        self.rule(['threat'], 'delete', priority=5)
+        self.rule(['threat'], 'hide', priority=1)
+        threat = label_mask(prediction(threat=True))
+        self.assertEqual(compile_rules(self.admin.id)[threat]['action'], 'hide')
+
+    def test_compiled_rules_follow_edits(self):
+        rule = self.rule(['threat'], 'hide')
+        threat = label_mask(prediction(threat=True))
+        table = compile_rules(self.admin.id)
+        self.assertIs(compile_rules(self.admin.id), table)
+        self.assertEqual(table[threat]['action'], 'hide')
+
+        rule.action = 'delete'
+        rule.save()
+        self.assertEqual(compile_rules(self.admin.id)[threat]['action'], 'delete')
+        rule.enabled = False
+        rule.save()
+        self.assertIsNone(compile_rules(self.admin.id)[threat])
+        rule.enabled = True
+        rule.save()
+        other = self.rule(['insult'], 'hide')
+        self.assertIsNotNone(compile_rules(self.admin.id)[label_mask(prediction(insult=True))])
+        other.delete()
+        self.assertIsNone(compile_rules(self.admin.id)[label_mask(prediction(insult=True))])
+        rule.delete()
+        self.assertIsNone(compile_rules(self.admin.id)[threat])
+
+    def test_actions_are_queued_on_label_changes(self):
+        self.rule(['threat'], 'hide')
+        comment = self.comments[0]
+        save_predictions([(comment.id, prediction(threat=True)), (self.comments[1].id, prediction(insult=True))])
+        self.assertEqual(list(PendingModeration.objects.values_list('comment_id', 'action')), [(comment.id, 'hide')])
+
+        PendingModeration.objects.update(status='done')
+        # The same labels again, e.g. after a moderator unhid the comment, queue nothing
+        save_predictions([(comment.id, prediction(threat=True))])
+        self.assertEqual(PendingModeration.objects.count(), 1)
+        save_predictions([(comment.id, prediction(threat=True, toxic=True))])
+        self.assertEqual(PendingModeration.objects.filter(status='queued').count(), 1)
+        # While an action is queued, the comment is not queued twice
+        queue_rule_actions([(comment.id, prediction(threat=True))])
+        self.assertEqual(PendingModeration.objects.filter(status='queued').count(), 1)
+
+    @mock.patch('comments.services.batch_moderate_facebook_comments')
+    def test_process_pending_moderation(self, batch_moderate):
+        self.rule(['threat'], 'hide', priority=0)
+        self.rule(['insult'], 'delete', priority=1, reason='insulting')
+        FacebookComment.objects.filter(id=self.comments[3].id).update(is_hidden=True)
+        save_predictions([
+            (self.comments[0].id, prediction(threat=True)),
+            (self.comments[1].id, prediction(threat=True)),
+            (self.comments[2].id, prediction(insult=True)),
+            (self.comments[3].id, prediction(threat=True)),
+        ])
+        batch_moderate.side_effect = lambda ids, action, token: (
+            [(True, None), (False, 'Graph API error')] if action == 'hide' else [(True, None)] * len(ids)
+        )
+        self.assertEqual(process_pending_moderation(), 4)
+
+        # One batch per action, without the comment that was already hidden
+        calls = {call.args[1]: call.args for call in batch_moderate.call_args_list}
+        self.assertEqual(calls['hide'], (['1_0', '1_1'], 'hide', 'token'))
+        self.assertEqual(calls['delete'], (['1_2'], 'delete', 'token'))
+        self.assertTrue(FacebookComment.objects.get(id=self.comments[0].id).is_hidden)
+        failed = PendingModeration.objects.get(comment_id=self.comments[1].id)
+        self.assertEqual((failed.status, failed.error), ('failed', 'Graph API error'))
+        self.assertEqual(PendingModeration.objects.get(comment_id=self.comments[3].id).status, 'done')
+        self.assertFalse(FacebookComment.objects.filter(id=self.comments[2].id).exists())
+        self.assertEqual(DeletedComment.objects.get(comment_id='1_2').reason_for_deletion, 'insulting')
+        self.assertEqual(self.admin.moderator_stats.comments_hidden, 1)
+        self.assertEqual(self.admin.moderator_stats.comments_deleted, 1)
+        self.assertEqual(process_pending_moderation(), 0)
+
+    @mock.patch('comments.services.batch_moderate_facebook_comments')
+    def test_owner_without_token(self, batch_moderate):
+        self.admin.userprofile.facebook_access_token = ''
+        self.admin.userprofile.save()
+        self.rule(['threat'], 'hide')
+        save_predictions([(self.comments[0].id, prediction(threat=True))])
+        process_pending_moderation()
+        batch_moderate.assert_not_called()
+        self.assertEqual(PendingModeration.objects.get().status, 'failed')
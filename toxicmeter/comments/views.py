@@ -1,18 +1,67 @@
-import csv
-from django.http import HttpResponse
+from collections import Counter
+
+from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from facebook.models import FacebookComment, FacebookPost
-from ml_integration.models import ToxicityParameters
-from .services import get_user_posts
+from ml_integration.models import TOXICITY_LABELS, ToxicityParameters
+from .dedup import annotate_cluster_sizes
+from .exports import EXPORT_FORMATS, stream_export
+from .pagination import paginate_by_cursor
+from .rollups import bump_rollups, label_change_deltas
+from .search import search_queryset
+from .services import MODERATION_ACTIONS, get_user_posts, moderate_comments
 from users.models import UserProfile
-from .models import CommentStats, DeletedComment
-from ml_integration.services import store_bulk_predictions, store_single_prediction
-from facebook.facebook_api import delete_facebook_comment, hide_facebook_comment , unhide_facebook_comment
+from .models import DeletedComment
+from .stats import bump_stats
+from ml_integration.jobs import enqueue_analysis
+from facebook.facebook_api import hide_facebook_comment , unhide_facebook_comment
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db import transaction
+
+
+# Columns of the comment exports: (CSV header, field lookup)
+ANALYZED_EXPORT_COLUMNS = [
+    ('Comment ID', 'comment_id'),
+    ('Post ID', 'post__post_id'),
+    ('User', 'user_name'),
+    ('Content', 'content'),
+] + [
+    (label.replace('_', ' ').title(), f'toxicity_parameters__{label}') for label in TOXICITY_LABELS
+] + [
+    (f"{label.replace('_', ' ').title()} Score", f'toxicity_parameters__{label}_score') for label in TOXICITY_LABELS
+] + [
+    ('Model Version', 'toxicity_parameters__model_version'),
+    ('Hidden', 'is_hidden'),
+    ('Predicted At', 'toxicity_parameters__predicted_at'),
+]
+
+DELETED_EXPORT_COLUMNS = [
+    ('Comment ID', 'comment_id'),
+    ('Content', 'content'),
+] + [
+    (label.replace('_', ' ').title(), label) for label in TOXICITY_LABELS
+] + [
+    (f"{label.replace('_', ' ').title()} Score", f'{label}_score') for label in TOXICITY_LABELS
+] + [
+    ('Model Version', 'model_version'),
+    ('Reason for Deletion', 'reason_for_deletion'),
+    ('Deleted At', 'deleted_at'),
+]
+
+
+def filter_cluster(comments, params):
+    """
+    Restricts a comment list to one near-duplicate cluster, given ?post=<post database ID>&cluster=<key>.
 
+    Returns:
+        tuple: The filtered queryset and the active filter ({'post', 'cluster'}), or None without one.
+    """
+    post, cluster = params.get('post', ''), params.get('cluster', '')
+    if not (post.isdigit() and cluster):
+        return comments, None
+    return comments.filter(post_id=int(post), cluster_key=cluster), {'post': int(post), 'cluster': cluster}
 
 # View for Analyzed Comments
 @login_required
@@ -24,20 +73,32 @@ def analyzed_comments(request):
     comments = FacebookComment.objects.filter(
         toxicity_parameters__isnull=False,
         post__in=user_posts
-    ).select_related('toxicity_parameters', 'post').order_by('-toxicity_parameters__predicted_at')
+    ).select_related('toxicity_parameters', 'post')
 
     search_query = request.GET.get('q')
-    if search_query:
-        comments = comments.filter(Q(content__icontains=search_query) | Q(user_name__icontains=search_query))
-    for c in comments:
+    comments = search_queryset(comments, search_query)
+    comments, cluster_filter = filter_cluster(comments, request.GET)
+
+    # Handle CSV / NDJSON download, streamed in constant memory
+    if request.GET.get('export') in EXPORT_FORMATS:
+        comments = comments.order_by('-toxicity_parameters__predicted_at', '-id')
+        return stream_export(comments, ANALYZED_EXPORT_COLUMNS, 'analyzed_comments', request.GET['export'])
+
+    # Cursor pagination, newest predictions first; display fields only for the visible page
+    page_obj = paginate_by_cursor(
+        comments, ['-toxicity_parameters__predicted_at', '-id'], request.GET, settings.COMMENTS_PER_PAGE
+    )
+    for c in page_obj:
         c.post_id_display = c.post.post_id.split('_')[1]
-
-    # Pagination (10 comments per page)
-    paginator = Paginator(comments, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    return render(request, 'comments/analyzed_comments.html', {'page_obj': page_obj, 'comments': page_obj.object_list,'search_query': search_query})
+    annotate_cluster_sizes(page_obj)
+
+    return render(request, 'comments/analyzed_comments.html', {
+        'page_obj': page_obj,
+        'comments': page_obj.object_list,
+        'search_query': search_query,
+        'cluster_filter': cluster_filter,
+        'posts': user_posts.order_by('-created_at'),  # Bulk moderation acts on one post at a time
+    })
 
 # View for Unanalyzed Comments
 @login_required
@@ -51,61 +112,45 @@ def unanalyzed_comments(request):
         post__in=user_posts
     ).select_related('post')
     search_query = request.GET.get('q')
-    if search_query:
-        comments = comments.filter(Q(content__icontains=search_query) | Q(user_name__icontains=search_query))
-    # Pagination (10 comments per page)
-    paginator = Paginator(comments, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    return render(request, 'comments/unanalyzed_comments.html', {'comments': page_obj,'search_query': search_query})
+    comments = search_queryset(comments, search_query)
+    comments, cluster_filter = filter_cluster(comments, request.GET)
+    # Cursor pagination, newest comments first
+    page_obj = paginate_by_cursor(comments, ['-id'], request.GET, settings.COMMENTS_PER_PAGE)
+    annotate_cluster_sizes(page_obj)
+
+    return render(request, 'comments/unanalyzed_comments.html', {
+        'page_obj': page_obj,
+        'comments': page_obj.object_list,
+        'search_query': search_query,
+        'cluster_filter': cluster_filter,
+    })
 
 # Analyze Comment
 @login_required
 def analyze_comment(request, comment_id):
     """
-    View to analyze a single comment and store toxicity predictions in the database.
+    View to queue a single comment for analysis by the background worker.
     """
-    success = store_single_prediction(comment_id)
-    comment = FacebookComment.objects.get(id=comment_id)
-    if success:
-        try:
-            stats = request.user.moderator_stats  # Assuming a relationship exists for the moderator
-            stats.comments_analyzed += 1  # or len(comment_ids) for bulk actions
-            stats.save()
-        except CommentStats.DoesNotExist:
-            CommentStats.objects.create(moderator=comment.post.moderator, comments_analyzed=1)
-        messages.success(request, "Comment analyzed successfully.")
-        # Redirect back to unanalyzed comments page after analysis
-        return redirect('analyzed_comments')
+    comment = get_object_or_404(FacebookComment, id=comment_id)
+    if enqueue_analysis([comment.id], request.user):
+        messages.success(request, "Comment queued for analysis.")
     else:
-        # Handle the error gracefully (optional)
-        messages.error(request, "Failed to analyze the comment.")
-        return redirect('unanalyzed_comments')
+        messages.info(request, "Comment is already queued for analysis.")
+    return redirect('unanalyzed_comments')
+
 @login_required
 def analyze_bulk_comments(request):
     """
-    View to analyze all unanalyzed comments and store toxicity predictions in the database.
+    View to queue all unanalyzed comments for analysis by the background worker.
     """
-    # Fetch IDs of unanalyzed comments
+    # The IDs stay a subquery; the worker streams the comments to the model in batches
     comment_ids = FacebookComment.objects.filter(toxicity_parameters__isnull=True).values_list('id', flat=True)
-    comment_count = len(list(comment_ids))
-    # Perform bulk prediction and store results
-    success = store_bulk_predictions(comment_ids)
-    if success:
-        try:
-            stats = request.user.moderator_stats
-            stats.comments_analyzed += comment_count
-            stats.save()
-        except CommentStats.DoesNotExist:
-            CommentStats.objects.create(moderator=request.user, comments_analyzed=1)
-        messages.success(request, f"{comment_count} comments analyzed successfully.")
-        # Redirect back to unanalyzed comments page after analysis
-        return redirect('unanalyzed_comments')
+    comment_count = enqueue_analysis(comment_ids, request.user)
+    if comment_count:
+        messages.success(request, f"{comment_count} comments queued for analysis.")
     else:
-        # Handle the error gracefully (optional)
-        messages.error(request, "Failed to analyze comments in bulk.")
-        return redirect('analyzed_comments')
+        messages.info(request, "No new comments to queue for analysis.")
+    return redirect('unanalyzed_comments')
 # Delete Comment
 @login_required
 def delete_comment(request, comment_id):
@@ -131,52 +176,16 @@ def delete_comment(request, comment_id):
         messages.error(request, "You do not have a valid Access Token.")
         return redirect('unanalyzed_comments')
     # Fetch the comment from the database
-    comment = get_object_or_404(FacebookComment, id=comment_id)
-    
-    # Fetch toxicity parameters for the comment (if any)
-    toxicity_parameters = ToxicityParameters.objects.filter(comment=comment).first()
-    
-    # Store the deleted comment with its toxicity parameters
-    if toxicity_parameters:
-        DeletedComment.objects.create(
-            post=comment.post,  # Store the post directly
-            comment_id=comment.comment_id,  # Store the comment_id directly
-            content=comment.content,  # Store the content
-            user_name=comment.user_name,
-            toxic=toxicity_parameters.toxic,
-            severe_toxic=toxicity_parameters.severe_toxic,
-            obscene=toxicity_parameters.obscene,
-            threat=toxicity_parameters.threat,
-            insult=toxicity_parameters.insult,
-            identity_hate=toxicity_parameters.identity_hate,
-            reason_for_deletion=request.POST.get("reason_for_deletion", "Not specified")  # Optional reason
-        )
-    else:
-        # If toxicity parameters are not available, still store the comment (without toxicity details)
-        DeletedComment.objects.create(
-            post=comment.post,  # Store the post directly
-            comment_id=comment.comment_id,  # Store the comment_id directly
-            content=comment.content,  # Store the content
-            user_name=comment.user_name,
-            reason_for_deletion=request.POST.get("reason_for_deletion", "Not specified")
-        )
-
-    # Call the function to delete the comment
-    success = delete_facebook_comment(comment_id, access_token)
-    if success:
-        try:
-            comment.delete()
-            try:
-                stats = request.user.moderator_stats
-                stats.comments_deleted += 1
-                stats.save()
-            except CommentStats.DoesNotExist:
-                CommentStats.objects.create(moderator=request.user, comments_deleted=1)
-            messages.success(request, f"Comment with ID {comment_id} has been deleted from Facebook and the local database!")
-        except FacebookComment.DoesNotExist:
-            messages.warning(request, f"Comment with ID {comment_id} was deleted from Facebook but not found in the local database.")
+    comment = get_object_or_404(FacebookComment.objects.select_related('toxicity_parameters'), id=comment_id)
+
+    # Delete on Facebook, then archive the comment with its toxicity parameters and delete it locally
+    reason = request.POST.get("reason_for_deletion", "Not specified")  # Optional reason
+    result = moderate_comments([comment], 'delete', access_token, reason)[0]
+    if result['success']:
+        bump_stats(request.user, comments_deleted=1)
+        messages.success(request, f"Comment with ID {comment_id} has been deleted from Facebook and the local database!")
     else:
-        messages.error(request, f"Failed to delete comment with ID {comment_id}.")
+        messages.error(request, f"Failed to delete comment with ID {comment_id}: {result['error']}")
     
     return redirect('analyzed_comments')
 
@@ -208,6 +217,7 @@ def hide_comment(request, comment_id):
     success = hide_facebook_comment(comment_id, access_token)
 
     if success:
+        bump_stats(request.user, comments_hidden=1)
         messages.success(request, f"Comment with ID {comment_id} has been successfully hidden on Facebook!")
     else:
         messages.error(request, f"Failed to hide comment with ID {comment_id} on Facebook.")
@@ -242,18 +252,94 @@ def unhide_comment(request, comment_id):
     success = unhide_facebook_comment(comment_id, access_token)
 
     if success:
-        try:
-            stats = request.user.moderator_stats
-            stats.comments_unhidden += 1
-            stats.save()
-        except CommentStats.DoesNotExist:
-            CommentStats.objects.create(moderator=request.user, comments_unhidden=1)
+        bump_stats(request.user, comments_unhidden=1)
         messages.success(request, f"Comment with ID {comment_id} has been successfully unhidden on Facebook!")
     else:
         messages.error(request, f"Failed to unhide comment with ID {comment_id} on Facebook.")
 
     return redirect('analyzed_comments')
 
+# Stats counter credited for each successful bulk moderation action
+MODERATION_STATS_FIELDS = {
+    'hide': 'comments_hidden',
+    'unhide': 'comments_unhidden',
+    'delete': 'comments_deleted',
+}
+
+@login_required
+def bulk_moderate_comments(request):
+    """
+    Hides, unhides or deletes a group of comments at once, e.g. every comment flagged as
+    a threat on one post, using Graph API batch requests. At most
+    settings.FACEBOOK_BULK_MODERATION_LIMIT comments are moderated per request.
+
+    POST parameters:
+        action: 'hide', 'unhide' or 'delete'.
+        comment_ids[]: Database IDs of the comments to moderate, required without post.
+        post: Database ID of the post to restrict the action to, required without comment_ids[].
+        cluster (optional): With post, only moderate this near-duplicate cluster of the post.
+        label (optional): Only moderate comments flagged with this toxicity label.
+        reason_for_deletion (optional): Stored with deleted comments.
+
+    Returns:
+        JsonResponse: Per-comment results and success/failure counts.
+    """
+    if request.method != "POST":
+        return JsonResponse({"message": "Invalid request method."}, status=405)
+    if request.user.userprofile.role != 'moderator':
+        return JsonResponse({"message": "Only Moderators can moderate comments."}, status=403)
+    access_token = request.user.userprofile.facebook_access_token
+    if not access_token:
+        return JsonResponse({"message": "You do not have a valid Access Token."}, status=400)
+
+    action = request.POST.get('action')
+    if action not in MODERATION_ACTIONS:
+        return JsonResponse({"message": f"Unknown action: {action}"}, status=400)
+
+    comment_ids = request.POST.getlist('comment_ids[]')
+    post = request.POST.get('post', '')
+    if not all(comment_id.isdigit() for comment_id in comment_ids) or (post and not post.isdigit()):
+        return JsonResponse({"message": "Comment and post IDs must be numbers."}, status=400)
+    # A label alone would reach every post of the admin, so a post or comments must be chosen
+    if not (comment_ids or post):
+        return JsonResponse({"message": "Select comments or a post to moderate."}, status=400)
+
+    comments = FacebookComment.objects.filter(post__in=get_user_posts(request.user))
+    if comment_ids:
+        comments = comments.filter(id__in=comment_ids)
+    if post:
+        comments = comments.filter(post_id=int(post))
+        if request.POST.get('cluster'):
+            comments = comments.filter(cluster_key=request.POST['cluster'])
+    label = request.POST.get('label')
+    if label:
+        if label not in TOXICITY_LABELS:
+            return JsonResponse({"message": f"Unknown label: {label}"}, status=400)
+        comments = comments.filter(**{f'toxicity_parameters__{label}': True})
+    if action == 'hide':
+        comments = comments.filter(is_hidden=False)
+    elif action == 'unhide':
+        comments = comments.filter(is_hidden=True)
+
+    # The Graph API calls run within the request, so the number of comments is capped
+    limit = settings.FACEBOOK_BULK_MODERATION_LIMIT
+    comments = list(comments.select_related('toxicity_parameters').order_by('id')[:limit + 1])
+    if len(comments) > limit:
+        return JsonResponse({
+            "message": f"More than {limit} comments match; narrow the selection with a label or cluster."
+        }, status=400)
+
+    results = moderate_comments(comments, action, access_token, request.POST.get('reason_for_deletion'))
+    succeeded = sum(1 for result in results if result['success'])
+    bump_stats(request.user, **{MODERATION_STATS_FIELDS[action]: succeeded})
+    return JsonResponse({
+        "action": action,
+        "requested": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results,
+    }, status=200)
+
 @login_required
 def deleted_comments(request):
     """
@@ -276,39 +362,21 @@ def deleted_comments(request):
     else:
         deleted_comments = DeletedComment.objects.none()  # No assigned admin, no deleted comments
     search_query = request.GET.get('q')
-    if search_query:
-        deleted_comments = deleted_comments.filter(Q(content__icontains=search_query) | Q(user_name__icontains=search_query))
-    for c in deleted_comments:
-        c.comment_id_display = c.comment_id.split('_')[1] if '_' in c.comment_id else c.comment_id
+    deleted_comments = search_queryset(deleted_comments, search_query)
 
-    # Handle CSV Download
-    if 'download_csv' in request.GET:
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="deleted_comments.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow([
-            'Comment ID', 'Content', 'Toxic', 'Severe Toxic', 'Obscene', 'Threat', 'Insult', 'Identity Hate', 'Reason for Deletion', 'Deleted At'
-        ])
-
-        for comment in deleted_comments:
-            writer.writerow([
-                comment.comment_id,
-                comment.content,
-                1 if comment.toxic else 0,
-                1 if comment.severe_toxic else 0,
-                1 if comment.obscene else 0,
-                1 if comment.threat else 0,
-                1 if comment.insult else 0,
-                1 if comment.identity_hate else 0,
-                comment.reason_for_deletion,
-                comment.deleted_at
-            ])
-
-        return response
+    # Handle CSV / NDJSON download, streamed in constant memory
+    export_format = request.GET.get('export') or ('csv' if 'download_csv' in request.GET else None)
+    if export_format in EXPORT_FORMATS:
+        return stream_export(deleted_comments, DELETED_EXPORT_COLUMNS, 'deleted_comments', export_format)
+
+    # Cursor pagination, most recent deletions first; display fields only for the visible page
+    page_obj = paginate_by_cursor(deleted_comments, ['-deleted_at', '-id'], request.GET, settings.COMMENTS_PER_PAGE)
+    for c in page_obj:
+        c.comment_id_display = c.comment_id.split('_')[1] if '_' in c.comment_id else c.comment_id
 
     return render(request, 'comments/deleted_comments.html', {
-        'deleted_comments': deleted_comments,
+        'page_obj': page_obj,
+        'deleted_comments': page_obj.object_list,
         'search_query': search_query
     })
 
@@ -316,34 +384,43 @@ def deleted_comments(request):
 def edit_toxicity_labels(request, comment_id):
     """
     Allows moderators to manually edit toxicity labels of a comment via a modal form.
+    With apply_to_cluster, the labels are applied to every analyzed near-duplicate of
+    the comment on its post as well.
     """
     comment = get_object_or_404(FacebookComment, id=comment_id)
 
     if request.method == "POST":
-        toxicity_params = comment.toxicity_parameters
-
-        # Update toxicity labels based on form submission
-        toxicity_params.toxic = 'toxic' in request.POST
-        toxicity_params.severe_toxic = 'severe_toxic' in request.POST
-        toxicity_params.obscene = 'obscene' in request.POST
-        toxicity_params.threat = 'threat' in request.POST
-        toxicity_params.insult = 'insult' in request.POST
-        toxicity_params.identity_hate = 'identity_hate' in request.POST
-
-        # Save updated parameters
-        toxicity_params.save()
-        stats = request.user.moderator_stats
-        stats.comments_manually_tagged += 1
-        stats.save()
-        messages.success(request, f"Manually Tagged Toxicity labels for comment {comment_id}")
+        targets = [comment.toxicity_parameters]
+        if request.POST.get('apply_to_cluster') and comment.cluster_key:
+            targets = list(ToxicityParameters.objects.filter(
+                comment__post_id=comment.post_id, comment__cluster_key=comment.cluster_key
+            ).select_related('comment'))
+
+        deltas = {}
+        for toxicity_params in targets:
+            old_labels = {label: getattr(toxicity_params, label) for label in TOXICITY_LABELS}
+
+            # Update toxicity labels based on form submission
+            for label in TOXICITY_LABELS:
+                setattr(toxicity_params, label, label in request.POST)
+            toxicity_params.manually_tagged = True
+            for key, delta in label_change_deltas(toxicity_params, old_labels).items():
+                deltas.setdefault(key, Counter()).update(delta)
+
+        # Save updated parameters and move the counts in the toxicity rollups
+        with transaction.atomic():
+            ToxicityParameters.objects.bulk_update(targets, TOXICITY_LABELS + ['manually_tagged'])
+            bump_rollups(deltas)
+        bump_stats(request.user, comments_manually_tagged=len(targets))
+        if len(targets) > 1:
+            messages.success(request, f"Manually Tagged Toxicity labels for comment {comment_id} and {len(targets) - 1} similar comments")
+        else:
+            messages.success(request, f"Manually Tagged Toxicity labels for comment {comment_id}")
 
     return redirect('analyzed_comments')
 
 def paginate_comments(request, comments_list):
     """
-    Helper function to paginate the comments queryset.
+    Helper function to paginate a comments queryset by cursor, newest first.
     """
-    paginator = Paginator(comments_list, 10)  # Show 10 comments per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
\ No newline at end of file
+    return paginate_by_cursor(comments_list, ['-id'], request.GET, settings.COMMENTS_PER_PAGE)
@@ -1,103 +1,236 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-from comments.models import CommentStats
+from django.conf import settings
+from django.db import connection
+from comments.dedup import assign_clusters
+from comments.stats import bump_stats
 from users.models import UserProfile
 from .models import FacebookPost, FacebookComment
 from datetime import datetime
 from django.utils.dateparse import parse_datetime
+from .graph import GraphAPIError, RateLimiter, graph_batch, graph_call_count, iter_pages, use_rate_limiter
+
+# Fields requested from the Graph API
+POST_FIELDS = 'id,message,created_time'
+COMMENT_FIELDS = 'id,message,from{name},created_time'
 
-def fetch_facebook_posts(page_id, access_token, request):
+def get_fetched_by(user):
     """
-    Fetch posts from a Facebook Page using Graph API.
-    Fetches only new posts that are not already in the database.
+    Returns the user that fetched posts are assigned to: a moderator's posts belong to their admin.
+    """
+    user_profile = UserProfile.objects.get(user=user)
+    if user_profile.role == 'moderator' and user_profile.assigned_by:
+        return user_profile.assigned_by  # Assign the admin
+    return user
+
+def store_post_page(posts, fetched_by):
+    """
+    Stores one page of Graph API posts with a single bulk insert.
+
+    Returns:
+        int: Number of posts that were not already in the database.
+    """
+    post_ids = [post['id'] for post in posts]
+    existing = set(FacebookPost.objects.filter(post_id__in=post_ids).values_list('post_id', flat=True))
+    new_posts = [
+        FacebookPost(
+            post_id=post['id'],
+            message=post.get('message', '')[:500],
+            created_at=datetime.strptime(post['created_time'], "%Y-%m-%dT%H:%M:%S%z"),
+            fetched_by=fetched_by,
+        )
+        for post in posts
+        if post['id'] not in existing
+    ]
+    FacebookPost.objects.bulk_create(new_posts, ignore_conflicts=True)
+    return len(new_posts)
+
+def sync_page_posts(page_id, access_token, fetched_by):
+    """
+    Fetches every post of a Facebook Page, following pagination cursors, and stores the new ones.
+
+    Returns:
+        int: Number of new posts.
+
+    Raises:
+        GraphAPIError: If a page of posts cannot be fetched.
     """
-    base_url = f"https://graph.facebook.com/v21.0/{page_id}/posts"
-    headers = {
-        'Authorization': f'Bearer {access_token}',  # Bearer token for authentication
-    }
     params = {
-        'fields': 'id,message,created_time',  # Specify fields to fetch
-        'limit': 100,  # Optional: Adjust to control how many posts are fetched per request
+        'fields': POST_FIELDS,
+        'limit': settings.FACEBOOK_POSTS_PAGE_SIZE,
     }
+    counter = 0
+    for posts in iter_pages(f"{page_id}/posts", params, access_token):
+        counter += store_post_page(posts, fetched_by)
+    return counter
 
-    response = requests.get(base_url, headers=headers, params=params)
-    if response.status_code == 200:
-        data = response.json()
-
-        # Get all post IDs currently in the database for this page
-        existing_post_ids = set(FacebookPost.objects.values_list('post_id', flat=True))
-        counter = 0
-        user_profile = UserProfile.objects.get(user=request.user)
-        # If user is a moderator, assign post to their admin instead
-        if user_profile.role == 'moderator' and user_profile.assigned_by:
-            fetched_by = user_profile.assigned_by  # Assign the admin
-        else:
-            fetched_by = request.user
-        # Iterate through the posts returned by the API
-        for post in data.get('data', []):
-            if post['id'] not in existing_post_ids:  # Check if post is already in the database
-                counter += 1
-                FacebookPost.objects.create(
-                    post_id=post['id'],
-                    message=post.get('message', ''),
-                    created_at=datetime.strptime(post['created_time'], "%Y-%m-%dT%H:%M:%S%z"),
-                    fetched_by=fetched_by
-                )
-        try:
-            stats = request.user.moderator_stats  # Assuming moderator_stats exists for the moderator
-            stats.posts_fetched += counter
-            stats.save()
-        except CommentStats.DoesNotExist:
-            CommentStats.objects.create(moderator=request.user, posts_fetched=counter)
-        return True
-    else:
-        print(f"Failed to fetch posts: {response.status_code} - {response.text}")
+def fetch_facebook_posts(page_id, access_token, user):
+    """
+    Fetch posts from a Facebook Page using Graph API.
+    Fetches only new posts that are not already in the database.
+    """
+    try:
+        counter = sync_page_posts(page_id, access_token, get_fetched_by(user))
+    except GraphAPIError as e:
+        print(f"Failed to fetch posts: {e}")
         return False
+    bump_stats(user, posts_fetched=counter)
+    return True
 
-def fetch_facebook_comments(post_id, access_token, request):
-    # API call to fetch comments for the given post
-    url = f"https://graph.facebook.com/v21.0/{post_id}/comments"
+def store_comment_page(post, comments):
+    """
+    Stores one page of Graph API comments for a post with a single bulk insert.
+
+    Args:
+        post (FacebookPost): The post the comments belong to.
+        comments (list): Comment dicts from the Graph API.
+
+    Returns:
+        int: Number of comments that were not already in the database.
+    """
+    comment_ids = [str(comment['id']) for comment in comments]  # Ensure it's treated as a string
+    existing = set(FacebookComment.objects.filter(comment_id__in=comment_ids).values_list('comment_id', flat=True))
+    new_comments = [
+        FacebookComment(
+            post=post,
+            comment_id=comment_id,
+            user_name=comment.get('from', {}).get('name', 'Unknown'),
+            content=comment.get('message', ''),
+            created_at=parse_datetime(comment['created_time']),
+        )
+        for comment_id, comment in zip(comment_ids, comments)
+        if comment_id not in existing
+    ]
+    # ignore_conflicts covers comments inserted concurrently by another fetch
+    FacebookComment.objects.bulk_create(new_comments, ignore_conflicts=True)
+    return len(new_comments)
+
+def sync_post_comments(post, access_token):
+    """
+    Fetches new comments of a post from the Graph API and stores each page with one bulk insert.
+
+    Comments are requested newest first and only after the post's high-water mark
+    (comments_synced_at), and paging stops at the first page that reaches comments
+    older than the mark, so a re-sync costs work proportional to the new comments.
+    Pages are only prefetched on a first sync, which never stops early.
+    The mark only advances when every page was fetched. New comments are then grouped
+    with their near-duplicates (comments.dedup).
+
+    Returns:
+        tuple: (number of new comments, True if all pages were fetched).
+    """
+    synced_at = post.comments_synced_at
     params = {
-        'access_token': access_token,
+        'fields': COMMENT_FIELDS,
+        'limit': settings.FACEBOOK_COMMENTS_PAGE_SIZE,
+        'order': 'reverse_chronological',
     }
-    response = requests.get(url, params=params)
-    data = response.json()
-    moderator = request.user
-    # Error handling for API response
-    if 'error' in data:
-        print(f"Error fetching comments: {data['error']['message']}")
-        return False
+    if synced_at:
+        params['since'] = int(synced_at.timestamp())
+
     new_comments_count = 0
-    # Iterate over and save comments
-    for comment in data.get('data', []):
-        comment_id = str(comment['id'])  # Ensure it's treated as a string
-        content = comment.get('message', '')
-        user_name = comment.get('from', {}).get('name', 'Unknown')
-        created_at = parse_datetime(comment['created_time'])
-
-        # Ensure post ID is treated as a string
-        try:
-            post = FacebookPost.objects.get(post_id=str(post_id))
-            # Ensure no duplicate comments are saved
-            comment_obj, created = FacebookComment.objects.get_or_create(
-                comment_id=comment_id,
-                defaults={
-                    'post': post,
-                    'user_name': user_name,
-                    'content': content,
-                    'created_at': created_at,
-                },
-            )
-            if created:
-                new_comments_count += 1
-        except FacebookPost.DoesNotExist:
-            print(f"Post with ID {post_id} does not exist in the database.")
+    newest = synced_at
+    success = True
     try:
-        stats = moderator.moderator_stats  # Assuming moderator_stats exists for the moderator
-        stats.comments_fetched += new_comments_count
-        stats.save()
-    except CommentStats.DoesNotExist:
-        CommentStats.objects.create(moderator=moderator, comments_fetched=new_comments_count)
-    return True
+        for comments in iter_pages(f"{post.post_id}/comments", params, access_token, prefetch=not synced_at):
+            new_comments_count += store_comment_page(post, comments)
+            created = [parse_datetime(comment['created_time']) for comment in comments]
+            if created and (newest is None or max(created) > newest):
+                newest = max(created)
+            # Everything at or before the mark was stored by an earlier complete sync
+            if synced_at and any(created_at <= synced_at for created_at in created):
+                break
+    except GraphAPIError as e:
+        # Pages stored before the error are kept; the mark stays put so the gap is refetched
+        print(f"Error fetching comments for post {post.post_id}: {e}")
+        success = False
+    if success and newest != synced_at:
+        FacebookPost.objects.filter(id=post.id).update(comments_synced_at=newest)
+    if new_comments_count and settings.COMMENT_DEDUP_ENABLED:
+        assign_clusters([post.id])
+    return new_comments_count, success
+
+def fetch_facebook_comments(post_id, access_token, user):
+    """
+    Fetches new comments for a single post and credits them to the user's stats.
+
+    Returns:
+        bool: True if all pages were fetched, False otherwise.
+    """
+    # Ensure post ID is treated as a string
+    try:
+        post = FacebookPost.objects.get(post_id=str(post_id))
+    except FacebookPost.DoesNotExist:
+        print(f"Post with ID {post_id} does not exist in the database.")
+        return False
+
+    new_comments_count, success = sync_post_comments(post, access_token)
+    bump_stats(user, comments_fetched=new_comments_count)
+    return success
+
+def sync_page(user, page_id, access_token, workers=None, progress=None, calls_per_minute=None):
+    """
+    Crawls a whole Facebook Page: fetches all of its posts, then the new comments of
+    every post using a bounded pool of worker threads.
+
+    Graph API calls are throttled by the shared rate budget (FACEBOOK_GRAPH_CALLS_PER_MINUTE),
+    or by a budget of their own when calls_per_minute is given.
+
+    Args:
+        user (User): The user running the sync; posts are assigned as in fetch_facebook_posts.
+        page_id (str): The Facebook Page ID.
+        access_token (str): The page access token.
+        workers (int): Number of posts whose comments are fetched at a time.
+        progress (callable): Optional callback receiving (post, new comments, success) per post.
+        calls_per_minute (int): Graph API calls per minute for this crawl, 0 disables throttling.
+
+    Returns:
+        dict: Throughput stats for the crawl.
+    """
+    workers = workers or settings.FACEBOOK_SYNC_WORKERS
+    limiter = RateLimiter(calls_per_minute) if calls_per_minute is not None else None
+    started = time.monotonic()
+    calls_before = graph_call_count()
+
+    def sync_one(post):
+        try:
+            return post, *sync_post_comments(post, access_token)
+        finally:
+            # Worker threads open their own database connections
+            connection.close()
+
+    new_comments = 0
+    failed_posts = 0
+    with use_rate_limiter(limiter):
+        new_posts = sync_page_posts(page_id, access_token, get_fetched_by(user))
+        posts = list(FacebookPost.objects.filter(post_id__startswith=f"{page_id}_"))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Each post runs in a copy of this context, so its calls use the crawl's limiter
+            futures = [executor.submit(contextvars.copy_context().run, sync_one, post) for post in posts]
+            for future in futures:
+                post, count, success = future.result()
+                new_comments += count
+                failed_posts += not success
+                if progress:
+                    progress(post, count, success)
+
+    bump_stats(user, posts_fetched=new_posts, comments_fetched=new_comments)
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    return {
+        'posts': len(posts),
+        'new_posts': new_posts,
+        'new_comments': new_comments,
+        'failed_posts': failed_posts,
+        'api_calls': graph_call_count() - calls_before,
+        'elapsed': elapsed,
+        'posts_per_second': len(posts) / elapsed,
+        'comments_per_second': new_comments / elapsed,
+    }
 
 def delete_facebook_comment(comment_id, access_token):
     """
@@ -186,3 +319,27 @@ def unhide_facebook_comment(comment_id, access_token):
     except requests.RequestException as e:
         print(f"Error while unhiding comment: {e}")
         return False
+
+# Graph API batch operation for each moderation action
+MODERATION_OPERATIONS = {
+    'hide': lambda fb_cmt_id: {'method': 'POST', 'relative_url': fb_cmt_id, 'body': 'is_hidden=true'},
+    'unhide': lambda fb_cmt_id: {'method': 'POST', 'relative_url': fb_cmt_id, 'body': 'is_hidden=false'},
+    'delete': lambda fb_cmt_id: {'method': 'DELETE', 'relative_url': fb_cmt_id},
+}
+
+def batch_moderate_facebook_comments(fb_comment_ids, action, access_token):
+    """
+    Hides, unhides or deletes many comments on Facebook through Graph API batch requests.
+
+    Only the Facebook side is changed; callers apply the matching local changes.
+
+    Args:
+        fb_comment_ids (list): Facebook comment IDs.
+        action (str): One of 'hide', 'unhide' or 'delete'.
+        access_token (str): The access token of the moderator.
+
+    Returns:
+        list: One (success, error message) tuple per comment, in order.
+    """
+    operations = [MODERATION_OPERATIONS[action](fb_cmt_id) for fb_cmt_id in fb_comment_ids]
+    return graph_batch(operations, access_token)
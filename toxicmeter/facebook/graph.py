@@ -0,0 +1,250 @@
+import contextvars
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from profiling.recorder import track_http
+
+# functions = use_rate_limiter, graph_get, graph_batch, iter_pages, graph_call_count
+
+
+class GraphAPIError(Exception):
+    """
+    Raised when the Graph API returns an error payload or cannot be reached.
+    """
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread of the process that calls the Graph API.
+
+    Allows `calls_per_minute` calls on average with bursts of at most one second's worth.
+    Defaults to settings.FACEBOOK_GRAPH_CALLS_PER_MINUTE; 0 lets every call through.
+    """
+
+    def __init__(self, calls_per_minute=None):
+        if calls_per_minute is None:
+            calls_per_minute = settings.FACEBOOK_GRAPH_CALLS_PER_MINUTE
+        self.rate = calls_per_minute / 60.0
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a call may be made.
+        """
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_session = None
+_session_lock = threading.Lock()
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+_calls = 0
+_calls_lock = threading.Lock()
+# Limiter replacing the process-wide budget in the current context, see use_rate_limiter
+_context_limiter = contextvars.ContextVar('graph_rate_limiter', default=None)
+
+
+@contextmanager
+def use_rate_limiter(limiter):
+    """
+    Throttles the Graph API calls made in the current context with `limiter` instead of
+    the process-wide budget. Threads that run in a copy of the context, like the page
+    prefetch of iter_pages, share it. None keeps the process-wide budget.
+    """
+    token = _context_limiter.set(limiter)
+    try:
+        yield limiter
+    finally:
+        _context_limiter.reset(token)
+
+
+def _throttle():
+    """
+    Waits for the rate budget (FACEBOOK_GRAPH_CALLS_PER_MINUTE, 0 disables it) and counts the call.
+    """
+    global _rate_limiter, _calls
+    limiter = _context_limiter.get()
+    if limiter is None:
+        calls_per_minute = settings.FACEBOOK_GRAPH_CALLS_PER_MINUTE
+        with _rate_limiter_lock:
+            if _rate_limiter is None or _rate_limiter.rate != calls_per_minute / 60.0:
+                _rate_limiter = RateLimiter(calls_per_minute)
+            limiter = _rate_limiter
+    limiter.acquire()
+    with _calls_lock:
+        _calls += 1
+
+
+def graph_call_count():
+    """
+    Returns the number of Graph API calls made by this process so far.
+    """
+    return _calls
+
+
+def get_session():
+    """
+    Returns the process-wide keep-alive session used for Graph API calls.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=settings.FACEBOOK_GRAPH_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def graph_get(path, params, access_token):
+    """
+    Makes a GET request to the Graph API.
+
+    Args:
+        path (str): Path relative to the Graph API version root, e.g. "<post_id>/comments".
+        params (dict): Query parameters.
+        access_token (str): The access token for the request.
+
+    Returns:
+        dict: The decoded JSON response.
+
+    Raises:
+        GraphAPIError: If the request fails or the response contains an error.
+    """
+    url = f"{settings.FACEBOOK_GRAPH_API_URL}/{path}"
+    _throttle()
+    try:
+        with track_http('graph'):
+            response = get_session().get(
+                url,
+                params={**params, 'access_token': access_token},
+                timeout=settings.FACEBOOK_GRAPH_TIMEOUT,
+            )
+            data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        raise GraphAPIError(str(e)) from e
+    if 'error' in data:
+        raise GraphAPIError(data['error'].get('message', 'Unknown error'))
+    return data
+
+
+# The Graph API accepts at most this many operations per batch request
+BATCH_LIMIT = 50
+
+
+def graph_batch(operations, access_token):
+    """
+    Sends operations through the Graph API batch endpoint, up to 50 per HTTP request.
+
+    Args:
+        operations (list): Batch operation dicts, e.g. {'method': 'DELETE', 'relative_url': '<id>'}.
+        access_token (str): The access token for the request.
+
+    Returns:
+        list: One (success, error message) tuple per operation, in order. A failed HTTP
+        request marks every operation of its chunk as failed.
+    """
+    results = []
+    url = f"{settings.FACEBOOK_GRAPH_API_URL}/"
+    for start in range(0, len(operations), BATCH_LIMIT):
+        chunk = operations[start:start + BATCH_LIMIT]
+        _throttle()
+        try:
+            with track_http('graph'):
+                response = get_session().post(
+                    url,
+                    data={'batch': json.dumps(chunk), 'include_headers': 'false', 'access_token': access_token},
+                    timeout=settings.FACEBOOK_GRAPH_TIMEOUT,
+                )
+                data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            results.extend((False, str(e)) for _ in chunk)
+            continue
+        if isinstance(data, dict) and 'error' in data:
+            message = data['error'].get('message', 'Unknown error')
+            results.extend((False, message) for _ in chunk)
+            continue
+        data = list(data) + [None] * (len(chunk) - len(data))
+        for item in data[:len(chunk)]:
+            # Operations the Graph API did not get to come back as null
+            if item is None:
+                results.append((False, "No response for this operation."))
+                continue
+            try:
+                body = json.loads(item.get('body') or '{}')
+            except ValueError:
+                body = {}
+            if item.get('code') == 200 and not body.get('error'):
+                results.append((True, None))
+            else:
+                results.append((False, body.get('error', {}).get('message', 'Unknown error')))
+    return results
+
+
+def _next_cursor(data):
+    if 'next' not in data.get('paging', {}):
+        return None
+    return data['paging'].get('cursors', {}).get('after')
+
+
+def iter_pages(path, params, access_token, prefetch=True):
+    """
+    Yields the `data` list of every page of a Graph API edge, following paging.cursors.after.
+
+    Cursor pages must be requested one after another, so with `prefetch` the next page is
+    fetched on a background thread while the caller is still processing the current one.
+    Callers that may stop early should turn it off: a prefetch already sent when they stop
+    is a wasted Graph API call.
+
+    Raises:
+        GraphAPIError: If any page fails to load.
+    """
+    if not prefetch:
+        while True:
+            data = graph_get(path, params, access_token)
+            yield data.get('data', [])
+            after = _next_cursor(data)
+            if not after:
+                return
+            params = {**params, 'after': after}
+
+    # Prefetches run in a copy of the caller's context, so they count towards its request profile
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(contextvars.copy_context().run, graph_get, path, params, access_token)
+        try:
+            while pending is not None:
+                data = pending.result()
+                after = _next_cursor(data)
+                pending = None
+                if after:
+                    pending = executor.submit(
+                        contextvars.copy_context().run, graph_get, path, {**params, 'after': after}, access_token
+                    )
+                yield data.get('data', [])
+        finally:
+            # The caller stopped early; drop the prefetch if it has not started yet
+            if pending is not None:
+                pending.cancel()
@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from facebook.facebook_api import sync_page
+from facebook.graph import GraphAPIError
+
+
+class Command(BaseCommand):
+    help = "Crawls all posts of a Facebook Page and fetches their new comments with a bounded worker pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help="User the sync runs as; their Page ID and Access Token are used.")
+        parser.add_argument('--page-id', help="Page to crawl instead of the user's configured Page ID.")
+        parser.add_argument('--workers', type=int, help="Number of posts whose comments are fetched at a time.")
+        parser.add_argument('--calls-per-minute', type=int,
+                            help="Graph API rate budget for this run (0 disables throttling).")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist.")
+        profile = user.userprofile
+        page_id = options['page_id'] or profile.facebook_page_id
+        access_token = profile.facebook_access_token
+        if not access_token or not page_id:
+            raise CommandError(f"{user.username} does not have a valid Access Token or Page ID assigned.")
+
+        def progress(post, count, success):
+            status = "ok" if success else "failed"
+            self.stdout.write(f"  {post.post_id}: {count} new comments ({status})")
+
+        self.stdout.write(f"Syncing page {page_id} as {user.username}...")
+        try:
+            result = sync_page(
+                user, page_id, access_token,
+                workers=options['workers'], progress=progress, calls_per_minute=options['calls_per_minute'],
+            )
+        except GraphAPIError as e:
+            raise CommandError(f"Failed to fetch posts: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {result['posts']} posts ({result['new_posts']} new) and {result['new_comments']} new comments "
+            f"in {result['elapsed']:.1f}s with {result['api_calls']} API calls."
+        ))
+        self.stdout.write(
+            f"Throughput: {result['posts_per_second']:.2f} posts/s, {result['comments_per_second']:.1f} comments/s"
+        )
+        if result['failed_posts']:
+            self.stdout.write(self.style.WARNING(f"{result['failed_posts']} posts failed and will be retried next sync."))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("facebook", "0005_remove_facebookpost_last_fetched_time_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="facebookpost",
+            name="comments_synced_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("facebook", "0006_facebookpost_comments_synced_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="facebookcomment",
+            index=models.Index(fields=["post", "-id"], name="fbcomment_post_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="facebookpost",
+            index=models.Index(
+                fields=["fetched_by", "-created_at"],
+                name="fbpost_fetched_by_created_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("facebook", "0007_facebookcomment_fbcomment_post_id_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="facebookcomment",
+            name="cluster_key",
+            field=models.CharField(blank=True, default="", max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name="facebookcomment",
+            index=models.Index(
+                fields=["post", "cluster_key"], name="fbcomment_post_cluster_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("facebook", "0008_facebookcomment_cluster_key"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="facebookcomment",
+            name="fbcomment_post_id_idx",
+        ),
+        migrations.AlterField(
+            model_name="facebookpost",
+            name="fetched_by",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="fetched_posts",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
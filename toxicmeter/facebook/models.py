@@ -6,7 +6,15 @@ class FacebookPost(models.Model):
     message = models.CharField(max_length=500, blank=True, null=True)  # Post content or title
     created_at = models.DateTimeField()  # Original creation time on Facebook
     fetched_at = models.DateTimeField(auto_now_add=True)  # When fetched
-    fetched_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='fetched_posts',null=True,blank=True)  # User who fetched the post
+    fetched_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='fetched_posts',null=True,blank=True, db_index=False)  # User who fetched the post; indexed by fbpost_fetched_by_created_idx
+    comments_synced_at = models.DateTimeField(null=True, blank=True)  # Newest comment time covered by a complete sync
+
+    class Meta:
+        indexes = [
+            # Post lists: a user's fetched posts, newest first
+            models.Index(fields=['fetched_by', '-created_at'], name='fbpost_fetched_by_created_idx'),
+        ]
+
     def __str__(self):
         return f"Post ID: {self.post_id} - {self.message[:30]}"
 
@@ -19,5 +27,13 @@ class FacebookComment(models.Model):
     created_at = models.DateTimeField()  # Original creation time
     fetched_at = models.DateTimeField(auto_now_add=True)  # When fetched
     is_hidden = models.BooleanField(default=False)  # Whether the comment is hidden by the user
+    cluster_key = models.CharField(max_length=16, blank=True, default='')  # Near-duplicate cluster within the post (comments.dedup)
+
+    class Meta:
+        indexes = [
+            # Near-duplicate clusters: the members of a cluster of a post
+            models.Index(fields=['post', 'cluster_key'], name='fbcomment_post_cluster_idx'),
+        ]
+
     def __str__(self):
         return f"Comment by {self.user_name} on Post {self.post.post_id}"
@@ -1,3 +1,123 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .facebook_api import sync_post_comments
+from .graph import GraphAPIError, iter_pages
+from .models import FacebookComment, FacebookPost
+
+
+class FakeGraph:
+    """
+    Serves a post's comments newest first in pages of params['limit'], records every call,
+    and fails the calls listed in `fail`.
+    """
+
+    def __init__(self):
+        self.comments = []
+        self.calls = []
+        self.fail = set()
+        self.started = timezone.now().replace(microsecond=0) - timedelta(days=1)
+
+    def add(self, count):
+        for _ in range(count):
+            created = self.started + timedelta(minutes=len(self.comments))
+            self.comments.insert(0, {
+                'id': f'1_{len(self.comments)}',
+                'message': f'comment {len(self.comments)}',
+                'from': {'name': 'someone'},
+                'created_time': created.isoformat(),
+            })
+
+    def get(self, path, params, access_token):
+        self.calls.append(params.get('after'))
+        if len(self.calls) in self.fail:
+            raise GraphAPIError("Service temporarily unavailable")
+        start = int(params.get('after') or 0)
+        end = start + params['limit']
+        page = {'data': self.comments[start:end]}
+        if end < len(self.comments):
+            page['paging'] = {'cursors': {'after': str(end)}, 'next': 'https://graph.facebook.com/next'}
+        return page
+
+
+@override_settings(FACEBOOK_COMMENTS_PAGE_SIZE=3)
+class SyncPostCommentsTests(TestCase):
+    def setUp(self):
+        self.graph = FakeGraph()
+        patcher = mock.patch('facebook.graph.graph_get', side_effect=self.graph.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        user = User.objects.create_user('admin', password='x')
+        self.post = FacebookPost.objects.create(post_id='1', message='post', created_at=timezone.now(), fetched_by=user)
+
+    def sync(self):
+        self.graph.calls = []
+        result = sync_post_comments(self.post, 'token')
+        self.post.refresh_from_db()
+        return result
+
+    def newest(self):
+        return self.graph.started + timedelta(minutes=len(self.graph.comments) - 1)
+
+    def test_first_sync_fetches_every_page(self):
+        self.graph.add(7)
+        self.assertEqual(self.sync(), (7, True))
+        self.assertEqual(self.graph.calls, [None, '3', '6'])
+        self.assertEqual(FacebookComment.objects.filter(post=self.post).count(), 7)
+        self.assertEqual(self.post.comments_synced_at, self.newest())
+
+    def test_resync_stops_at_the_mark(self):
+        self.graph.add(7)
+        self.sync()
+        self.graph.add(2)
+        # The first page reaches the mark, so the second one is never requested
+        self.assertEqual(self.sync(), (2, True))
+        self.assertEqual(self.graph.calls, [None])
+        self.assertEqual(self.post.comments_synced_at, self.newest())
+
+        self.assertEqual(self.sync(), (0, True))
+        self.assertEqual(self.graph.calls, [None])
+
+    def test_resync_reads_on_until_the_mark(self):
+        self.graph.add(2)
+        self.sync()
+        self.graph.add(5)
+        self.assertEqual(self.sync(), (5, True))
+        self.assertEqual(self.graph.calls, [None, '3'])
+        self.assertEqual(FacebookComment.objects.filter(post=self.post).count(), 7)
+
+    def test_mark_only_advances_on_success(self):
+        self.graph.add(2)
+        self.sync()
+        synced_at = self.post.comments_synced_at
+        self.graph.add(5)
+        self.graph.fail = {2}
+        # The stored page is kept, but the mark stays put so the gap is refetched
+        self.assertEqual(self.sync(), (3, False))
+        self.assertEqual(self.post.comments_synced_at, synced_at)
+
+        self.graph.fail = set()
+        self.assertEqual(self.sync(), (2, True))
+        self.assertEqual(self.post.comments_synced_at, self.newest())
+        self.assertEqual(FacebookComment.objects.filter(post=self.post).count(), 7)
+
+    def test_failed_first_sync_sets_no_mark(self):
+        self.graph.add(7)
+        self.graph.fail = {3}
+        self.assertEqual(self.sync(), (6, False))
+        self.assertIsNone(self.post.comments_synced_at)
+
+    def test_pages_without_prefetch_are_fetched_on_demand(self):
+        self.graph.add(7)
+        pages = iter_pages('1/comments', {'limit': 3}, 'token', prefetch=False)
+        self.assertEqual(len(next(pages)), 3)
+        self.assertEqual(self.graph.calls, [None])
+        pages.close()
+        self.assertEqual(self.graph.calls, [None])
+        self.assertEqual(
+            [len(page) for page in iter_pages('1/comments', {'limit': 3}, 'token', prefetch=False)], [3, 3, 1]
+        )
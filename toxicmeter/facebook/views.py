@@ -4,7 +4,7 @@ from django.contrib import messages
 from users.models import UserProfile
 from .models import FacebookPost
 from .facebook_api import fetch_facebook_posts,fetch_facebook_comments
-from django.db.models import Q
+from comments.search import search_queryset
 
 @login_required
 def fetch_posts(request):
@@ -22,7 +22,7 @@ def fetch_posts(request):
         return redirect('dashboard')
 
     # Fetch posts using the assigned token and page ID
-    success = fetch_facebook_posts(page_id, access_token, request)
+    success = fetch_facebook_posts(page_id, access_token, request.user)
     if success:
         messages.success(request, "Posts fetched and stored successfully!")
     else:
@@ -51,8 +51,7 @@ def view_posts(request):
         return redirect('dashboard')
     # Handle Search Query
     search_query = request.GET.get('q')
-    if search_query:
-        posts = posts.filter(Q(post_id__icontains=search_query) | Q(message__icontains=search_query))
+    posts = search_queryset(posts, search_query)
     # Modify post_id display format
     for post in posts:
         post.post_id_display = post.post_id.split('_')[1]
@@ -75,7 +74,7 @@ def fetch_comments(request, post_id):
         return redirect('view_posts')
 
     # Fetch comments for the given post using the token
-    success = fetch_facebook_comments(post_id, access_token,request)
+    success = fetch_facebook_comments(post_id, access_token, request.user)
     if success:
         messages.success(request, f"Comments for post {post_id} have been fetched successfully!")
     else:
@@ -0,0 +1,395 @@
+import hashlib
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .client import get_ml_client, reset_ml_client
+from .models import TOXICITY_LABELS
+from .thresholds import get_thresholds
+
+# functions = get_inference_backend, reset_inference_backend, save_linear_model
+
+# Default token pattern of scikit-learn's text vectorizers
+_TOKEN = re.compile(r'(?u)\b\w\w+\b')
+_WHITESPACE = re.compile(r'\s\s+')
+
+
+class InferenceError(Exception):
+    """
+    Raised when a backend cannot produce predictions: the service is unreachable, the
+    model file is missing or broken, or the model returned an unexpected shape.
+    """
+
+
+class InferenceBackend:
+    """
+    Scores comment texts for toxicity.
+
+    Predictions have the ML service's shape: one boolean per label, plus an optional
+    'probabilities' dict of per-label scores and the 'model_version' that produced them.
+    """
+
+    name = None
+
+    @property
+    def cache_version(self):
+        """
+        Identifies the model behind this backend in prediction cache keys (ml_integration.cache).
+
+        The ML service does not report its model, so settings.ML_MODEL_VERSION stands for it.
+        """
+        return f"{self.name}-{settings.ML_MODEL_VERSION}"
+
+    def predict(self, text):
+        return self.predict_many([text])[0]['prediction']
+
+    def predict_many(self, texts):
+        """
+        Returns:
+            list: One {'comment': ..., 'prediction': {...}} dict per input text, in order.
+
+        Raises:
+            InferenceError: If the texts could not be scored.
+        """
+        raise NotImplementedError
+
+    def health(self):
+        """
+        Raises:
+            InferenceError: If the backend cannot serve predictions.
+        """
+
+    def close(self):
+        pass
+
+
+class HTTPBackend(InferenceBackend):
+    """
+    Sends predictions to the Flask ML service through the pooled MLClient.
+    """
+
+    name = 'http'
+
+    def __init__(self, client=None):
+        self.client = client or get_ml_client()
+
+    def predict(self, text):
+        try:
+            return self.client.predict(text)
+        except requests.RequestException as e:
+            raise InferenceError(str(e)) from e
+
+    def predict_many(self, texts):
+        try:
+            return self.client.predict_many(texts)
+        except requests.RequestException as e:
+            raise InferenceError(str(e)) from e
+
+    def health(self):
+        try:
+            self.client.health()
+        except requests.RequestException as e:
+            raise InferenceError(str(e)) from e
+
+    def close(self):
+        self.client.close()
+
+
+class LocalBackend(InferenceBackend):
+    """
+    Scores in the Django process with an exported model, without a network hop.
+
+    The model file (settings.ML_MODEL_PATH) is loaded once per process, on first use, and
+    shared by all threads. Labels are the scores compared with settings.ML_LABEL_THRESHOLDS.
+    """
+
+    def __init__(self, path=None, thresholds=None):
+        self.path = path or settings.ML_MODEL_PATH
+        thresholds = get_thresholds(thresholds)
+        self.thresholds = np.array([thresholds[label] for label in TOXICITY_LABELS])
+        self.model_version = None
+        self.digest = None  # SHA-256 of the loaded model file
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    if not self.path:
+                        raise InferenceError(f"ML_BACKEND '{self.name}' needs settings.ML_MODEL_PATH")
+                    try:
+                        self.digest = _file_digest(self.path)
+                        self._model = self.load(self.path)
+                    except InferenceError:
+                        raise
+                    except Exception as e:
+                        raise InferenceError(f"Could not load model {self.path}: {e}") from e
+        return self._model
+
+    @property
+    def cache_version(self):
+        """
+        The loaded model's version and file digest, so a model file replaced under the same
+        model_version does not reuse its predecessor's cached predictions.
+        """
+        self.model
+        return f"{self.name}-{self.model_version}-{self.digest[:16]}"
+
+    def load(self, path):
+        """
+        Reads the model file, sets self.model_version and returns the loaded model.
+        """
+        raise NotImplementedError
+
+    def scores(self, texts):
+        """
+        Returns:
+            numpy.ndarray: A (len(texts), 6) array of probabilities in TOXICITY_LABELS order.
+        """
+        raise NotImplementedError
+
+    def predict_many(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        probabilities = self.scores(texts)
+        labels = probabilities >= self.thresholds
+        results = []
+        for text, row, flags in zip(texts, probabilities.tolist(), labels.tolist()):
+            prediction = dict(zip(TOXICITY_LABELS, flags))
+            prediction['probabilities'] = dict(zip(TOXICITY_LABELS, row))
+            prediction['model_version'] = self.model_version
+            results.append({'comment': text, 'prediction': prediction})
+        return results
+
+    def health(self):
+        self.model
+
+
+class LinearBackend(LocalBackend):
+    """
+    NumPy-only TF-IDF + linear model, one logistic regression per label.
+
+    The model is an .npz file written by save_linear_model. Texts are tokenized like
+    scikit-learn's TfidfVectorizer, so a vectorizer and classifiers trained there score
+    the same here. A batch is vectorized into flat (document, feature, weight) arrays and
+    scored with one weighted bincount per label, without a dense document-term matrix.
+    """
+
+    name = 'linear'
+
+    def load(self, path):
+        with np.load(path, allow_pickle=False) as data:
+            labels = [str(label) for label in data['labels']]
+            missing = [label for label in TOXICITY_LABELS if label not in labels]
+            if missing:
+                raise InferenceError(f"Model {path} has no weights for {', '.join(missing)}")
+            order = [labels.index(label) for label in TOXICITY_LABELS]
+            model = {
+                'vocabulary': {str(term): index for index, term in enumerate(data['vocabulary'])},
+                'idf': data['idf'].astype(float),
+                'weights': np.ascontiguousarray(data['coef'][order].T, dtype=float),  # (features, labels)
+                'intercept': data['intercept'][order].astype(float),
+                'analyzer': str(data['analyzer']),
+                'ngram_range': tuple(int(n) for n in data['ngram_range']),
+                'sublinear_tf': bool(data['sublinear_tf']),
+                'lowercase': bool(data['lowercase']),
+            }
+            self.model_version = str(data['model_version']) or settings.ML_MODEL_VERSION
+        if model['analyzer'] not in ('word', 'char', 'char_wb'):
+            raise InferenceError(f"Unsupported analyzer: {model['analyzer']}")
+        return model
+
+    def analyze(self, model, text):
+        """
+        Yields the terms of a text, as TfidfVectorizer's build_analyzer() would.
+        """
+        if model['lowercase']:
+            text = text.lower()
+        low, high = model['ngram_range']
+        if model['analyzer'] == 'word':
+            tokens = _TOKEN.findall(text)
+            for n in range(low, high + 1):
+                for start in range(len(tokens) - n + 1):
+                    yield " ".join(tokens[start:start + n])
+        elif model['analyzer'] == 'char':
+            text = _WHITESPACE.sub(" ", text)
+            for n in range(low, high + 1):
+                for start in range(len(text) - n + 1):
+                    yield text[start:start + n]
+        else:
+            for word in _WHITESPACE.sub(" ", text).split():
+                word = f" {word} "
+                for n in range(low, high + 1):
+                    yield word[:n]
+                    for start in range(1, len(word) - n + 1):
+                        yield word[start:start + n]
+                    if len(word) <= n:
+                        break
+
+    def scores(self, texts):
+        model = self.model
+        vocabulary = model['vocabulary']
+        documents, features, counts = [], [], []
+        for position, text in enumerate(texts):
+            terms = Counter(vocabulary[term] for term in self.analyze(model, text or '') if term in vocabulary)
+            documents.extend([position] * len(terms))
+            features.extend(terms.keys())
+            counts.extend(terms.values())
+        documents = np.array(documents, dtype=np.intp)
+        features = np.array(features, dtype=np.intp)
+        tf = np.array(counts, dtype=float)
+        if model['sublinear_tf']:
+            tf = 1 + np.log(tf)
+        values = tf * model['idf'][features]
+        norms = np.sqrt(np.bincount(documents, weights=values ** 2, minlength=len(texts)))
+        if len(values):
+            values /= norms[documents]  # l2 normalization, as TfidfVectorizer does by default
+
+        logits = np.tile(model['intercept'], (len(texts), 1))
+        for index in range(len(TOXICITY_LABELS)):
+            logits[:, index] += np.bincount(
+                documents, weights=values * model['weights'][features, index], minlength=len(texts)
+            )
+        return 1 / (1 + np.exp(-logits))
+
+
+class ONNXBackend(LocalBackend):
+    """
+    ONNX Runtime (CPU) model. Needs the optional onnxruntime package.
+
+    The model takes a string tensor of comment texts and returns a (N, 6) float tensor of
+    label probabilities in TOXICITY_LABELS order, e.g. a scikit-learn pipeline converted
+    with skl2onnx without ZipMap. A 'model_version' metadata entry names the model.
+    """
+
+    name = 'onnx'
+
+    def load(self, path):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise InferenceError("ML_BACKEND 'onnx' needs the onnxruntime package") from e
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = settings.ML_ONNX_THREADS
+        session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        metadata = session.get_modelmeta().custom_metadata_map
+        self.model_version = metadata.get('model_version') or settings.ML_MODEL_VERSION
+        model_input = session.get_inputs()[0]
+        output = settings.ML_ONNX_OUTPUT or session.get_outputs()[-1].name
+        return session, model_input.name, len(model_input.shape), output
+
+    def scores(self, texts):
+        session, input_name, rank, output = self.model
+        batch = np.array([text or '' for text in texts], dtype=object)
+        if rank == 2:
+            batch = batch.reshape(-1, 1)
+        try:
+            result = session.run([output], {input_name: batch})[0]
+        except Exception as e:
+            raise InferenceError(f"ONNX inference failed: {e}") from e
+        probabilities = np.asarray(result, dtype=float)
+        if probabilities.shape != (len(texts), len(TOXICITY_LABELS)):
+            raise InferenceError(
+                f"ONNX output {output} has shape {probabilities.shape}, "
+                f"expected ({len(texts)}, {len(TOXICITY_LABELS)})"
+            )
+        return probabilities
+
+
+INFERENCE_BACKENDS = {
+    'http': HTTPBackend,
+    'linear': LinearBackend,
+    'onnx': ONNXBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_inference_backend():
+    """
+    Returns the process-wide backend chosen by settings.ML_BACKEND, creating it on first use.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if settings.ML_BACKEND not in INFERENCE_BACKENDS:
+                    raise ImproperlyConfigured(
+                        f"Unknown ML_BACKEND {settings.ML_BACKEND!r}, expected one of {', '.join(INFERENCE_BACKENDS)}"
+                    )
+                _backend = INFERENCE_BACKENDS[settings.ML_BACKEND]()
+    return _backend
+
+
+def reset_inference_backend():
+    """
+    Closes the process-wide backend and ML client, so the next call builds them from the
+    current settings, e.g. after override_settings.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+        _backend = None
+    reset_ml_client()
+
+
+def save_linear_model(path, vocabulary, idf, coef, intercept, labels=None, analyzer='word',
+                      ngram_range=(1, 1), sublinear_tf=False, lowercase=True, model_version=''):
+    """
+    Writes a TF-IDF + linear model in the .npz format read by LinearBackend.
+
+    The arguments map onto a fitted scikit-learn TfidfVectorizer and one binary
+    classifier per label, e.g. vocabulary=vectorizer.vocabulary_, idf=vectorizer.idf_,
+    coef=np.vstack([clf.coef_ for clf in classifiers]) and
+    intercept=np.concatenate([clf.intercept_ for clf in classifiers]).
+
+    Args:
+        path (str): Destination file.
+        vocabulary (dict | list): {term: feature index}, or the terms in feature order.
+        idf (array): Inverse document frequency of each feature.
+        coef (array): (labels, features) weights.
+        intercept (array): One bias per label.
+        labels (list): Label of each coef row. Defaults to TOXICITY_LABELS.
+        analyzer (str): 'word', 'char' or 'char_wb'.
+        ngram_range (tuple): (min_n, max_n) of the vectorizer.
+        sublinear_tf (bool): Whether term counts were replaced by 1 + log(count).
+        lowercase (bool): Whether texts were lowercased.
+        model_version (str): Stored with every prediction; defaults to settings.ML_MODEL_VERSION when blank.
+    """
+    if isinstance(vocabulary, dict):
+        terms = [None] * len(vocabulary)
+        for term, index in vocabulary.items():
+            terms[index] = term
+    else:
+        terms = list(vocabulary)
+    np.savez_compressed(
+        path,
+        labels=np.array(labels or TOXICITY_LABELS),
+        vocabulary=np.array(terms, dtype=str),
+        idf=np.asarray(idf, dtype=float),
+        coef=np.asarray(coef, dtype=float),
+        intercept=np.asarray(intercept, dtype=float),
+        analyzer=np.array(analyzer),
+        ngram_range=np.array(ngram_range),
+        sublinear_tf=np.array(sublinear_tf),
+        lowercase=np.array(lowercase),
+        model_version=np.array(model_version),
+    )
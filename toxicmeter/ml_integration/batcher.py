@@ -0,0 +1,106 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .backends import InferenceError, get_inference_backend
+
+
+class _Batch:
+    def __init__(self):
+        self.texts = []
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-comment predictions into one predict_many call on the
+    inference backend, e.g. several moderators analyzing comments at the same time.
+
+    There is no dispatcher thread: the first caller of a batch leads it. When no other
+    batch is being scored, the leader sends its comment at once, so a lone request waits
+    for nothing. While a batch is in flight, the callers arriving meanwhile are collected
+    until that batch returns, settings.ML_MICROBATCH_MAX_WAIT_MS passes or
+    settings.ML_MICROBATCH_MAX_SIZE comments are waiting, and the leader then sends them
+    together. Each caller gets its own prediction, or the batch's InferenceError.
+
+    Batching happens within one process; `batches` and `items` count the backend calls
+    made and the comments they carried.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._pending = None  # Batch still accepting comments
+        self._in_flight = 0  # Batches being scored by the backend
+        self.batches = 0
+        self.items = 0
+
+    def predict(self, text):
+        """
+        Scores one comment text, batched with the other comments predicted concurrently.
+
+        Returns:
+            dict: The prediction for the text.
+
+        Raises:
+            InferenceError: If the batch could not be scored.
+        """
+        max_wait = settings.ML_MICROBATCH_MAX_WAIT_MS / 1000
+        max_size = max(settings.ML_MICROBATCH_MAX_SIZE, 1)
+        with self._lock:
+            batch = self._pending
+            leader = batch is None
+            if leader:
+                batch = self._pending = _Batch()
+            index = len(batch.texts)
+            batch.texts.append(text)
+            if len(batch.texts) >= max_size:
+                # Full: it counts as in flight from now on and later callers start the next batch
+                self._pending = None
+                self._in_flight += 1
+                self._changed.notify_all()
+
+            if leader:
+                deadline = time.monotonic() + max_wait
+                while self._pending is batch and self._in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._changed.wait(remaining)
+                if self._pending is batch:
+                    self._pending = None
+                    self._in_flight += 1
+                self.batches += 1
+                self.items += len(batch.texts)
+
+        if leader:
+            self._dispatch(batch)
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise InferenceError(str(batch.error)) from batch.error
+        return batch.results[index]['prediction']
+
+    def _dispatch(self, batch):
+        try:
+            backend = get_inference_backend()
+            if len(batch.texts) == 1:
+                batch.results = [{'comment': batch.texts[0], 'prediction': backend.predict(batch.texts[0])}]
+            else:
+                batch.results = backend.predict_many(batch.texts)
+        except Exception as e:
+            # Followers get an InferenceError; anything else is re-raised to the leader as well
+            batch.error = e
+            if not isinstance(e, InferenceError):
+                raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._changed.notify_all()
+            batch.done.set()
+
+
+micro_batcher = MicroBatcher()
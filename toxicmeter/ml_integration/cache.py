@@ -0,0 +1,103 @@
+import hashlib
+import re
+import threading
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import caches
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """
+    Normalizes comment text for cache lookups: Unicode NFKC, case-folded, whitespace collapsed.
+    """
+    text = unicodedata.normalize('NFKC', text or '')
+    return _WHITESPACE.sub(' ', text.casefold()).strip()
+
+
+class PredictionCache:
+    """
+    Caches model predictions keyed on a hash of the normalized comment text plus the
+    model version of the inference backend in use (InferenceBackend.cache_version).
+
+    Entries live in the Django cache alias named by settings.ML_PREDICTION_CACHE, which
+    provides the TTL and LRU eviction. Hit and miss counters are kept per process.
+    """
+
+    def __init__(self, alias=None, model_version=None):
+        self.alias = alias or settings.ML_PREDICTION_CACHE
+        self._model_version = model_version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    @property
+    def model_version(self):
+        """
+        Read from the current backend on every use, so keys follow a change of backend or a
+        reloaded model instead of the settings seen at import.
+        """
+        if self._model_version:
+            return self._model_version
+        # Imported here: backends -> thresholds -> ... -> comments.dedup imports this module
+        from .backends import InferenceError, get_inference_backend
+        try:
+            return get_inference_backend().cache_version
+        except InferenceError:
+            # The model cannot load, so nothing is stored under this key: lookups just miss
+            return f"{settings.ML_BACKEND}-unavailable"
+
+    def key(self, text):
+        digest = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+        return f"prediction:{self.model_version}:{digest}"
+
+    def _count(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get(self, text):
+        prediction = self.backend.get(self.key(text))
+        self._count(prediction is not None, prediction is None)
+        return prediction
+
+    def set(self, text, prediction):
+        self.backend.set(self.key(text), prediction)
+
+    def get_many(self, texts):
+        """
+        Looks up several texts at once.
+
+        Returns:
+            list: The cached prediction for each text, or None where it was not cached.
+        """
+        keys = [self.key(text) for text in texts]
+        found = self.backend.get_many(set(keys))
+        predictions = [found.get(key) for key in keys]
+        hits = sum(1 for prediction in predictions if prediction is not None)
+        self._count(hits, len(keys) - hits)
+        return predictions
+
+    def set_many(self, predictions):
+        """
+        Stores predictions given as a {text: prediction} dict.
+        """
+        self.backend.set_many({self.key(text): prediction for text, prediction in predictions.items()})
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+prediction_cache = PredictionCache()
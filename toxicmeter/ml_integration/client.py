@@ -0,0 +1,106 @@
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from profiling.recorder import track_http
+
+
+class MLClient:
+    """
+    HTTP client for the Flask ML service.
+
+    Owns a requests.Session with a sized keep-alive connection pool, so bursts of
+    predictions reuse TCP connections instead of opening one per call. Connection
+    errors and 5xx responses are retried with exponential backoff.
+    """
+
+    def __init__(self, base_url=None, timeout=None, bulk_timeout=None, pool_size=None,
+                 retries=None, backoff_factor=None):
+        self.base_url = (base_url or settings.ML_SERVICE_URL).rstrip('/')
+        self.timeout = timeout or settings.ML_SERVICE_TIMEOUT
+        self.bulk_timeout = bulk_timeout or settings.ML_SERVICE_BULK_TIMEOUT
+        pool_size = pool_size or settings.ML_SERVICE_POOL_SIZE
+        retry = Retry(
+            total=settings.ML_SERVICE_RETRIES if retries is None else retries,
+            backoff_factor=settings.ML_SERVICE_BACKOFF if backoff_factor is None else backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=None,  # Predictions are idempotent, so POST is safe to retry
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def _post(self, path, payload, timeout):
+        with track_http('ml'):
+            response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def predict(self, text):
+        """
+        Predicts toxicity labels for a single comment via /predict.
+
+        Raises:
+            requests.RequestException: If the service is unreachable or returns an error.
+        """
+        return self._post('/predict', {"text": text}, self.timeout)
+
+    def predict_many(self, texts):
+        """
+        Predicts toxicity labels for several comments in one /predict_bulk call.
+
+        Returns:
+            list: One {'comment': ..., 'prediction': {...}} dict per input text, in order.
+
+        Raises:
+            requests.RequestException: If the service is unreachable or returns an error.
+        """
+        return self._post('/predict_bulk', {"comments": list(texts)}, self.bulk_timeout)
+
+    def health(self):
+        """
+        Probes the service's /health endpoint. The probe runs no prediction and has no side effects.
+
+        Raises:
+            requests.RequestException: If the service is unreachable or reports itself unhealthy.
+        """
+        # Not sent through the retrying session: a probe should report the first failure
+        with track_http('ml'):
+            response = requests.get(f"{self.base_url}/health", timeout=settings.ML_HEALTH_TIMEOUT)
+        response.raise_for_status()
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_ml_client():
+    """
+    Returns the process-wide MLClient, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MLClient()
+    return _client
+
+
+def reset_ml_client():
+    """
+    Closes the process-wide MLClient; the next get_ml_client() builds one from the current settings.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
@@ -0,0 +1,74 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .backends import InferenceError, get_inference_backend
+
+HEALTH_CACHE_KEY = "ml_health:status"
+HEALTH_LOCK_KEY = "ml_health:refreshing"
+# functions = check_model_health, refresh_model_health, get_model_health
+
+
+def check_model_health():
+    """
+    Probes the inference backend once and caches the outcome.
+
+    Returns:
+        dict: {'serving': bool, 'latency_ms': float, 'checked_at': datetime, 'error': str | None}
+    """
+    started = time.monotonic()
+    try:
+        get_inference_backend().health()
+        serving, error = True, None
+    except InferenceError as e:
+        serving, error = False, str(e)
+    status = {
+        'serving': serving,
+        'latency_ms': round((time.monotonic() - started) * 1000, 1),
+        'checked_at': timezone.now(),
+        'error': error,
+    }
+    # Kept until replaced; staleness is judged on checked_at so readers always have a last known value
+    cache.set(HEALTH_CACHE_KEY, status, timeout=None)
+    return status
+
+
+def refresh_model_health():
+    """
+    Starts a background probe unless one is already in flight.
+
+    Returns:
+        bool: True if a probe was started.
+    """
+    # cache.add is atomic, so only one caller wins the refresh
+    if not cache.add(HEALTH_LOCK_KEY, True, timeout=settings.ML_HEALTH_TIMEOUT * 10):
+        return False
+
+    def probe():
+        try:
+            check_model_health()
+        except Exception as e:
+            print(f"Error checking ML service health: {e}")
+        finally:
+            cache.delete(HEALTH_LOCK_KEY)
+
+    threading.Thread(target=probe, name="ml-health", daemon=True).start()
+    return True
+
+
+def get_model_health():
+    """
+    Returns the last cached health status without waiting on the ML service.
+
+    A background probe is started when the status is missing or older than ML_HEALTH_TTL.
+    Until the first probe finishes, 'serving' is None.
+    """
+    status = cache.get(HEALTH_CACHE_KEY)
+    if status is None or (timezone.now() - status['checked_at']).total_seconds() > settings.ML_HEALTH_TTL:
+        refresh_model_health()
+    if status is None:
+        return {'serving': None, 'latency_ms': None, 'checked_at': None, 'error': None}
+    return status
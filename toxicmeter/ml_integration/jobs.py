@@ -0,0 +1,220 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import OperationalError
+from django.db.models import Count
+from django.utils import timezone
+
+from comments.dedup import assign_clusters
+from comments.rules import process_pending_moderation
+from comments.stats import bump_stats
+from facebook.models import FacebookComment
+from .models import AnalysisJob, ToxicityParameters
+from .services import fan_out_predictions, predict_comment_batch, save_predictions
+
+ACTIVE_STATUSES = ['queued', 'running']
+# functions = enqueue_analysis, claim_jobs, labeled_since_queued, predict_chunk, run_jobs, process_queue, purge_finished_jobs, requeue_stale_jobs, job_counts
+
+
+def enqueue_analysis(comment_ids, user=None, chunk_size=1000):
+    """
+    Queues comments for the analysis worker. Comments that already have an active job are skipped.
+
+    Args:
+        comment_ids (list | QuerySet): IDs of the comments to analyze.
+        user (User): The user who requested the analysis; their stats are credited when it finishes.
+        chunk_size (int): Number of jobs inserted per query.
+
+    Returns:
+        int: Number of comments queued.
+    """
+    pending = (
+        FacebookComment.objects.filter(id__in=comment_ids)
+        .exclude(analysis_jobs__status__in=ACTIVE_STATUSES)
+        .values_list('id', flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+    queued = 0
+    while True:
+        ids = list(islice(pending, chunk_size))
+        if not ids:
+            break
+        # Comments queued by a concurrent request in the meantime are left out, and any
+        # queued between this read and the insert are skipped by the unique constraint
+        active = set(
+            AnalysisJob.objects.filter(comment_id__in=ids, status__in=ACTIVE_STATUSES).values_list('comment_id', flat=True)
+        )
+        new_ids = [comment_id for comment_id in ids if comment_id not in active]
+        AnalysisJob.objects.bulk_create(
+            [AnalysisJob(comment_id=comment_id, requested_by=user) for comment_id in new_ids],
+            ignore_conflicts=True,
+        )
+        queued += len(new_ids)
+    return queued
+
+
+def claim_jobs(limit):
+    """
+    Atomically moves up to `limit` queued jobs to running for this worker.
+
+    Returns:
+        list: The claimed AnalysisJob objects.
+    """
+    token = uuid.uuid4().hex
+    ids = list(AnalysisJob.objects.filter(status='queued').order_by('id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+    # The status filter makes the claim safe against other workers racing for the same rows
+    AnalysisJob.objects.filter(id__in=ids, status='queued').update(
+        status='running', worker=token, started_at=timezone.now()
+    )
+    return list(AnalysisJob.objects.filter(worker=token, status='running'))
+
+
+def labeled_since_queued(jobs):
+    """
+    Returns:
+        set: IDs of the jobs' comments whose prediction was stored after the job was queued.
+    """
+    predicted_at = dict(
+        ToxicityParameters.objects.filter(comment_id__in=[job.comment_id for job in jobs])
+        .values_list('comment_id', 'predicted_at')
+    )
+    return {
+        job.comment_id for job in jobs
+        if predicted_at.get(job.comment_id) and predicted_at[job.comment_id] >= job.created_at
+    }
+
+
+def predict_chunk(comments):
+    """
+    Scores one chunk of comments; runs on the worker threads. Only the inference backend
+    is called here, the database is left to the thread running process_queue.
+
+    Returns:
+        tuple: (comment ID -> prediction or None, (post_id, cluster_key) -> prediction of the clusters predicted).
+    """
+    clusters = {}
+    return predict_comment_batch(comments, clusters), clusters
+
+
+def run_jobs(jobs, batch_size=None, executor=None):
+    """
+    Analyzes claimed jobs and records the outcome.
+
+    The comments go to the inference backend in chunks of batch_size, concurrently on
+    `executor` if given, but every database read and write happens on the calling thread:
+    SQLite takes one writer at a time, and concurrent writers fail with "database is
+    locked". If the database is still busy, e.g. because the web server is writing, the
+    unfinished jobs go back to the queue instead of failing.
+
+    Returns:
+        int: Number of jobs that finished successfully.
+    """
+    batch_size = batch_size or settings.ML_BULK_BATCH_SIZE
+    # Comments labeled since they were queued, e.g. fanned out from a near-duplicate, need no model call
+    labeled = labeled_since_queued(jobs)
+    pending = FacebookComment.objects.filter(id__in=[job.comment_id for job in jobs if job.comment_id not in labeled])
+    stored = set()
+    error = None
+    busy = False
+    try:
+        if settings.COMMENT_DEDUP_ENABLED:
+            assign_clusters(pending.filter(cluster_key='').values_list('post_id', flat=True).distinct())
+        comments = list(pending.only('id', 'content', 'post_id', 'cluster_key').order_by('id'))
+        chunks = [comments[i:i + batch_size] for i in range(0, len(comments), batch_size)]
+        results = executor.map(predict_chunk, chunks) if executor is not None else map(predict_chunk, chunks)
+        for predictions, clusters in results:
+            ready = [(comment_id, prediction) for comment_id, prediction in predictions.items() if prediction is not None]
+            save_predictions(ready)
+            stored.update(comment_id for comment_id, prediction in ready)
+            fan_out_predictions(clusters)
+    except OperationalError as e:
+        print(f"Database busy during analysis, requeueing jobs: {e}")
+        busy = True
+    except Exception as e:
+        print(f"Error during bulk prediction: {e}")
+        error = str(e)
+
+    # Jobs of comments deleted in the meantime were deleted with them
+    remaining = set(AnalysisJob.objects.filter(id__in=[job.id for job in jobs]).values_list('id', flat=True))
+    jobs = [job for job in jobs if job.id in remaining]
+    # Only predictions stored since the job was queued count; an older one is not this job's result
+    analyzed = stored | labeled_since_queued(jobs)
+    done = [job for job in jobs if job.comment_id in analyzed]
+    unfinished = [job.id for job in jobs if job.comment_id not in analyzed]
+    now = timezone.now()
+    AnalysisJob.objects.filter(id__in=[job.id for job in done]).update(status='done', finished_at=now)
+    if busy:
+        AnalysisJob.objects.filter(id__in=unfinished).update(status='queued', worker='', started_at=None)
+    else:
+        AnalysisJob.objects.filter(id__in=unfinished).update(
+            status='failed', finished_at=now, error=error or "Prediction failed."
+        )
+
+    # Credit the users who requested the analysis
+    credited = {}
+    for job in done:
+        if job.requested_by_id:
+            credited[job.requested_by_id] = credited.get(job.requested_by_id, 0) + 1
+    for user_id, count in credited.items():
+        bump_stats(user_id, comments_analyzed=count)
+    return len(done)
+
+
+def process_queue(threads=4, batch_size=None, executor=None):
+    """
+    Claims queued jobs and analyzes them, one bulk prediction per chunk of batch_size with
+    up to `threads` chunks scored at once, then executes the moderation actions queued by
+    auto-moderation rules.
+
+    Returns:
+        tuple: (jobs claimed, jobs finished successfully).
+    """
+    batch_size = batch_size or settings.ML_BULK_BATCH_SIZE
+    jobs = claim_jobs(batch_size * threads)
+    if not jobs:
+        process_pending_moderation()
+        return 0, 0
+    if executor is not None or threads == 1:
+        finished = run_jobs(jobs, batch_size, executor)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            finished = run_jobs(jobs, batch_size, pool)
+    process_pending_moderation()
+    return len(jobs), finished
+
+
+def purge_finished_jobs(older_than):
+    """
+    Deletes done and failed jobs that finished more than `older_than` (timedelta) ago.
+    """
+    cutoff = timezone.now() - older_than
+    deleted, _ = AnalysisJob.objects.filter(status__in=['done', 'failed'], finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def requeue_stale_jobs(older_than=timedelta(hours=1)):
+    """
+    Puts running jobs back in the queue if their worker died before finishing them.
+    """
+    cutoff = timezone.now() - older_than
+    return AnalysisJob.objects.filter(status='running', started_at__lt=cutoff).update(
+        status='queued', worker='', started_at=None
+    )
+
+
+def job_counts(user=None):
+    """
+    Returns the number of jobs in each state, optionally only those requested by `user`.
+    """
+    jobs = AnalysisJob.objects.all()
+    if user is not None:
+        jobs = jobs.filter(requested_by=user)
+    counts = {status: 0 for status, label in AnalysisJob._meta.get_field('status').choices}
+    for row in jobs.values('status').annotate(total=Count('id')):
+        counts[row['status']] = row['total']
+    return counts
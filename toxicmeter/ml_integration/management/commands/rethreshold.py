@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_integration.models import TOXICITY_LABELS
+from ml_integration.thresholds import get_thresholds, relabel_from_scores
+
+
+def parse_threshold(value):
+    label, _, threshold = value.partition('=')
+    try:
+        return label.strip(), float(threshold)
+    except ValueError:
+        raise CommandError(f"Thresholds look like insult=0.7, got {value!r}")
+
+
+class Command(BaseCommand):
+    help = "Relabels analyzed comments from their stored probability scores, without calling the model."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', action='append', default=[], type=parse_threshold, metavar='LABEL=SCORE',
+                            help="Override a label's threshold, e.g. --threshold insult=0.7. Repeatable.")
+        parser.add_argument('--chunk-size', type=int, default=20000, help="Rows loaded per chunk.")
+        parser.add_argument('--include-manual', action='store_true',
+                            help="Also relabel comments whose labels were set by a moderator.")
+        parser.add_argument('--dry-run', action='store_true', help="Report the changes without writing them.")
+
+    def handle(self, *args, **options):
+        try:
+            thresholds = get_thresholds(dict(options['threshold']))
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write("Thresholds: " + ", ".join(f"{label}={thresholds[label]}" for label in TOXICITY_LABELS))
+
+        started = time.monotonic()
+        summary = relabel_from_scores(
+            thresholds=thresholds,
+            chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+            include_manual=options['include_manual'],
+        )
+        elapsed = time.monotonic() - started
+
+        for label in TOXICITY_LABELS:
+            flips = summary['flips'][label]
+            self.stdout.write(f"  {label:<14} +{flips['on']:<8} -{flips['off']}")
+        verb = "Would relabel" if options['dry_run'] else "Relabeled"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {summary['changed']} of {summary['scanned']} comments in {elapsed:.2f}s."
+        ))
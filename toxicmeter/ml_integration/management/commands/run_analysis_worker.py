@@ -0,0 +1,58 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ml_integration.cache import prediction_cache
+from ml_integration.jobs import job_counts, process_queue, purge_finished_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Drains the analysis job queue, sending toxicity predictions to the backend from a thread pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int,
+                            help="Chunks sent to the inference backend at once; the database writes stay on "
+                                 "one thread. Defaults to 1 on SQLite and 4 otherwise.")
+        parser.add_argument('--batch-size', type=int, default=settings.ML_BULK_BATCH_SIZE,
+                            help="Comments per /predict_bulk request.")
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Seconds to wait before polling an empty queue again.")
+        parser.add_argument('--keep-hours', type=float, default=24.0,
+                            help="Finished jobs older than this are purged.")
+        parser.add_argument('--once', action='store_true', help="Exit as soon as the queue is empty.")
+
+    def handle(self, *args, **options):
+        threads = options['threads'] or (1 if connection.vendor == 'sqlite' else 4)
+        batch_size = options['batch_size']
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} jobs left running by a previous worker.")
+        self.stdout.write(f"Analysis worker started with {threads} threads, batch size {batch_size}.")
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            try:
+                while True:
+                    started = time.monotonic()
+                    claimed, finished = process_queue(threads, batch_size, executor=executor)
+                    if claimed:
+                        elapsed = time.monotonic() - started
+                        counts = job_counts()
+                        cache_stats = prediction_cache.stats()
+                        self.stdout.write(
+                            f"Analyzed {finished}/{claimed} comments in {elapsed:.2f}s "
+                            f"({counts['queued']} queued, {counts['failed']} failed, "
+                            f"prediction cache hit rate {cache_stats['hit_rate']:.0%})"
+                        )
+                        continue
+
+                    purge_finished_jobs(timedelta(hours=options['keep_hours']))
+                    if options['once']:
+                        self.stdout.write(self.style.SUCCESS("Analysis queue drained."))
+                        break
+                    time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                self.stdout.write("Analysis worker stopped.")
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("facebook", "0007_facebookcomment_fbcomment_post_id_idx_and_more"),
+        ("ml_integration", "0002_analysisjob"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="toxicityparameters",
+            index=models.Index(
+                fields=["-predicted_at", "-comment"], name="toxparams_predicted_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="toxicityparameters",
+            index=models.Index(
+                condition=models.Q(("toxic", True)),
+                fields=["comment"],
+                name="toxparams_toxic_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="toxicityparameters",
+            index=models.Index(
+                condition=models.Q(("severe_toxic", True)),
+                fields=["comment"],
+                name="toxparams_severe_toxic_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="toxicityparameters",
+            index=models.Index(
+                condition=models.Q(("obscene", True)),
+                fields=["comment"],
+                name="toxparams_obscene_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="toxicityparameters",
+            index=models.Index(
+                condition=models.Q(("threat", True)),
+                fields=["comment"],
+                name="toxparams_threat_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="toxicityparameters",
+            index=models.Index(
+                condition=models.Q(("insult", True)),
+                fields=["comment"],
+                name="toxparams_insult_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="toxicityparameters",
+            index=models.Index(
+                condition=models.Q(("identity_hate", True)),
+                fields=["comment"],
+                name="toxparams_identity_hate_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ml_integration", "0003_toxicityparameters_toxparams_predicted_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="toxicityparameters",
+            name="identity_hate_score",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="toxicityparameters",
+            name="insult_score",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="toxicityparameters",
+            name="model_version",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="toxicityparameters",
+            name="obscene_score",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="toxicityparameters",
+            name="severe_toxic_score",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="toxicityparameters",
+            name="threat_score",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="toxicityparameters",
+            name="toxic_score",
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
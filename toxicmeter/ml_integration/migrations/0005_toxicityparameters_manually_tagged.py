@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ml_integration", "0004_toxicityparameters_identity_hate_score_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="toxicityparameters",
+            name="manually_tagged",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,6 +1,14 @@
 from django.db import models
+from django.contrib.auth.models import User
 from facebook.models import FacebookComment
 
+# Label fields shared by ToxicityParameters and DeletedComment
+TOXICITY_LABELS = ['toxic', 'severe_toxic', 'obscene', 'threat', 'insult', 'identity_hate']
+# Probability of each label, e.g. 'toxic_score'
+SCORE_FIELDS = [f'{label}_score' for label in TOXICITY_LABELS]
+# Everything a prediction stores: labels, scores and the model version
+PREDICTION_FIELDS = TOXICITY_LABELS + SCORE_FIELDS + ['model_version']
+
 class ToxicityParameters(models.Model):
     comment = models.OneToOneField(FacebookComment, on_delete=models.CASCADE, related_name='toxicity_parameters')
     toxic = models.BooleanField(default=False)
@@ -9,7 +17,61 @@ class ToxicityParameters(models.Model):
     threat = models.BooleanField(default=False)
     insult = models.BooleanField(default=False)
     identity_hate = models.BooleanField(default=False)
+    # Label probabilities from the model; null for predictions made before scores were stored
+    toxic_score = models.FloatField(null=True, blank=True)
+    severe_toxic_score = models.FloatField(null=True, blank=True)
+    obscene_score = models.FloatField(null=True, blank=True)
+    threat_score = models.FloatField(null=True, blank=True)
+    insult_score = models.FloatField(null=True, blank=True)
+    identity_hate_score = models.FloatField(null=True, blank=True)
+    model_version = models.CharField(max_length=64, blank=True, default='')  # Model that produced the prediction
+    manually_tagged = models.BooleanField(default=False)  # Labels set by a moderator; kept when rethresholding
     predicted_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Analyzed comments list: newest predictions first
+            models.Index(fields=['-predicted_at', '-comment'], name='toxparams_predicted_idx'),
+        ] + [
+            # Label filters only look for flagged comments, a small fraction of all rows
+            models.Index(fields=['comment'], condition=models.Q(**{label: True}), name=f'toxparams_{label}_idx')
+            for label in TOXICITY_LABELS
+        ]
+
     def __str__(self):
         return f"Toxicity Parameters for Comment ID: {self.comment.id}"
+
+# Analysis job states
+JOB_STATUSES = [
+    ('queued', 'Queued'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+]
+
+# Queue of comments waiting for the analysis worker (manage.py run_analysis_worker)
+class AnalysisJob(models.Model):
+    comment = models.ForeignKey(FacebookComment, on_delete=models.CASCADE, related_name='analysis_jobs')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='analysis_jobs')
+    status = models.CharField(max_length=10, choices=JOB_STATUSES, default='queued')
+    worker = models.CharField(max_length=64, blank=True, default='')  # Token of the worker that claimed the job
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='analysisjob_status_idx'),
+        ]
+        constraints = [
+            # A comment can only be waiting in the queue once
+            models.UniqueConstraint(
+                fields=['comment'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='unique_active_analysis_job',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Analysis job for Comment ID: {self.comment_id} ({self.status})"
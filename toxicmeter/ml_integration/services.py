@@ -1,10 +1,22 @@
-import requests
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from comments.dedup import assign_clusters
+from comments.rollups import bump_rollups, prediction_deltas
+from comments.rules import queue_rule_actions
 from facebook.models import FacebookComment
-from .models import ToxicityParameters
-# functions = predict_single_comment, predict_bulk_comments, store_single_prediction, store_bulk_predictions
+from .cache import prediction_cache
+from .backends import InferenceError, get_inference_backend
+from .batcher import micro_batcher
+from .models import PREDICTION_FIELDS, SCORE_FIELDS, TOXICITY_LABELS, ToxicityParameters
+# functions = predict_single_comment, predict_bulk_comments, predict_comment_batch, parse_prediction, save_predictions, fan_out_predictions, store_single_prediction, iter_bulk_predictions, store_bulk_predictions
 def predict_single_comment(comment_text):
     """
-    Sends a single comment to the Flask ML service for toxicity prediction.
+    Scores a single comment with the inference backend chosen by settings.ML_BACKEND.
+
+    Comments scored concurrently by other requests are sent to the backend in one call
+    (ml_integration.batcher) unless settings.ML_MICROBATCH_ENABLED is off.
     
     Args:
         comment_text (str): The text of the comment to analyze.
@@ -12,21 +24,26 @@ def predict_single_comment(comment_text):
     Returns:
         dict: A dictionary containing the predictions (e.g., toxic, threat, etc.) or None if the request fails.
     """
-    url = "http://127.0.0.1:5000/predict"
-    headers = {"Content-Type": "application/json"}
-    payload = {"text": comment_text}
-
+    prediction = prediction_cache.get(comment_text)
+    if prediction is not None:
+        return prediction
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
+        if settings.ML_MICROBATCH_ENABLED:
+            prediction = micro_batcher.predict(comment_text)
+        else:
+            prediction = get_inference_backend().predict(comment_text)
+    except InferenceError as e:
         print(f"Error during single comment prediction: {e}")
         return None
+    prediction_cache.set(comment_text, prediction)
+    return prediction
 
 def predict_bulk_comments(comments):
     """
-    Sends multiple comments to the Flask ML service for bulk toxicity prediction.
+    Scores multiple comments in one call to the inference backend chosen by settings.ML_BACKEND.
+
+    Comments whose normalized text is already in the prediction cache are answered from
+    the cache; only the distinct cache misses are sent to the backend.
 
     Args:
         comments (list): A list of comment strings to analyze.
@@ -34,17 +51,162 @@ def predict_bulk_comments(comments):
     Returns:
         list: A list of dictionaries containing comments and their predictions, or None if the request fails.
     """
-    url = "http://127.0.0.1:5000/predict_bulk"
-    headers = {"Content-Type": "application/json"}
-    payload = {"comments": comments}
+    comments = list(comments)
+    predictions = prediction_cache.get_many(comments)
+    # One request per distinct normalized text, even if it repeats within the batch
+    misses = {}
+    for text, prediction in zip(comments, predictions):
+        if prediction is None:
+            misses.setdefault(prediction_cache.key(text), text)
 
-    try:
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        print(f"Error during bulk comment prediction: {e}")
-        return None
+    if misses:
+        try:
+            results = get_inference_backend().predict_many(list(misses.values()))
+        except InferenceError as e:
+            print(f"Error during bulk comment prediction: {e}")
+            return None
+        fresh = {key: result['prediction'] for key, result in zip(misses, results)}
+        prediction_cache.set_many({misses[key]: prediction for key, prediction in fresh.items()})
+        predictions = [
+            prediction if prediction is not None else fresh.get(prediction_cache.key(text))
+            for text, prediction in zip(comments, predictions)
+        ]
+
+    return [{'comment': text, 'prediction': prediction} for text, prediction in zip(comments, predictions)]
+
+def predict_comment_batch(comments, clusters=None):
+    """
+    Predicts a batch of comments with one model input per near-duplicate cluster.
+
+    Comments of the same post sharing a cluster key (comments.dedup) are predicted once,
+    through the first of them, and the prediction is fanned out to the others. Clusters
+    already in `clusters` are not predicted again; newly predicted ones are added to it.
+
+    Args:
+        comments (list): FacebookComment objects with id, content, post_id and cluster_key.
+        clusters (dict): (post_id, cluster_key) -> prediction, shared across the batches of a run.
+
+    Returns:
+        dict: Comment ID -> prediction, or None if the prediction failed.
+    """
+    clusters = {} if clusters is None else clusters
+    groups = {}
+    for comment in comments:
+        key = (comment.post_id, comment.cluster_key) if settings.COMMENT_DEDUP_ENABLED and comment.cluster_key else comment.id
+        groups.setdefault(key, []).append(comment)
+
+    pending = [key for key in groups if key not in clusters]
+    results = predict_bulk_comments([groups[key][0].content for key in pending]) if pending else []
+    fresh = {key: result['prediction'] for key, result in zip(pending, results or [])}
+    for key, prediction in fresh.items():
+        if isinstance(key, tuple) and prediction is not None:
+            clusters[key] = prediction
+
+    predictions = {}
+    for key, members in groups.items():
+        prediction = fresh.get(key, clusters.get(key))
+        for comment in members:
+            predictions[comment.id] = prediction
+    return predictions
+
+def parse_prediction(prediction):
+    """
+    Maps a backend prediction to ToxicityParameters field values.
+
+    Besides one boolean per label, a prediction may include a 'probabilities' dict of
+    per-label scores and the 'model_version' that produced them. Missing scores are
+    stored as null; a missing version falls back to settings.ML_MODEL_VERSION.
+    """
+    values = {label: bool(prediction[label]) for label in TOXICITY_LABELS}
+    scores = prediction.get('probabilities') or {}
+    for label, field in zip(TOXICITY_LABELS, SCORE_FIELDS):
+        score = scores.get(label)
+        values[field] = float(score) if score is not None else None
+    values['model_version'] = str(prediction.get('model_version') or settings.ML_MODEL_VERSION)
+    return values
+
+def save_predictions(predictions):
+    """
+    Writes a batch of predictions to ToxicityParameters in one transaction.
+
+    Uses a single INSERT ... ON CONFLICT (comment) DO UPDATE instead of one
+    update_or_create round trip per comment. The toxicity rollups are updated in the
+    same transaction, and predictions with new or changed labels are then checked against
+    the admins' auto-moderation rules. Comments deleted since they were predicted are
+    skipped and counted as failed, so they do not abort the rest of the batch.
+
+    Args:
+        predictions (list): (comment_id, prediction dict) pairs.
+
+    Returns:
+        dict: Counts of inserted, updated and failed rows.
+    """
+    predictions = dict(predictions)
+    if not predictions:
+        return {'inserted': 0, 'updated': 0, 'failed': 0}
+
+    with transaction.atomic():
+        # One query for each comment's post and any prediction it already has; the comment
+        # rows stay locked until the upsert, where the database supports it
+        current = FacebookComment.objects.select_for_update(of=('self',)).filter(id__in=predictions).values(
+            'id', 'post_id', 'toxicity_parameters__predicted_at',
+            *[f'toxicity_parameters__{label}' for label in TOXICITY_LABELS],
+        )
+        rows = {}
+        post_ids = {}
+        previous = {}
+        for row in current:
+            rows[row['id']] = ToxicityParameters(comment_id=row['id'], **parse_prediction(predictions[row['id']]))
+            post_ids[row['id']] = row['post_id']
+            if row['toxicity_parameters__predicted_at'] is not None:
+                previous[row['id']] = (
+                    row['toxicity_parameters__predicted_at'],
+                    {label: row[f'toxicity_parameters__{label}'] for label in TOXICITY_LABELS},
+                )
+        if not rows:
+            return {'inserted': 0, 'updated': 0, 'failed': len(predictions)}
+        ToxicityParameters.objects.bulk_create(
+            rows.values(),
+            update_conflicts=True,
+            unique_fields=['comment'],
+            # A new prediction replaces any manual labels, so manually_tagged is reset too
+            update_fields=PREDICTION_FIELDS + ['manually_tagged'],
+        )
+        bump_rollups(prediction_deltas(rows, previous, post_ids))
+    # Only new or changed labels go through the rules, so re-analyzing a comment does not
+    # repeat an action a moderator has since reverted
+    queue_rule_actions(
+        (comment_id, row) for comment_id, row in rows.items()
+        if comment_id not in previous
+        or previous[comment_id][1] != {label: getattr(row, label) for label in TOXICITY_LABELS}
+    )
+    return {'inserted': len(rows) - len(previous), 'updated': len(previous), 'failed': len(predictions) - len(rows)}
+
+def fan_out_predictions(clusters):
+    """
+    Stores each cluster's prediction for the members of the cluster that are not analyzed
+    yet, so a spam wave is labeled from one model call. Members that already have
+    predictions or manual labels keep them.
+
+    Args:
+        clusters (dict): (post_id, cluster_key) -> prediction.
+
+    Returns:
+        int: Number of comments labeled.
+    """
+    if not clusters:
+        return 0
+    members = FacebookComment.objects.filter(
+        post_id__in={post_id for post_id, key in clusters},
+        cluster_key__in={key for post_id, key in clusters},
+        toxicity_parameters__isnull=True,
+    ).values_list('id', 'post_id', 'cluster_key')
+    counts = save_predictions(
+        (comment_id, clusters[(post_id, key)])
+        for comment_id, post_id, key in members
+        if (post_id, key) in clusters
+    )
+    return counts['inserted'] + counts['updated']
 
 def store_single_prediction(comment_id):
     """
@@ -57,53 +219,100 @@ def store_single_prediction(comment_id):
         # Get the prediction using Step 1's function
         prediction = predict_single_comment(comment.content)
 
-        if prediction:
-            # Store the prediction in ToxicityParameters
-            ToxicityParameters.objects.update_or_create(
-                comment=comment,
-                defaults={
-                    'toxic': prediction['toxic'],
-                    'severe_toxic': prediction['severe_toxic'],
-                    'obscene': prediction['obscene'],
-                    'threat': prediction['threat'],
-                    'insult': prediction['insult'],
-                    'identity_hate': prediction['identity_hate'],
-                },
-            )
+        # Store the prediction in ToxicityParameters, unless the comment was deleted meanwhile
+        if prediction and not save_predictions([(comment.id, prediction)])['failed']:
+            return True
         else:
             print(f"Prediction failed for comment ID: {comment_id}")
             return False
-        return True
     except FacebookComment.DoesNotExist:
         return False
 
-def store_bulk_predictions(comment_ids):
+def iter_bulk_predictions(comments, batch_size=None):
     """
-    Fetches multiple comments, predicts toxicity, and stores them in the database.
+    Streams comments to the inference backend in fixed-size batches and stores each
+    batch's predictions before the next batch is sent.
+
+    Comments are read with a server-side cursor, so memory stays flat regardless of
+    how many comments are pending. Near-duplicates are sent once per cluster
+    (predict_comment_batch), and each newly predicted cluster's labels are also stored
+    for its unanalyzed members outside the queryset (fan_out_predictions).
+
+    Args:
+        comments (QuerySet): The FacebookComment queryset to analyze.
+        batch_size (int): Comments per /predict_bulk request. Defaults to settings.ML_BULK_BATCH_SIZE.
+
+    Yields:
+        dict: Progress for each batch (batch number, batch size, stored, inserted, updated,
+        failed and fanned-out counts, and the running total).
+    """
+    batch_size = batch_size or settings.ML_BULK_BATCH_SIZE
+    if settings.COMMENT_DEDUP_ENABLED:
+        assign_clusters(comments.filter(cluster_key='').values_list('post_id', flat=True).distinct())
+    rows = comments.only('id', 'content', 'post_id', 'cluster_key').order_by('id').iterator(chunk_size=batch_size)
+    clusters = {}
+    processed = 0
+    number = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        number += 1
+        processed += len(batch)
+
+        known = set(clusters)
+        predictions = predict_comment_batch(batch, clusters)
+        counts = save_predictions(
+            (comment.id, predictions[comment.id]) for comment in batch if predictions[comment.id] is not None
+        )
+        fanned_out = fan_out_predictions({key: clusters[key] for key in clusters.keys() - known})
+        stored = counts['inserted'] + counts['updated']
+        yield {
+            'batch': number,
+            'size': len(batch),
+            'stored': stored,
+            'inserted': counts['inserted'],
+            'updated': counts['updated'],
+            'failed': len(batch) - stored,
+            'fanned_out': fanned_out,
+            'processed': processed,
+        }
+
+def store_bulk_predictions(comment_ids, batch_size=None, progress=None):
     """
+    Fetches multiple comments, predicts toxicity in batches, and stores them in the database.
+
+    Args:
+        comment_ids (list | QuerySet): IDs of the comments to analyze.
+        batch_size (int): Comments per /predict_bulk request. Defaults to settings.ML_BULK_BATCH_SIZE.
+        progress (callable): Optional callback receiving the progress dict of each finished batch.
+
+    Returns:
+        dict: Totals for the run (batches, processed, stored, inserted, updated, failed,
+        fanned_out, error). fanned_out counts near-duplicates outside comment_ids that were
+        labeled from their cluster's prediction.
+        A batch that fails is counted as failed and the remaining batches are still sent.
+    """
+    summary = {
+        'batches': 0, 'processed': 0, 'stored': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'fanned_out': 0,
+        'error': None,
+    }
+    comments = FacebookComment.objects.filter(id__in=comment_ids)
     try:
-        # Get the comments from the database
-        comments = FacebookComment.objects.filter(id__in=comment_ids)
-
-        # Prepare the content for prediction
-        comments_data = [comment.content for comment in comments]
-
-        # Get the bulk predictions using Step 1's function
-        bulk_predictions = predict_bulk_comments(comments_data)
-
-        # Store predictions in ToxicityParameters
-        for comment, result in zip(comments, bulk_predictions):
-            ToxicityParameters.objects.update_or_create(
-                comment=comment,
-                defaults={
-                    'toxic': result['prediction']['toxic'],
-                    'severe_toxic': result['prediction']['severe_toxic'],
-                    'obscene': result['prediction']['obscene'],
-                    'threat': result['prediction']['threat'],
-                    'insult': result['prediction']['insult'],
-                    'identity_hate': result['prediction']['identity_hate'],
-                },
-            )
-        return True
+        for batch in iter_bulk_predictions(comments, batch_size):
+            summary['batches'] = batch['batch']
+            summary['processed'] = batch['processed']
+            summary['stored'] += batch['stored']
+            summary['inserted'] += batch['inserted']
+            summary['updated'] += batch['updated']
+            summary['failed'] += batch['failed']
+            summary['fanned_out'] += batch['fanned_out']
+            if progress:
+                progress(batch)
+            else:
+                print(f"Bulk prediction batch {batch['batch']}: stored {batch['stored']}/{batch['size']} "
+                      f"({batch['processed']} processed)")
     except Exception as e:
-        return False
+        print(f"Error during bulk prediction: {e}")
+        summary['error'] = str(e)
+    return summary
@@ -1,3 +1,450 @@
-from django.test import TestCase
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from comments.services import scan_toxicity_label_counts, toxicity_label_counts
+from facebook.models import FacebookComment, FacebookPost
+from .backends import HTTPBackend, InferenceError, LinearBackend, save_linear_model
+from .batcher import MicroBatcher
+from .cache import PredictionCache
+from .client import MLClient, get_ml_client, reset_ml_client
+from .jobs import claim_jobs, enqueue_analysis, labeled_since_queued, process_queue
+from .models import TOXICITY_LABELS, AnalysisJob, ToxicityParameters
+from .services import save_predictions
+from .thresholds import get_thresholds, relabel_from_scores
+
+
+def prediction(insult_score, toxic_score=None):
+    """
+    A prediction labeled with the default thresholds; toxic_score None stores no toxic score.
+    """
+    scores = {label: 0.1 for label in TOXICITY_LABELS}
+    scores['insult'] = insult_score
+    scores['toxic'] = toxic_score
+    labels = {label: score is not None and score >= 0.5 for label, score in scores.items()}
+    return {**labels, 'probabilities': scores}
+
+
+class RelabelFromScoresTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_user('admin', password='x')
+        self.post = FacebookPost.objects.create(post_id='1_1', message='post', created_at=timezone.now(), fetched_by=admin)
+        self.posts = FacebookPost.objects.all()
+        comments = FacebookComment.objects.bulk_create([
+            FacebookComment(post=self.post, comment_id=f'1_{i}', user_name=f'user{i}', content=f'comment {i}', created_at=timezone.now())
+            for i in range(10)
+        ])
+        # Insult scores 0.0 to 0.9: 5 insults at the default threshold of 0.5
+        save_predictions((comment.id, prediction(i / 10, toxic_score=i / 10)) for i, comment in enumerate(comments))
+
+    def labeled(self, label):
+        return ToxicityParameters.objects.filter(**{label: True}).count()
+
+    def test_get_thresholds(self):
+        self.assertEqual(get_thresholds({'insult': 0.7})['insult'], 0.7)
+        self.assertEqual(get_thresholds()['toxic'], 0.5)
+        with self.assertRaises(ValueError):
+            get_thresholds({'rude': 0.5})
+        with self.assertRaises(ValueError):
+            get_thresholds({'insult': 1.5})
+
+    def test_relabel(self):
+        summary = relabel_from_scores(thresholds={'insult': 0.75, 'toxic': 0.25}, chunk_size=3)
+        self.assertEqual(summary['scanned'], 10)
+        self.assertEqual(summary['flips']['insult'], {'on': 0, 'off': 3})
+        self.assertEqual(summary['flips']['toxic'], {'on': 2, 'off': 0})
+        self.assertEqual(summary['changed'], 5)
+        self.assertEqual(self.labeled('insult'), 2)
+        self.assertEqual(self.labeled('toxic'), 7)
+        self.assertEqual(toxicity_label_counts(self.posts), scan_toxicity_label_counts(self.posts))
+
+    def test_dry_run(self):
+        summary = relabel_from_scores(thresholds={'insult': 0.75}, dry_run=True)
+        self.assertEqual(summary['changed'], 3)
+        self.assertEqual(self.labeled('insult'), 5)
+
+    def test_missing_scores_keep_labels(self):
+        comment = FacebookComment.objects.get(comment_id='1_9')
+        save_predictions([(comment.id, prediction(0.9, toxic_score=None) | {'toxic': True})])
+        relabel_from_scores(thresholds={'toxic': 0.95})
+        self.assertTrue(ToxicityParameters.objects.get(comment=comment).toxic)
+        self.assertEqual(self.labeled('toxic'), 1)
+
+    def test_manual_labels(self):
+        ToxicityParameters.objects.filter(comment__comment_id='1_9').update(manually_tagged=True)
+        relabel_from_scores(thresholds={'insult': 0.95})
+        self.assertEqual(self.labeled('insult'), 1)
+        relabel_from_scores(thresholds={'insult': 0.95}, include_manual=True)
+        self.assertEqual(self.labeled('insult'), 0)
+        self.assertEqual(toxicity_label_counts(self.posts), scan_toxicity_label_counts(self.posts))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('rethreshold', '--threshold', 'insult=0.75', stdout=out)
+        self.assertIn("Relabeled 3 of 10 comments", out.getvalue())
+        self.assertEqual(self.labeled('insult'), 2)
+        with self.assertRaises(CommandError):
+            call_command('rethreshold', '--threshold', 'insult=high', stdout=out)
+        with self.assertRaises(CommandError):
+            call_command('rethreshold', '--threshold', 'rude=0.5', stdout=out)
+
+
+class SavePredictionsTests(TestCase):
+    def setUp(self):
+        post = FacebookPost.objects.create(post_id='1_1', message='post', created_at=timezone.now())
+        self.comments = FacebookComment.objects.bulk_create([
+            FacebookComment(post=post, comment_id=f'1_{i}', user_name=f'user{i}', content=f'comment {i}', created_at=timezone.now())
+            for i in range(4)
+        ])
+
+    def test_deleted_comment_is_skipped(self):
+        deleted = self.comments[1]
+        FacebookComment.objects.filter(id=deleted.id).delete()
+        counts = save_predictions((comment.id, prediction(0.9)) for comment in self.comments)
+        self.assertEqual(counts, {'inserted': 3, 'updated': 0, 'failed': 1})
+        self.assertEqual(ToxicityParameters.objects.count(), 3)
+        counts = save_predictions((comment.id, prediction(0.1)) for comment in self.comments)
+        self.assertEqual(counts, {'inserted': 0, 'updated': 3, 'failed': 1})
+
+    def test_comment_deleted_during_analysis(self):
+        enqueue_analysis([comment.id for comment in self.comments])
+        deleted = self.comments[2]
+
+        def predict_and_delete(comments, clusters=None):
+            # A moderator deletes one of the comments while the model scores the batch
+            FacebookComment.objects.filter(id=deleted.id).delete()
+            return {comment.id: prediction(0.9) for comment in comments}
+
+        with mock.patch('ml_integration.jobs.predict_comment_batch', predict_and_delete):
+            claimed, finished = process_queue(threads=1)
+        self.assertEqual((claimed, finished), (4, 3))
+        self.assertEqual(ToxicityParameters.objects.count(), 3)
+        self.assertEqual(list(AnalysisJob.objects.values_list('status', flat=True).distinct()), ['done'])
+
+
+def predict_all(comments, clusters=None):
+    return {comment.id: prediction(0.9) for comment in comments}
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        post = FacebookPost.objects.create(post_id='1_1', message='post', created_at=timezone.now())
+        self.comments = FacebookComment.objects.bulk_create([
+            FacebookComment(post=post, comment_id=f'1_{i}', user_name=f'user{i}', content=f'comment {i}', created_at=timezone.now())
+            for i in range(5)
+        ])
+        self.ids = [comment.id for comment in self.comments]
+
+    def statuses(self):
+        return dict(AnalysisJob.objects.values_list('comment_id', 'status'))
+
+    def test_enqueue_skips_active_jobs(self):
+        self.assertEqual(enqueue_analysis(self.ids[:3], chunk_size=2), 3)
+        self.assertEqual(enqueue_analysis(self.ids, chunk_size=2), 2)
+        self.assertEqual(enqueue_analysis(self.ids), 0)
+        # Finished jobs do not block a new analysis of the same comment
+        AnalysisJob.objects.filter(comment_id=self.ids[0]).update(status='done')
+        self.assertEqual(enqueue_analysis(self.ids), 1)
+        self.assertEqual(AnalysisJob.objects.count(), 6)
+
+    def test_claim_jobs(self):
+        enqueue_analysis(self.ids)
+        first = claim_jobs(3)
+        self.assertEqual([job.comment_id for job in first], self.ids[:3])
+        self.assertEqual({job.status for job in first}, {'running'})
+        self.assertEqual(len({job.worker for job in first}), 1)
+        second = claim_jobs(10)
+        self.assertEqual([job.comment_id for job in second], self.ids[3:])
+        self.assertNotEqual(first[0].worker, second[0].worker)
+        self.assertEqual(claim_jobs(10), [])
+
+    def test_labeled_since_queued(self):
+        save_predictions([(self.ids[0], prediction(0.9))])
+        enqueue_analysis(self.ids[:2])
+        # A prediction stored before the job was queued is not the job's result
+        ToxicityParameters.objects.update(predicted_at=timezone.now() - timedelta(hours=1))
+        save_predictions([(self.ids[1], prediction(0.9))])
+        self.assertEqual(labeled_since_queued(AnalysisJob.objects.all()), {self.ids[1]})
+
+    def test_process_queue(self):
+        enqueue_analysis(self.ids)
+        with mock.patch('ml_integration.jobs.predict_comment_batch', predict_all):
+            self.assertEqual(process_queue(threads=1, batch_size=2), (2, 2))
+            self.assertEqual(process_queue(threads=2, batch_size=2), (3, 3))
+        self.assertEqual(set(self.statuses().values()), {'done'})
+        self.assertEqual(ToxicityParameters.objects.count(), 5)
+
+    def test_failed_predictions(self):
+        enqueue_analysis(self.ids)
+        with mock.patch('ml_integration.jobs.predict_comment_batch', lambda comments, clusters=None: {c.id: None for c in comments}):
+            self.assertEqual(process_queue(threads=1, batch_size=5), (5, 0))
+        self.assertEqual(set(self.statuses().values()), {'failed'})
+
+    def test_busy_database_requeues_jobs(self):
+        enqueue_analysis(self.ids)
+        with mock.patch('ml_integration.jobs.predict_comment_batch', predict_all), \
+                mock.patch('ml_integration.jobs.save_predictions', side_effect=OperationalError("database is locked")):
+            self.assertEqual(process_queue(threads=1, batch_size=5), (5, 0))
+        self.assertEqual(set(self.statuses().values()), {'queued'})
+        self.assertFalse(AnalysisJob.objects.exclude(worker='').exists())
+        self.assertFalse(AnalysisJob.objects.filter(started_at__isnull=False).exists())
+        # The next round picks them up again
+        with mock.patch('ml_integration.jobs.predict_comment_batch', predict_all):
+            self.assertEqual(process_queue(threads=1, batch_size=5), (5, 5))
+
+
+class FakeBackend:
+    """
+    Records each call's texts and holds every call until `release` is set.
+    """
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.release = threading.Event()
+        self.error = error
+
+    def predict(self, text):
+        return self.predict_many([text])[0]['prediction']
+
+    def predict_many(self, texts):
+        self.calls.append(list(texts))
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        return [{'comment': text, 'prediction': {'text': text}} for text in texts]
+
+
+@override_settings(ML_MICROBATCH_MAX_WAIT_MS=10000, ML_MICROBATCH_MAX_SIZE=3)
+class MicroBatcherTests(TestCase):
+    def setUp(self):
+        self.backend = FakeBackend()
+        patcher = mock.patch('ml_integration.batcher.get_inference_backend', return_value=self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.batcher = MicroBatcher()
+        self.results = {}
+
+    def start(self, text):
+        def run():
+            try:
+                self.results[text] = self.batcher.predict(text)
+            except Exception as e:
+                self.results[text] = e
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "Timed out")
+            time.sleep(0.005)
+
+    def join(self, threads):
+        for thread in threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive(), "A caller is still waiting")
+
+    def test_lone_request_is_sent_at_once(self):
+        self.backend.release.set()
+        started = time.monotonic()
+        self.assertEqual(self.batcher.predict('a'), {'text': 'a'})
+        # No wait for ML_MICROBATCH_MAX_WAIT_MS when nothing else is in flight
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(self.backend.calls, [['a']])
+        self.assertEqual((self.batcher.batches, self.batcher.items), (1, 1))
+
+    def test_concurrent_requests_are_merged(self):
+        threads = [self.start('lead')]
+        self.wait_for(lambda: len(self.backend.calls) == 1)
+        texts = [f'text {i}' for i in range(7)]
+        for text in texts:
+            threads.append(self.start(text))
+        # Two full batches go out at once; the seventh text waits for the batches in flight
+        self.wait_for(lambda: len(self.backend.calls) == 3 and self.batcher._pending and len(self.batcher._pending.texts) == 1)
+        self.backend.release.set()
+        self.join(threads)
+
+        self.assertEqual([len(call) for call in self.backend.calls], [1, 3, 3, 1])
+        self.assertEqual(sorted(text for call in self.backend.calls for text in call), sorted(texts + ['lead']))
+        self.assertEqual(self.results, {text: {'text': text} for text in texts + ['lead']})
+        self.assertEqual((self.batcher.batches, self.batcher.items), (4, 8))
+
+    def test_errors_reach_every_caller_of_the_batch(self):
+        threads = [self.start('lead')]
+        self.wait_for(lambda: len(self.backend.calls) == 1)
+        self.backend.error = InferenceError("Model unavailable")
+        for text in ['a', 'b']:
+            threads.append(self.start(text))
+        self.wait_for(lambda: self.batcher._pending and len(self.batcher._pending.texts) == 2)
+        self.backend.release.set()
+        self.join(threads)
+        for text in ['lead', 'a', 'b']:
+            self.assertIsInstance(self.results[text], InferenceError)
+
+        # Nothing is left in flight, so the next request is sent at once
+        self.backend.error = None
+        self.assertEqual(self.batcher.predict('c'), {'text': 'c'})
+        self.assertEqual(self.batcher._in_flight, 0)
+
+    def test_unexpected_errors_do_not_hang_followers(self):
+        self.backend.error = RuntimeError("Backend crashed")
+        threads = [self.start('lead')]
+        self.wait_for(lambda: len(self.backend.calls) == 1)
+        for text in ['a', 'b']:
+            threads.append(self.start(text))
+        self.wait_for(lambda: self.batcher._pending and len(self.batcher._pending.texts) == 2)
+        self.backend.release.set()
+        self.join(threads)
+        # The leader of a batch sees the original error, its followers an InferenceError
+        self.assertIsInstance(self.results['lead'], RuntimeError)
+        self.assertEqual({type(self.results[text]) for text in ['a', 'b']}, {RuntimeError, InferenceError})
+
+
+class PredictionCacheTests(TestCase):
+    def setUp(self):
+        self.cache = PredictionCache(model_version='test')
+        self.cache.backend.clear()
+        self.addCleanup(self.cache.backend.clear)
+
+    def test_key_normalizes_text(self):
+        self.assertEqual(self.cache.key('  Hello\tWORLD \n'), self.cache.key('hello world'))
+        self.assertEqual(self.cache.key('ﬁne'), self.cache.key('fine'))  # NFKC folds the ligature
+        self.assertNotEqual(self.cache.key('hello world'), self.cache.key('hello world!'))
+        self.assertNotEqual(self.cache.key('hello'), PredictionCache(model_version='other').key('hello'))
+
+    def test_get_set_and_stats(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set('a', {'toxic': True})
+        self.cache.set_many({'c': {'toxic': False}})
+        self.assertEqual(self.cache.get('A'), {'toxic': True})
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), [{'toxic': True}, None, {'toxic': False}])
+        self.assertEqual(self.cache.stats(), {'hits': 3, 'misses': 2, 'hit_rate': 0.6})
+
+    def test_key_follows_the_backend_model(self):
+        cache = PredictionCache()
+        backend = mock.Mock(cache_version='linear-1-aaaa')
+        with mock.patch('ml_integration.backends.get_inference_backend', return_value=backend):
+            cache.set('a', {'toxic': True})
+            self.assertEqual(cache.get('a'), {'toxic': True})
+            # A reloaded model must not be answered with its predecessor's predictions
+            backend.cache_version = 'linear-1-bbbb'
+            self.assertIsNone(cache.get('a'))
+
+    def test_replaced_model_file_changes_the_version(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.npz')
+            model = dict(vocabulary=['idiot'], idf=[1.0], intercept=[0.0] * 6, model_version='v1')
+            save_linear_model(path, coef=[[1.0]] * 6, **model)
+            first = LinearBackend(path).cache_version
+            self.assertEqual(LinearBackend(path).cache_version, first)
+            self.assertTrue(first.startswith('linear-v1-'))
+            # Retrained, but exported under the same model_version
+            save_linear_model(path, coef=[[2.0]] * 6, **model)
+            self.assertNotEqual(LinearBackend(path).cache_version, first)
+
+    def test_unloadable_model_is_a_miss(self):
+        with mock.patch('ml_integration.backends.get_inference_backend', return_value=LinearBackend('/missing.npz')):
+            self.assertIsNone(self.cache.get('a'))
+            self.assertIsNone(PredictionCache().get('a'))
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    Fails the first `failures` requests with a 503, then answers like the ML service.
+    """
+
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+    failures = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append((self.path, self.client_address, body))
+        if len(self.server.requests) <= self.server.failures:
+            self.respond(503, {'error': 'busy'})
+        else:
+            self.respond(200, {'toxic': body['text'] == 'idiot'})
+
+    def respond(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MLClientTests(TestCase):
+    def start_service(self, failures=0):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), ServiceHandler)
+        server.requests = []
+        server.failures = failures
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, f"http://127.0.0.1:{server.server_port}"
+
+    def ml_client(self, url, **kwargs):
+        client = MLClient(base_url=url, backoff_factor=0, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_session_is_pooled_and_retrying(self):
+        client = self.ml_client('http://ml.local', pool_size=4, retries=2)
+        adapter = client.session.get_adapter('http://ml.local/predict')
+        self.assertIs(adapter, client.session.get_adapter('https://ml.local/predict'))
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter.max_retries.total, 2)
+        self.assertEqual(set(adapter.max_retries.status_forcelist), {500, 502, 503, 504})
+        self.assertIsNone(adapter.max_retries.allowed_methods)  # POST is retried too
+
+    def test_connection_is_reused(self):
+        server, url = self.start_service()
+        client = self.ml_client(url)
+        self.assertEqual(client.predict('idiot'), {'toxic': True})
+        self.assertEqual(client.predict('hello'), {'toxic': False})
+        self.assertEqual(len({address for path, address, body in server.requests}), 1)
+
+    def test_server_errors_are_retried(self):
+        server, url = self.start_service(failures=2)
+        self.assertEqual(self.ml_client(url, retries=2).predict('idiot'), {'toxic': True})
+        self.assertEqual([path for path, address, body in server.requests], ['/predict'] * 3)
+
+    def test_gives_up_after_the_retries(self):
+        server, url = self.start_service(failures=10)
+        with self.assertRaises(requests.HTTPError):
+            self.ml_client(url, retries=1).predict('idiot')
+        self.assertEqual(len(server.requests), 2)
+
+    def test_backend_reports_unreachable_service(self):
+        server, url = self.start_service()
+        server.shutdown()
+        server.server_close()
+        with self.assertRaises(InferenceError):
+            HTTPBackend(self.ml_client(url, retries=0)).predict('idiot')
+
+    def test_client_is_shared_until_reset(self):
+        client = get_ml_client()
+        self.assertIs(get_ml_client(), client)
+        with mock.patch.object(client, 'close') as close:
+            reset_ml_client()
+        close.assert_called_once()
+        self.assertIsNot(get_ml_client(), client)
+        reset_ml_client()
@@ -0,0 +1,99 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from comments.rollups import bump_rollups, prediction_deltas
+from comments.rules import queue_rule_actions
+from .models import SCORE_FIELDS, TOXICITY_LABELS, ToxicityParameters
+
+# functions = get_thresholds, relabel_from_scores
+
+
+def get_thresholds(overrides=None):
+    """
+    Returns the score threshold of every label: settings.ML_LABEL_THRESHOLDS with `overrides` applied.
+
+    Raises:
+        ValueError: For an unknown label or a threshold outside [0, 1].
+    """
+    thresholds = {**settings.ML_LABEL_THRESHOLDS, **(overrides or {})}
+    for label, threshold in thresholds.items():
+        if label not in TOXICITY_LABELS:
+            raise ValueError(f"Unknown label: {label}")
+        if not 0 <= threshold <= 1:
+            raise ValueError(f"Threshold for {label} must be between 0 and 1, got {threshold}")
+    return thresholds
+
+
+def relabel_from_scores(queryset=None, thresholds=None, chunk_size=20000, dry_run=False, include_manual=False):
+    """
+    Recomputes labels from stored probability scores, without calling the model.
+
+    Rows are read in keyset chunks into NumPy arrays and compared against the thresholds
+    in one vectorized step. Only rows whose labels changed are written, with one UPDATE
+    per distinct new label combination, and the toxicity rollups move with them. Labels
+    without a stored score keep their current value.
+
+    Args:
+        queryset (QuerySet): ToxicityParameters to relabel. Defaults to all of them.
+        thresholds (dict): Per-label threshold overrides, e.g. {'insult': 0.7}.
+        chunk_size (int): Rows per chunk.
+        dry_run (bool): Count the changes without writing them.
+        include_manual (bool): Also relabel rows whose labels a moderator set by hand.
+
+    Returns:
+        dict: Rows scanned and changed, plus per-label flips {'label': {'on': n, 'off': n}}.
+    """
+    thresholds = get_thresholds(thresholds)
+    limits = np.array([thresholds[label] for label in TOXICITY_LABELS])
+    queryset = ToxicityParameters.objects.all() if queryset is None else queryset
+    if not include_manual:
+        queryset = queryset.filter(manually_tagged=False)
+    columns = ['id', 'comment_id', 'comment__post_id', 'predicted_at'] + TOXICITY_LABELS + SCORE_FIELDS
+
+    summary = {
+        'scanned': 0,
+        'changed': 0,
+        'flips': {label: {'on': 0, 'off': 0} for label in TOXICITY_LABELS},
+    }
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list(*columns)[:chunk_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        summary['scanned'] += len(rows)
+
+        old = np.array([row[4:10] for row in rows], dtype=bool)
+        scores = np.array([row[10:16] for row in rows], dtype=float)  # Missing scores become NaN
+        new = np.where(np.isnan(scores), old, scores >= limits)
+        changed = np.flatnonzero((new != old).any(axis=1))
+        if not len(changed):
+            continue
+
+        summary['changed'] += len(changed)
+        for index, label in enumerate(TOXICITY_LABELS):
+            summary['flips'][label]['on'] += int((new[changed, index] & ~old[changed, index]).sum())
+            summary['flips'][label]['off'] += int((old[changed, index] & ~new[changed, index]).sum())
+        if dry_run:
+            continue
+
+        # Group the changed rows by their new label combination: at most 64 UPDATEs per chunk
+        groups = {}
+        predictions = {}
+        previous = {}
+        post_ids = {}
+        for position in changed:
+            row = rows[position]
+            labels = dict(zip(TOXICITY_LABELS, new[position].tolist()))
+            groups.setdefault(tuple(labels.values()), []).append(row[0])
+            predictions[row[1]] = labels
+            previous[row[1]] = (row[3], dict(zip(TOXICITY_LABELS, old[position].tolist())))
+            post_ids[row[1]] = row[2]
+        with transaction.atomic():
+            for values, ids in groups.items():
+                ToxicityParameters.objects.filter(id__in=ids).update(**dict(zip(TOXICITY_LABELS, values)))
+            bump_rollups(prediction_deltas(predictions, previous, post_ids))
+        # Newly flagged comments go through the auto-moderation rules like fresh predictions
+        queue_rule_actions(predictions.items())
+    return summary
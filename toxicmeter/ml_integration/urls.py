@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     path('', views.predict_toxicity_single, name='predict_toxicity_single'),
     path('bulk/', views.predict_toxicity_bulk, name='predict_toxicity_bulk'),
+    path('jobs/status/', views.analysis_job_status, name='analysis_job_status'),
+    path('health/', views.model_health_status, name='model_health_status'),
 ]
\ No newline at end of file
@@ -1,5 +1,9 @@
 from django.shortcuts import render,get_object_or_404, redirect
 from django.http import JsonResponse
+from django.contrib.auth.decorators import login_required
+from .cache import prediction_cache
+from .health import get_model_health
+from .jobs import job_counts
 from .services import store_single_prediction, store_bulk_predictions
 
 # View for single comment prediction
@@ -20,9 +24,27 @@ def predict_toxicity_bulk(request):
     """
     if request.method == "POST":
         comment_ids = request.POST.getlist('comment_ids[]', [])
-        success = store_bulk_predictions(comment_ids)
-        if success:
+        summary = store_bulk_predictions(comment_ids)
+        if not summary['failed'] and not summary['error']:
             return JsonResponse({"message": "Predictions stored successfully for selected comments."}, status=200)
         else:
             return JsonResponse({"message": "An error occurred while storing predictions."}, status=400)
     return JsonResponse({"message": "Invalid request method."}, status=405)
+
+
+# View for analysis queue status
+@login_required
+def analysis_job_status(request):
+    """
+    Reports how many analysis jobs are queued, running and finished, overall and for the current user.
+    """
+    return JsonResponse({"all": job_counts(), "mine": job_counts(request.user)}, status=200)
+
+# View for ML service health
+@login_required
+def model_health_status(request):
+    """
+    Reports the cached ML service health status; never waits on the service itself.
+    Also reports this process's prediction cache hit and miss counts.
+    """
+    return JsonResponse({**get_model_health(), 'prediction_cache': prediction_cache.stats()}, status=200)
@@ -0,0 +1,74 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .recorder import current_profile, record_profile, start_profile, stop_profile
+
+
+def _is_admin(user):
+    if user is None or not user.is_authenticated:
+        return False
+    userprofile = getattr(user, 'userprofile', None)
+    return user.is_staff or (userprofile is not None and userprofile.role == 'admin')
+
+
+class ProfilingMiddleware:
+    """
+    Records the query count, database time, outbound HTTP time and view time of every
+    request into the in-memory ring buffer shown at /profiling/.
+
+    Goes first in MIDDLEWARE so the total covers the other middleware too. Queries run
+    while a streaming response is consumed happen after the request is recorded and are
+    not counted. Disabled unless settings.PROFILING_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path.startswith(tuple(settings.PROFILING_IGNORE_PATHS)):
+            return self.get_response(request)
+
+        profile, token = start_profile(request.method, request.path)
+        started = time.perf_counter()
+
+        def execute(run, sql, params, many, context):
+            query_started = time.perf_counter()
+            try:
+                return run(sql, params, many, context)
+            finally:
+                profile.add_query(sql, time.perf_counter() - query_started)
+
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(execute))
+                response = self.get_response(request)
+        finally:
+            stop_profile(token)
+
+        finished = time.perf_counter()
+        profile.total_ms = (finished - started) * 1000
+        if profile.view_started is not None:
+            profile.view_ms = (finished - profile.view_started) * 1000
+        profile.status = response.status_code
+        if request.resolver_match:
+            profile.view = request.resolver_match.view_name
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            profile.user = user.get_username()
+        record_profile(profile)
+        # Timings reveal server internals, so other clients never get the header
+        if settings.PROFILING_SERVER_TIMING and _is_admin(user):
+            response['Server-Timing'] = profile.server_timing()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = current_profile()
+        if profile is not None:
+            profile.view_started = time.perf_counter()
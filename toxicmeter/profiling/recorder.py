@@ -0,0 +1,203 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# functions = start_profile, stop_profile, current_profile, track_http, record_profile, recent_profiles, summarize_profiles, clear_profiles
+
+# Profile of the request being handled. A ContextVar, so threads that copy the request's
+# context (e.g. the Graph API page prefetch) add to the same profile.
+_current = contextvars.ContextVar('request_profile', default=None)
+
+_profiles = None
+_profiles_lock = threading.Lock()
+
+
+class RequestProfile:
+    """
+    Where the time of one request went: total, view, database and outbound HTTP.
+    """
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.view = None
+        self.status = None
+        self.user = None
+        self.started_at = timezone.now()
+        self.total_ms = 0.0
+        self.view_ms = 0.0
+        self.view_started = None  # perf_counter() when the view was called
+        self.db_queries = 0
+        self.db_ms = 0.0
+        self.http = {}  # Service name -> {'calls': n, 'ms': total}
+        self._statements = Counter()
+        self._lock = threading.Lock()
+
+    def add_query(self, sql, seconds):
+        with self._lock:
+            self.db_queries += 1
+            self.db_ms += seconds * 1000
+            self._statements[sql] += 1
+
+    def add_http(self, service, seconds):
+        with self._lock:
+            calls = self.http.setdefault(service, {'calls': 0, 'ms': 0.0})
+            calls['calls'] += 1
+            calls['ms'] += seconds * 1000
+
+    @property
+    def http_ms(self):
+        return sum(calls['ms'] for calls in self.http.values())
+
+    def repeated_queries(self, limit=3):
+        """
+        The statements run most often with different parameters, the usual sign of an N+1 loop.
+        """
+        with self._lock:
+            common = self._statements.most_common(limit)
+        return [{'sql': sql[:300], 'count': count} for sql, count in common if count > 1]
+
+    def server_timing(self):
+        """
+        Value of a Server-Timing header, shown per request in the browser's network panel.
+        """
+        metrics = [f"view;dur={self.view_ms:.1f}", f'db;dur={self.db_ms:.1f};desc="{self.db_queries} queries"']
+        metrics += [f'{service};dur={calls["ms"]:.1f};desc="{calls["calls"]} calls"' for service, calls in self.http.items()]
+        return ", ".join(metrics)
+
+    def as_dict(self):
+        return {
+            'method': self.method,
+            'path': self.path,
+            'view': self.view,
+            'status': self.status,
+            'user': self.user,
+            'started_at': self.started_at,
+            'total_ms': round(self.total_ms, 1),
+            'view_ms': round(self.view_ms, 1),
+            'db_queries': self.db_queries,
+            'db_ms': round(self.db_ms, 1),
+            'http': {service: {'calls': calls['calls'], 'ms': round(calls['ms'], 1)} for service, calls in self.http.items()},
+            'http_ms': round(self.http_ms, 1),
+            'repeated_queries': self.repeated_queries(),
+        }
+
+
+def start_profile(method, path):
+    """
+    Starts profiling a request in the current context.
+
+    Returns:
+        tuple: The new RequestProfile and the token to pass to stop_profile.
+    """
+    profile = RequestProfile(method, path)
+    return profile, _current.set(profile)
+
+
+def stop_profile(token):
+    _current.reset(token)
+
+
+def current_profile():
+    return _current.get()
+
+
+@contextmanager
+def track_http(service):
+    """
+    Times an outbound HTTP call and adds it to the profile of the current request, if any.
+
+    Args:
+        service (str): Name the call is reported under, e.g. 'ml' or 'graph'.
+    """
+    profile = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.add_http(service, time.perf_counter() - started)
+
+
+def record_profile(profile):
+    """
+    Adds a finished request to the ring buffer and logs it when it crosses
+    settings.PROFILING_SLOW_MS or settings.PROFILING_MAX_QUERIES.
+    """
+    global _profiles
+    with _profiles_lock:
+        if _profiles is None or _profiles.maxlen != settings.PROFILING_BUFFER_SIZE:
+            _profiles = deque(_profiles or (), maxlen=settings.PROFILING_BUFFER_SIZE)
+        _profiles.append(profile)
+
+    slow = settings.PROFILING_SLOW_MS and profile.total_ms >= settings.PROFILING_SLOW_MS
+    chatty = settings.PROFILING_MAX_QUERIES and profile.db_queries >= settings.PROFILING_MAX_QUERIES
+    if slow or chatty:
+        repeated = profile.repeated_queries(limit=1)
+        logger.warning(
+            "%s request %s %s (%s): %.0f ms total, %d queries in %.0f ms, %.0f ms outbound HTTP%s",
+            "Slow" if slow else "Chatty",
+            profile.method,
+            profile.path,
+            profile.view,
+            profile.total_ms,
+            profile.db_queries,
+            profile.db_ms,
+            profile.http_ms,
+            f"; repeated {repeated[0]['count']}x: {repeated[0]['sql']}" if repeated else "",
+        )
+
+
+def recent_profiles(limit=None):
+    """
+    Returns the buffered profiles, newest first.
+    """
+    with _profiles_lock:
+        profiles = list(_profiles or ())
+    profiles.reverse()
+    return profiles[:limit] if limit else profiles
+
+
+def clear_profiles():
+    with _profiles_lock:
+        if _profiles is not None:
+            _profiles.clear()
+
+
+def summarize_profiles(profiles):
+    """
+    Aggregates profiles per view, slowest p95 first.
+
+    Returns:
+        list: One dict per view with request count, p50/p95 total time, average and maximum
+        query count, and average database and outbound HTTP time.
+    """
+    by_view = {}
+    for profile in profiles:
+        by_view.setdefault(profile.view or profile.path, []).append(profile)
+
+    summary = []
+    for view, group in by_view.items():
+        total = np.array([profile.total_ms for profile in group])
+        queries = np.array([profile.db_queries for profile in group])
+        summary.append({
+            'view': view,
+            'requests': len(group),
+            'p50_ms': round(float(np.percentile(total, 50)), 1),
+            'p95_ms': round(float(np.percentile(total, 95)), 1),
+            'avg_queries': round(float(queries.mean()), 1),
+            'max_queries': int(queries.max()),
+            'avg_db_ms': round(float(np.mean([profile.db_ms for profile in group])), 1),
+            'avg_http_ms': round(float(np.mean([profile.http_ms for profile in group])), 1),
+        })
+    summary.sort(key=lambda row: row['p95_ms'], reverse=True)
+    return summary
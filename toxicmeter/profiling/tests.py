@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SERVER_TIMING=True)
+class ServerTimingTests(TestCase):
+    def test_anonymous_clients_get_no_timings(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_moderators_get_no_timings(self):
+        self.client.force_login(User.objects.create_user('mod', password='x'))
+        self.assertNotIn('Server-Timing', self.client.get(reverse('dashboard')))
+
+    def test_admins_and_staff_get_timings(self):
+        admin = User.objects.create_user('admin', password='x')
+        admin.userprofile.role = 'admin'
+        admin.userprofile.save()
+        staff = User.objects.create_user('staff', password='x', is_staff=True)
+        for user in (admin, staff):
+            self.client.force_login(user)
+            self.assertIn('db;dur=', self.client.get(reverse('dashboard'))['Server-Timing'])
+
+    @override_settings(PROFILING_SERVER_TIMING=False)
+    def test_header_can_be_turned_off(self):
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        self.assertNotIn('Server-Timing', self.client.get(reverse('dashboard')))
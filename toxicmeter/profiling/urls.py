@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('', views.request_profiles, name='request_profiles'),
+    path('requests.json', views.request_profiles_json, name='request_profiles_json'),
+]
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import redirect, render
+
+from .recorder import clear_profiles, recent_profiles, summarize_profiles
+
+
+def _limit(request, default=100):
+    try:
+        return max(int(request.GET.get('limit', default)), 1)
+    except ValueError:
+        return default
+
+
+# Admin: per-view timings and the most recent requests
+@login_required
+def request_profiles(request):
+    """
+    Shows the request profiles held in this process's ring buffer, aggregated per view
+    and as the most recent requests. POST clears the buffer.
+    """
+    if request.user.userprofile.role != 'admin':
+        messages.error(request, "Only Admins can view request profiles.")
+        return redirect('dashboard')
+
+    if request.method == 'POST':
+        clear_profiles()
+        messages.success(request, "Request profiles cleared.")
+        return redirect('request_profiles')
+
+    profiles = recent_profiles()
+    return render(request, 'profiling/requests.html', {
+        'enabled': settings.PROFILING_ENABLED,
+        'summary': summarize_profiles(profiles),
+        'profiles': [profile.as_dict() for profile in profiles[:_limit(request)]],
+        'buffered': len(profiles),
+        'buffer_size': settings.PROFILING_BUFFER_SIZE,
+        'slow_ms': settings.PROFILING_SLOW_MS,
+        'max_queries': settings.PROFILING_MAX_QUERIES,
+    })
+
+
+# Admin: the same data as JSON
+@login_required
+def request_profiles_json(request):
+    """
+    Returns the per-view summary and the most recent request profiles (?limit=, default 100).
+    """
+    if request.user.userprofile.role != 'admin':
+        return JsonResponse({"message": "Only Admins can view request profiles."}, status=403)
+
+    profiles = recent_profiles()
+    return JsonResponse({
+        'enabled': settings.PROFILING_ENABLED,
+        'summary': summarize_profiles(profiles),
+        'requests': [profile.as_dict() for profile in profiles[:_limit(request)]],
+    }, status=200)
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
     'facebook',
     'comments',
     'ml_integration',
+    'benchmarks',
+    'profiling',
     'tailwind',
     'theme',
     'django_browser_reload',
@@ -53,6 +55,7 @@ INTERNAL_IPS = ['127.0.0.1']
 NPM_BIN_PATH = "C:/Program Files/nodejs/npm.cmd"
 
 MIDDLEWARE = [
+    "profiling.middleware.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -95,9 +98,32 @@ DATABASES = {
     "default": {
     "ENGINE": "django.db.backends.sqlite3",
     "NAME": BASE_DIR / "db.sqlite3",
+    # Seconds to wait for a lock; the analysis worker and sync_page write from several threads.
+    # IMMEDIATE transactions take the write lock up front, so they wait for it instead of
+    # failing at once when a statement that has already read needs to write.
+    "OPTIONS": {"timeout": 20, "transaction_mode": "IMMEDIATE"},
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Model predictions: least recently used entries are culled once MAX_ENTRIES is reached
+    "predictions": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "predictions",
+        "TIMEOUT": int(os.getenv("ML_PREDICTION_CACHE_TTL", 60 * 60 * 24)),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("ML_PREDICTION_CACHE_SIZE", 50000)),
+            "CULL_FREQUENCY": 10,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -140,3 +166,97 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR,"static")]
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# ML service integration
+# Predictions come from the inference backend named by ML_BACKEND (ml_integration.backends):
+# "http" calls the Flask ML service, "linear" and "onnx" score in-process with the exported
+# model at ML_MODEL_PATH, loaded once per worker process.
+
+ML_BACKEND = os.getenv("ML_BACKEND", "http")
+ML_MODEL_PATH = os.getenv("ML_MODEL_PATH", "")  # .npz from save_linear_model, or an .onnx file
+ML_ONNX_THREADS = int(os.getenv("ML_ONNX_THREADS", 1))  # Threads per ONNX session, 0 lets ONNX Runtime decide
+ML_ONNX_OUTPUT = os.getenv("ML_ONNX_OUTPUT", "")  # Probabilities output, defaults to the model's last output
+
+# The Flask ML service is reached through a pooled keep-alive client (ml_integration.client).
+
+ML_SERVICE_URL = os.getenv("ML_SERVICE_URL", "http://127.0.0.1:5000")
+ML_SERVICE_TIMEOUT = float(os.getenv("ML_SERVICE_TIMEOUT", 10))  # Seconds, single predictions
+ML_SERVICE_BULK_TIMEOUT = float(os.getenv("ML_SERVICE_BULK_TIMEOUT", 60))  # Seconds, per bulk batch
+ML_SERVICE_POOL_SIZE = int(os.getenv("ML_SERVICE_POOL_SIZE", 10))
+ML_SERVICE_RETRIES = int(os.getenv("ML_SERVICE_RETRIES", 3))
+ML_SERVICE_BACKOFF = float(os.getenv("ML_SERVICE_BACKOFF", 0.5))
+
+# The service's /health probe is cached and refreshed in the background (ml_integration.health);
+# pages only read the cached status, which is re-probed once it is older than ML_HEALTH_TTL.
+ML_HEALTH_TIMEOUT = float(os.getenv("ML_HEALTH_TIMEOUT", 2))  # Seconds
+ML_HEALTH_TTL = int(os.getenv("ML_HEALTH_TTL", 30))  # Seconds
+
+# Predictions are cached on normalized comment text + the backend's model version (ml_integration.cache).
+# The in-process backends key on the loaded model file's version and digest; for the ML service,
+# bump ML_MODEL_VERSION when the served model changes so stale predictions are not reused.
+ML_MODEL_VERSION = os.getenv("ML_MODEL_VERSION", "1")
+ML_PREDICTION_CACHE = "predictions"
+
+# Score thresholds used by the in-process backends and by `manage.py rethreshold` to relabel
+# comments from their stored scores.
+ML_LABEL_THRESHOLDS = {
+    "toxic": 0.5,
+    "severe_toxic": 0.5,
+    "obscene": 0.5,
+    "threat": 0.5,
+    "insult": 0.5,
+    "identity_hate": 0.5,
+}
+
+# Comments are streamed to the inference backend in batches of this size.
+ML_BULK_BATCH_SIZE = int(os.getenv("ML_BULK_BATCH_SIZE", 200))
+
+# Concurrent single-comment predictions are coalesced into one bulk call (ml_integration.batcher).
+# A lone request is sent at once; requests arriving while another batch is being scored wait for
+# it, at most ML_MICROBATCH_MAX_WAIT_MS, and are sent together, up to ML_MICROBATCH_MAX_SIZE at a time.
+ML_MICROBATCH_ENABLED = os.getenv("ML_MICROBATCH_ENABLED", "1") == "1"
+ML_MICROBATCH_MAX_WAIT_MS = float(os.getenv("ML_MICROBATCH_MAX_WAIT_MS", 10))
+ML_MICROBATCH_MAX_SIZE = int(os.getenv("ML_MICROBATCH_MAX_SIZE", 32))
+
+
+# Facebook Graph API
+
+FACEBOOK_GRAPH_API_URL = os.getenv("FACEBOOK_GRAPH_API_URL", "https://graph.facebook.com/v21.0")
+FACEBOOK_GRAPH_TIMEOUT = float(os.getenv("FACEBOOK_GRAPH_TIMEOUT", 30))  # Seconds
+FACEBOOK_GRAPH_POOL_SIZE = int(os.getenv("FACEBOOK_GRAPH_POOL_SIZE", 10))
+FACEBOOK_COMMENTS_PAGE_SIZE = int(os.getenv("FACEBOOK_COMMENTS_PAGE_SIZE", 500))  # Comments per Graph API page
+FACEBOOK_POSTS_PAGE_SIZE = int(os.getenv("FACEBOOK_POSTS_PAGE_SIZE", 100))  # Posts per Graph API page
+FACEBOOK_GRAPH_CALLS_PER_MINUTE = int(os.getenv("FACEBOOK_GRAPH_CALLS_PER_MINUTE", 200))  # Rate budget, 0 disables it
+FACEBOOK_SYNC_WORKERS = int(os.getenv("FACEBOOK_SYNC_WORKERS", 4))  # Posts crawled at a time by sync_page
+FACEBOOK_BULK_MODERATION_LIMIT = int(os.getenv("FACEBOOK_BULK_MODERATION_LIMIT", 500))  # Comments per bulk moderation request
+
+
+# Comment lists
+# Lists are paginated with keyset cursors (comments.pagination); their totals are approximate.
+
+COMMENTS_PER_PAGE = int(os.getenv("COMMENTS_PER_PAGE", 10))
+COMMENTS_COUNT_CACHE_TTL = int(os.getenv("COMMENTS_COUNT_CACHE_TTL", 60))  # Seconds a list total is reused, 0 hides totals
+
+# Search backend for post and comment lists (comments.search): "auto" uses FTS5 on SQLite and
+# full-text search on PostgreSQL, "like" forces plain icontains scans.
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+
+# Near-duplicate comments of a post share a cluster key (comments.dedup). Analysis sends one
+# comment per cluster to the inference backend and fans its labels out to the rest.
+COMMENT_DEDUP_ENABLED = os.getenv("COMMENT_DEDUP_ENABLED", "1") == "1"
+COMMENT_DEDUP_MAX_DISTANCE = int(os.getenv("COMMENT_DEDUP_MAX_DISTANCE", 3))  # SimHash bits near-duplicates may differ in
+COMMENT_DEDUP_MIN_LENGTH = int(os.getenv("COMMENT_DEDUP_MIN_LENGTH", 20))  # Shorter canonical texts only cluster when identical
+
+
+# Request profiling
+# Per-request query count, DB time, outbound HTTP time (ML service, Graph API) and view time are
+# kept in a per-process ring buffer, shown to admins at /profiling/ (profiling.middleware).
+# Off by default outside DEBUG; the Server-Timing header is only ever sent to admins and staff.
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "1" if DEBUG else "0") == "1"
+PROFILING_BUFFER_SIZE = int(os.getenv("PROFILING_BUFFER_SIZE", 500))  # Requests kept per process
+PROFILING_SLOW_MS = float(os.getenv("PROFILING_SLOW_MS", 500))  # Log requests slower than this, 0 disables
+PROFILING_MAX_QUERIES = int(os.getenv("PROFILING_MAX_QUERIES", 50))  # Log requests with this many queries, 0 disables
+PROFILING_SERVER_TIMING = os.getenv("PROFILING_SERVER_TIMING", "1" if DEBUG else "0") == "1"  # Add a Server-Timing response header
+PROFILING_IGNORE_PATHS = ["/static/", "/__reload__/", "/profiling/"]
@@ -27,6 +27,7 @@ urlpatterns = [
     path('facebook/', include('facebook.urls')),
     path('comments/', include('comments.urls')),
     path('ml/', include('ml_integration.urls')),
+    path('profiling/', include('profiling.urls')),
 
     path("__reload__/", include("django_browser_reload.urls"))
 ]
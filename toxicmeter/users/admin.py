@@ -1,13 +1,35 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from facebook.models import FacebookPost, FacebookComment
 from ml_integration.models import ToxicityParameters
-from comments.models import CommentStats, DeletedComment
+from ml_integration.thresholds import relabel_from_scores
+from comments.models import CommentStats, DeletedComment, ModerationRule, PendingModeration
 from .models import UserProfile
 
+# Relabels the selected predictions from their stored scores with settings.ML_LABEL_THRESHOLDS
+@admin.action(description="Re-apply label thresholds to stored scores")
+def rethreshold_selected(modeladmin, request, queryset):
+    summary = relabel_from_scores(queryset)
+    flips = ", ".join(
+        f"{label} +{counts['on']}/-{counts['off']}" for label, counts in summary['flips'].items() if counts['on'] or counts['off']
+    )
+    modeladmin.message_user(
+        request,
+        f"Relabeled {summary['changed']} of {summary['scanned']} predictions" + (f" ({flips})." if flips else "."),
+        messages.SUCCESS,
+    )
+
+class ToxicityParametersAdmin(admin.ModelAdmin):
+    list_display = ('comment', 'toxic', 'toxic_score', 'insult', 'insult_score', 'model_version', 'manually_tagged', 'predicted_at')
+    list_filter = ('model_version', 'manually_tagged')
+    list_select_related = ('comment__post',)
+    actions = [rethreshold_selected]
+
 # Register your models here.
 admin.site.register(UserProfile)
 admin.site.register(FacebookPost)
 admin.site.register(FacebookComment)
-admin.site.register(ToxicityParameters)
+admin.site.register(ToxicityParameters, ToxicityParametersAdmin)
 admin.site.register(DeletedComment)
-admin.site.register(CommentStats)
\ No newline at end of file
+admin.site.register(CommentStats)
+admin.site.register(ModerationRule)
+admin.site.register(PendingModeration)
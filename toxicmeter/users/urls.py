@@ -8,6 +8,7 @@ urlpatterns = [
     path('login/', views.user_login, name='login'),
     path('logout/', views.user_logout, name='logout'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('api/stats/', views.dashboard_stats, name='dashboard_stats'),
     path('manage-token/', views.manage_access_token, name='manage_token'),
     path('predict_single/<int:comment_id>/',predict_toxicity_single, name='predict_single'),
     path('predict_bulk/', predict_toxicity_bulk, name='predict_bulk'),
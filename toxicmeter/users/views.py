@@ -3,15 +3,16 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.http import JsonResponse
 
-from facebook.models import FacebookComment, FacebookPost
-from ml_integration.services import store_single_prediction
-from ml_integration.models import ToxicityParameters
+from facebook.models import FacebookPost
+from ml_integration.health import get_model_health
 
 from .models import UserProfile
 from .forms import AssignTokenForm, UserRegisterForm, UserLoginForm, AdminTokenForm
 from django.contrib import messages
-from comments.models import CommentStats, DeletedComment
+from comments.models import CommentStats
+from comments.services import build_chart_data, toxicity_label_counts
 
 # Registration View
 def register(request):
@@ -49,69 +50,28 @@ def user_logout(request):
     messages.info(request, "You have been logged out.")
     return redirect('login')
 
+def get_dashboard_posts(user):
+    """
+    Returns the posts whose comments are counted on the user's dashboard.
+    """
+    if user.userprofile.role == "admin":
+        return FacebookPost.objects.filter(fetched_by=user)  # Admin sees his fetched posts
+    return FacebookPost.objects.filter(fetched_by=user.userprofile.assigned_by)  # Moderators see posts fetched by their admin
+
 # Dashboard View (accessible after login)
 @login_required
 def dashboard(request):
-    # Check if the logged-in user is an admin
-    def checkModelServing():
-        comment = FacebookComment.objects.first()
-        print(comment)
-        if comment:
-            success = store_single_prediction(comment.id)
-        # Update serving status based on model response
-            if success:
-                # Update moderator stats
-                stats, created = CommentStats.objects.get_or_create(moderator=request.user)
-                stats.is_model_serving = True
-                stats.save()
-
-            else:
-                # If the model fails, update the is_model_serving flag to False
-                stats, created = CommentStats.objects.get_or_create(moderator=request.user)
-                stats.is_model_serving = False
-                stats.save()
-                messages.error(request, "ML Model is not responding. Please check the server.")
-                return True
-        else:
-            stats, created = CommentStats.objects.get_or_create(moderator=request.user)
-            stats.is_model_serving = False
-            stats.save()
-            return False
-
     user_profile1 = UserProfile.objects.get(user=request.user)
     # Step 1: Determine which posts the user should see
-    if request.user.userprofile.role == "admin":
-        posts = FacebookPost.objects.filter(fetched_by=request.user)  # Admin sees his fetched posts
-    else:
-        posts = FacebookPost.objects.filter(fetched_by=user_profile1.assigned_by)  # Moderators see posts fetched by their admin
-
-    # Step 2: Get only comments from these posts
-    comments = FacebookComment.objects.filter(post__in=posts)
-    deleted_comments = DeletedComment.objects.filter(post__in=posts)
-    # Step 3: Filter toxicity parameters based on these comments
-    toxic_params = ToxicityParameters.objects.filter(comment__in=comments)
-
-    # Step 4: Count toxicity levels
-    total_comments = comments.count() + deleted_comments.count()  # Include deleted ones
-    toxic_count = toxic_params.filter(toxic=True).count() + deleted_comments.filter(toxic=True).count()
-    non_toxic_count = total_comments - toxic_count
-
-    severe_toxic_count = toxic_params.filter(severe_toxic=True).count() + deleted_comments.filter(severe_toxic=True).count()
-    obscene_count = toxic_params.filter(obscene=True).count() + deleted_comments.filter(obscene=True).count()
-    threat_count = toxic_params.filter(threat=True).count() + deleted_comments.filter(threat=True).count()
-    insult_count = toxic_params.filter(insult=True).count() + deleted_comments.filter(insult=True).count()
-    identity_hate_count = toxic_params.filter(identity_hate=True).count() + deleted_comments.filter(identity_hate=True).count()
-
-    # Step 5: Prepare data for Chart.js
-    chart_data = {
-        "labels": ["Non-Toxic", "Toxic"],
-        "data": [non_toxic_count, toxic_count],
-        "toxicity_labels": ["Toxic", "Severe Toxic", "Obscene", "Threat", "Insult", "Identity Hate"],
-        "toxicity_data": [toxic_count, severe_toxic_count, obscene_count, threat_count, insult_count, identity_hate_count],
-    }
+    posts = get_dashboard_posts(request.user)
+
+    # Step 2: Read comment and toxicity label counts, live and deleted, from the ToxicityRollup table
+    counts = toxicity_label_counts(posts)
+
+    # Step 3: Prepare data for Chart.js
+    chart_data = build_chart_data(counts)
 
     if request.user.userprofile.role == 'admin':  # Admins can see stats for all moderators
-        checkModelServing()
         moderators = User.objects.filter(userprofile__role='moderator')  # Get all moderators
         stats_data = []
         for moderator in moderators:
@@ -130,7 +90,6 @@ def dashboard(request):
         }
     elif request.user.userprofile.role == 'moderator':  # If the user is a moderator, show only their own stats
         try:
-            checkModelServing()
             stats = request.user.moderator_stats  # Fetch the current moderator's stats
             context = {
                 'is_admin': False,
@@ -145,9 +104,24 @@ def dashboard(request):
             }
     context['chart_data'] = chart_data
     context['user_profile'] = user_profile1
+    context['model_health'] = get_model_health()  # Cached; never waits on the ML service
     return render(request, 'users/dashboard.html', context)
 
 
+# Dashboard statistics API
+@login_required
+def dashboard_stats(request):
+    """
+    Returns the dashboard's comment and toxicity label counts, plus the chart payload, as JSON.
+    """
+    counts = toxicity_label_counts(get_dashboard_posts(request.user))
+    return JsonResponse({
+        'counts': counts,
+        'chart_data': build_chart_data(counts),
+        'model_health': get_model_health(),
+    })
+
+
 # Admin: Add or Update Facebook Access Token and Page ID and assign to Moderators
 @login_required
 def manage_access_token(request):